@@ -0,0 +1,415 @@
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from git.repo.base import Repo
+
+from metaborg.releng.build import RelengBuilder
+from metaborg.releng.release import MetaborgRelease
+from metaborg.releng.trace import BuildTrace
+from metaborg.util.git import CheckoutAll, CleanAll, FetchAll, TagAll, UpdateAll, submodule_state
+from metaborg.util.process import run_process
+from metaborg.util.scheduler import ParallelBuilder
+
+# Directories of the submodules that the build steps run Maven or Gradle in, or that releasing sets versions in. Each
+# directory gets a POM file. Submodules beyond these are added as empty libraries to reach the requested count.
+_submoduleDirs = {
+  'releng'          : ['parent', 'build/parent', 'build/java', 'build/libs', 'build/language', 'build/language/parent',
+    'build/language/dynsem', 'build/language/spt', 'build/eclipse', 'build/eclipse/deps'],
+  'jsglr'           : ['make-permissive/jar'],
+  'strategoxt'      : ['strategoxt', 'strategoxt/buildpoms'],
+  'spoofax'         : ['org.metaborg.core', 'org.metaborg.spoofax.core.uber'],
+  'spoofax-sunshine': ['org.metaborg.sunshine2'],
+  'spt'             : ['org.metaborg.spt.cmd'],
+  'spoofax-eclipse' : ['org.metaborg.spoofax.eclipse.updatesite'],
+  'spoofax-intellij': ['org.metaborg.intellij'],
+}
+
+# Artifacts that the stand-in Maven and Gradle executables write, matching the patterns the build steps look for.
+_artifacts = [
+  'spoofax-sunshine/org.metaborg.sunshine2/target/org.metaborg.sunshine2-1.0.0.jar',
+  'spoofax/org.metaborg.spoofax.core.uber/target/org.metaborg.spoofax.core.uber-1.0.0.jar',
+  'releng/build/libs/target/build.libs-1.0.0.jar',
+  'spt/org.metaborg.spt.cmd/target/org.metaborg.spt.cmd-1.0.0.jar',
+  'spoofax-eclipse/org.metaborg.spoofax.eclipse.updatesite/target/site/content.xml',
+  'spoofax-intellij/org.metaborg.intellij/build/distributions/org.metaborg.intellij-1.0.0.zip',
+  'strategoxt/strategoxt/buildpoms/build/target/strategoxt-distrib-1.0.0-bin.tar',
+  'strategoxt/strategoxt/buildpoms/build/target/dist/share/strategoxt/strategoxt/strategoxt.jar',
+]
+
+_developVersion = '1.0.0-SNAPSHOT'
+_releaseVersion = '1.0.0'
+
+_pom = '''<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>org.metaborg</groupId>
+  <artifactId>{artifactId}</artifactId>
+  <version>{version}</version>
+  <packaging>pom</packaging>
+</project>
+'''
+
+# Stand-in for Maven and Gradle: sleeps, touches the artifacts listed in the synthetic repository, and prints a
+# reactor summary such that the build records contain module timings.
+_standIn = '''#!{python}
+import os
+import sys
+import time
+
+start = time.time()
+time.sleep(float(os.environ.get('BENCHMARK_TOOL_SECONDS', '0')))
+repo = os.environ.get('BENCHMARK_REPO')
+if repo:
+  for artifact in {artifacts!r}:
+    path = os.path.join(repo, *artifact.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a'):
+      os.utime(path)
+name = os.path.basename(os.getcwd())
+print('[INFO] Reactor Summary:')
+print('[INFO] {{}} ..................................... SUCCESS [ {{:.3f}} s]'.format(name, time.time() - start))
+print('[INFO] ------------------------------------------------------------------------')
+print('[INFO] BUILD SUCCESS')
+'''
+
+_gitignore = 'target/\ndistributions/\n'
+_superGitignore = '.build-records/\n.build-cache/\n.last-green-build.json\n.deploy-journal*\n.mvnd/\n'
+
+
+class Benchmark(object):
+  """
+  Benchmarks the orchestration of builds, releases, and bulk git operations, against synthetic spoofax-releng
+  repositories in `location`. Maven and Gradle are replaced by stand-in executables that sleep for `toolSeconds` and
+  write fake artifacts, and submodule remotes are local bare repositories, such that no network access is needed and
+  the measurements only depend on the orchestration.
+
+  Build measurements compare the wall time against a lower bound for `jobs` concurrent steps: the longest chain of
+  dependent steps, weighted by the time their processes took, or the total process time divided by `jobs`, whichever
+  is larger. Efficiency is the lower bound divided by the wall time, overhead is the difference.
+  """
+
+  def __init__(self, location, jobs=4, toolSeconds=0.5):
+    self.location = os.path.abspath(location)
+    self.jobs = jobs
+    self.toolSeconds = toolSeconds
+    self.release = True
+    self.verbose = False
+
+  def run(self, submoduleCounts, stepCounts):
+    """
+    Runs all benchmarks, for repositories with each of the given numbers of submodules, and for synthetic build graphs
+    with each of the given numbers of steps. Returns the results as a dictionary that can be serialized to JSON.
+    """
+    binDir = os.path.join(self.location, 'bin')
+    _install_stand_ins(binDir)
+    results = {'jobs': self.jobs, 'toolSeconds': self.toolSeconds, 'repositories': [], 'scheduler': []}
+    env = {
+      'PATH'                  : os.pathsep.join([binDir, os.environ.get('PATH', '')]),
+      'BENCHMARK_TOOL_SECONDS': str(self.toolSeconds),
+      'GIT_AUTHOR_NAME'       : 'Benchmark', 'GIT_AUTHOR_EMAIL': 'benchmark@localhost',
+      'GIT_COMMITTER_NAME'    : 'Benchmark', 'GIT_COMMITTER_EMAIL': 'benchmark@localhost',
+      # Submodules are cloned from local bare repositories, which git does not allow by default.
+      'GIT_CONFIG_COUNT'      : '1', 'GIT_CONFIG_KEY_0': 'protocol.file.allow', 'GIT_CONFIG_VALUE_0': 'always',
+    }
+    with _environment(env):
+      for stepCount in stepCounts:
+        print('Benchmarking scheduling of {} build steps'.format(stepCount))
+        with _quiet(self.verbose):
+          results['scheduler'].append(self.__benchmark_scheduler(stepCount, binDir))
+      for submoduleCount in submoduleCounts:
+        print('Benchmarking repository with {} submodules'.format(submoduleCount))
+        repoDir = os.path.join(self.location, 'repos', str(submoduleCount))
+        with _quiet(self.verbose):
+          repo = create_synthetic_repo(repoDir, submoduleCount)
+          # Releasing keeps its state in the home directory.
+          homeDir = os.path.join(repoDir, 'home')
+          os.makedirs(homeDir)
+          with _environment({'BENCHMARK_REPO': repo.working_tree_dir, 'HOME': homeDir}):
+            result = {'submodules': len(repo.submodules), 'git': self.__benchmark_git(repo)}
+            result['build'] = self.__benchmark_build(repo)
+            if self.release:
+              result['release'] = self.__benchmark_release(repo)
+        results['repositories'].append(result)
+    return results
+
+  def __benchmark_scheduler(self, stepCount, binDir):
+    """
+    Builds a layered graph of `stepCount` steps, where each step runs the stand-in once and depends on all steps of the
+    previous layer, and layers are `jobs` steps wide.
+    """
+    builder = ParallelBuilder(copyOptions=False, jobs=self.jobs)
+    trace = BuildTrace()
+    builder.interceptors = [trace]
+    command = '"{}"'.format(os.path.join(binDir, 'mvn'))
+
+    def run_stand_in(**_):
+      run_process(command)
+
+    layer = []
+    previousLayer = []
+    for index in range(stepCount):
+      if len(layer) == self.jobs:
+        previousLayer, layer = layer, []
+      layer.append(builder.add_build_step('step-{}'.format(index), previousLayer, run_stand_in))
+    builder.add_target('all', list(builder.steps))
+
+    start = time.time()
+    builder.build('all')
+    wall = time.time() - start
+    return dict(steps=stepCount, **_build_metrics(builder.dependency_graph('all'), _trace_process_times(trace), wall,
+      self.jobs))
+
+  def __benchmark_git(self, repo):
+    timings = {}
+    for name, operation in [
+      ('fetch', lambda: FetchAll(repo)),
+      ('update', lambda: UpdateAll(repo)),
+      ('checkout', lambda: CheckoutAll(repo)),
+      ('clean', lambda: CleanAll(repo)),
+      ('tag', lambda: TagAll(repo, 'benchmark-{}'.format(int(time.time() * 1000)), 'Benchmark tag')),
+      ('state', lambda: [submodule_state(submodule) for submodule in repo.submodules]),
+    ]:
+      start = time.time()
+      operation()
+      timings[name] = time.time() - start
+    return timings
+
+  def __benchmark_build(self, repo):
+    builder = self.__create_builder(repo)
+    start = time.time()
+    builder.build('all')
+    wall = time.time() - start
+    record = _latest_record(os.path.join(repo.working_tree_dir, '.build-records'))
+    return _build_metrics(builder.dependency_graph('all'), _record_process_times(record), wall, self.jobs)
+
+  def __benchmark_release(self, repo):
+    release = MetaborgRelease(repo, 'master', _releaseVersion, 'develop', _developVersion, self.__create_builder(repo))
+    release.interactive = False
+    release.dryRun = True
+    release.createEclipseInstances = False
+    release.reset()
+    start = time.time()
+    release.release()
+    return {'wall': time.time() - start}
+
+  def __create_builder(self, repo):
+    builder = RelengBuilder(repo)
+    builder.jobs = self.jobs
+    builder.eclipseQualifier = 'benchmark'
+    # Process times are read from the build record.
+    builder.buildRecords = True
+    return builder
+
+
+def create_synthetic_repo(location, submoduleCount):
+  """
+  Creates a synthetic spoofax-releng repository in given directory, with at least `submoduleCount` submodules, that
+  have a develop and master branch, and bare remote repositories. Returns the clone of the repository.
+  """
+  shutil.rmtree(location, ignore_errors=True)
+  remotesDir = os.path.join(location, 'remotes')
+  sourcesDir = os.path.join(location, 'sources')
+
+  submoduleDirs = dict(_submoduleDirs)
+  for index in range(len(submoduleDirs), submoduleCount):
+    submoduleDirs['lib-{}'.format(index)] = ['']
+
+  superDir = os.path.join(sourcesDir, 'spoofax-releng')
+  _git_init(superDir, 'develop')
+  for name, directories in sorted(submoduleDirs.items()):
+    sourceDir = os.path.join(sourcesDir, name)
+    _git_init(sourceDir, 'develop')
+    for directory in directories:
+      artifactId = '{}.{}'.format(name, directory.replace('/', '.')).strip('.')
+      # Tycho requires the update site POM to have the Eclipse version, releasing sets it.
+      version = '1.0.0.qualifier' if directory.endswith('updatesite') else _developVersion
+      _write_file(os.path.join(sourceDir, directory, 'pom.xml'), _pom.format(artifactId=artifactId, version=version))
+    if name == 'spoofax':
+      _write_file(os.path.join(sourceDir, 'org.metaborg.core', 'src', 'main', 'java', 'org', 'metaborg', 'core',
+        'MetaborgConstants.java'), 'public static final String METABORG_VERSION = "{}";\n'.format(_developVersion))
+    _write_file(os.path.join(sourceDir, '.gitignore'), _gitignore)
+    _commit_all(sourceDir)
+    _git(sourceDir, 'branch', 'master')
+    remoteDir = os.path.join(remotesDir, '{}.git'.format(name))
+    _git(None, 'clone', '-q', '--bare', sourceDir, remoteDir)
+    _git(superDir, 'submodule', 'add', '-q', '-b', 'develop', remoteDir, name)
+
+  _write_file(os.path.join(superDir, '.gitignore'), _superGitignore)
+  _write_file(os.path.join(superDir, 'build.properties'), '')
+  _write_file(os.path.join(superDir, 'jenkins.properties'), '')
+  _commit_all(superDir)
+  _git(superDir, 'checkout', '-q', '-b', 'master')
+  for name in submoduleDirs:
+    _git(superDir, 'config', '-f', '.gitmodules', 'submodule.{}.branch'.format(name), 'master')
+  _commit_all(superDir)
+  _git(superDir, 'checkout', '-q', 'develop')
+  _git(None, 'clone', '-q', '--bare', superDir, os.path.join(remotesDir, 'spoofax-releng.git'))
+
+  repoDir = os.path.join(location, 'spoofax-releng')
+  _git(None, 'clone', '-q', '--recurse-submodules', os.path.join(remotesDir, 'spoofax-releng.git'), repoDir)
+  _git(repoDir, 'branch', '-q', 'master', 'origin/master')
+  for name in submoduleDirs:
+    submoduleDir = os.path.join(repoDir, name)
+    _git(submoduleDir, 'checkout', '-q', '-B', 'develop', 'origin/develop')
+    _git(submoduleDir, 'branch', '-q', 'master', 'origin/master')
+  return Repo(repoDir)
+
+
+def print_results(results):
+  print('Scheduling {} concurrent steps, stand-ins taking {}s:'.format(results['jobs'], results['toolSeconds']))
+  _print_table(['Steps', 'Wall', 'Lower bound', 'Efficiency', 'Overhead', 'Step overhead'],
+    [[str(result['steps'])] + _metric_columns(result) for result in results['scheduler']])
+  if not results['repositories']:
+    return
+  print('Building all targets:')
+  _print_table(['Submodules', 'Wall', 'Lower bound', 'Efficiency', 'Overhead', 'Step overhead'],
+    [[str(result['submodules'])] + _metric_columns(result['build']) for result in results['repositories']])
+  print('Bulk git operations and releasing:')
+  operations = list(results['repositories'][0]['git'])
+  _print_table(['Submodules'] + operations + ['release'],
+    [[str(result['submodules'])] + ['{:.2f}s'.format(result['git'][name]) for name in operations] + [
+      '{:.2f}s'.format(result['release']['wall']) if 'release' in result else '-'] for result in
+      results['repositories']])
+
+
+def write_results(results, location):
+  with open(location, 'w') as file:
+    json.dump(results, file, indent=1)
+  print('Wrote benchmark results to {}'.format(location))
+
+
+# Private helper functions
+
+def _build_metrics(depGraph, processTimes, wall, jobs):
+  """
+  Returns measurements of a build with given dependency graph, process time per step, and wall time.
+  """
+  processTime = sum(processTimes.values())
+  criticalPath = _critical_path(depGraph, processTimes)
+  lowerBound = max(criticalPath, processTime / jobs)
+  return {
+    'wall'        : wall, 'processTime': processTime, 'criticalPath': criticalPath, 'lowerBound': lowerBound,
+    'efficiency'  : lowerBound / wall if wall else None, 'overhead': wall - lowerBound,
+    # Time spent in steps outside of the processes they ran.
+    'stepOverhead': processTimes.get(None, 0),
+  }
+
+
+def _critical_path(depGraph, weights):
+  lengths = {}
+
+  def length(stepId):
+    if stepId not in lengths:
+      lengths[stepId] = weights.get(stepId, 0) + max([length(depId) for depId in depGraph[stepId]] or [0])
+    return lengths[stepId]
+
+  return max([length(stepId) for stepId in depGraph] or [0])
+
+
+def _trace_process_times(trace):
+  times = {None: 0}
+  for stepTrace in trace.traces:
+    processTime = sum(process.duration for process in stepTrace.processes)
+    times[stepTrace.name] = processTime
+    times[None] += stepTrace.duration - processTime
+  return times
+
+
+def _record_process_times(record):
+  times = {None: 0}
+  for step in record['steps']:
+    if step['category'] != 'step':
+      continue
+    processTime = sum(process['duration'] for process in step['processes'])
+    times[step['name']] = processTime
+    times[None] += step['duration'] - processTime
+  return times
+
+
+def _latest_record(directory):
+  name = sorted(name for name in os.listdir(directory) if name.endswith('.json'))[-1]
+  with open(os.path.join(directory, name)) as file:
+    return json.load(file)
+
+
+def _metric_columns(metrics):
+  return ['{:.2f}s'.format(metrics['wall']), '{:.2f}s'.format(metrics['lowerBound']),
+    '{:.0%}'.format(metrics['efficiency']) if metrics['efficiency'] is not None else '-',
+    '{:.2f}s'.format(metrics['overhead']), '{:.2f}s'.format(metrics['stepOverhead'])]
+
+
+def _print_table(header, rows):
+  rows = [header] + rows
+  widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+  for row in rows:
+    print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+def _install_stand_ins(binDir):
+  os.makedirs(binDir, exist_ok=True)
+  script = _standIn.format(python=sys.executable, artifacts=_artifacts)
+  for name in ['mvn', 'gradle', 'gradlew']:
+    location = os.path.join(binDir, name)
+    _write_file(location, script)
+    os.chmod(location, os.stat(location).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _git(cwd, *args):
+  subprocess.check_call(['git'] + list(args), cwd=cwd, stdout=subprocess.DEVNULL)
+
+
+def _git_init(directory, branch):
+  # Sets the initial branch without init's --initial-branch option, which requires git 2.28.
+  _git(None, 'init', '-q', directory)
+  _git(directory, 'symbolic-ref', 'HEAD', 'refs/heads/{}'.format(branch))
+
+
+def _commit_all(directory):
+  _git(directory, 'add', '--all')
+  _git(directory, 'commit', '-q', '-m', 'Synthetic commit')
+
+
+def _write_file(location, content):
+  os.makedirs(os.path.dirname(location), exist_ok=True)
+  with open(location, 'w') as file:
+    file.write(content)
+
+
+@contextmanager
+def _environment(variables):
+  previous = {name: os.environ.get(name) for name in variables}
+  os.environ.update(variables)
+  try:
+    yield
+  finally:
+    for name, value in previous.items():
+      if value is None:
+        del os.environ[name]
+      else:
+        os.environ[name] = value
+
+
+@contextmanager
+def _quiet(verbose):
+  """
+  Redirects standard output, including that of child processes, to the null device unless `verbose` is set.
+  """
+  if verbose:
+    yield
+    return
+  sys.stdout.flush()
+  stdout = os.dup(1)
+  with open(os.devnull, 'w') as devnull:
+    os.dup2(devnull.fileno(), 1)
+  try:
+    yield
+  finally:
+    sys.stdout.flush()
+    os.dup2(stdout, 1)
+    os.close(stdout)
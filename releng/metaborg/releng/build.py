@@ -1,17 +1,66 @@
 import glob
+import inspect
+import json
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-from buildorchestra.build import Builder
-from buildorchestra.result import StepResult, FileArtifact, DirArtifact
+from buildorchestra.result import StepResult, FileArtifact
 from eclipsegen.generate import Os, Arch
-from gradlepy.run import Gradle
-from mavenpy.run import Maven
+from mavenpy.settings import MavenSettingsGenerator
 from pyfiglet import Figlet
 
-from metaborg.releng.deploy import MetaborgFileArtifact, BintrayMetadata, NexusMetadata
+from metaborg.releng.cache import StepCache, artifacts_exist, describe_value
+from metaborg.releng.clean import SmartClean
+from metaborg.releng.deploy import MetaborgDirArtifact, MetaborgFileArtifact, BintrayMetadata, NexusMetadata
 from metaborg.releng.eclipse import MetaborgEclipseGenerator
-from metaborg.util.git import create_qualifier
+from metaborg.releng.gradle import MetaborgGradle
+from metaborg.releng.journal import DeployJournal
+from metaborg.releng.localrepo import LocalRepoCleaner, tycho_cache_inputs
+from metaborg.releng.manifest import ArtifactManifest
+from metaborg.releng.maven import MetaborgMaven, local_repository, maven_config_dir, reactor_modules
+from metaborg.releng.memory import StepMemory, default_memory_budget, format_size, jvm_memory
+from metaborg.releng.reactor import FusedReactor, ReactorFusion, fuse_reactor_steps
+from metaborg.releng.trace import BuildTrace
+from metaborg.util.git import create_qualifier, submodule_for_path, submodule_state
+from metaborg.util.scheduler import ParallelBuilder
+
+# Directories, relative to the repository root, that are built by each step. A step reads the submodules containing
+# these directories, and the submodules containing the modules of the Maven reactors in these directories.
+_stepInputDirs = {
+  'poms'             : ['releng/build/parent'],
+  'jars'             : ['releng/parent', 'jsglr/make-permissive/jar'],
+  'strategoxt'       : ['strategoxt/strategoxt'],
+  'java'             : ['releng/build/java'],
+  'java-uber'        : ['spoofax/org.metaborg.spoofax.core.uber'],
+  'java-libs'        : ['releng/build/libs'],
+  'language-prereqs' : ['releng/build/language/parent'],
+  'languages'        : ['releng/build/language'],
+  'dynsem'           : ['releng/build/language/dynsem'],
+  'spt'              : ['releng/build/language/spt'],
+  'eclipse-prereqs'  : ['releng/build/eclipse/deps'],
+  'eclipse'          : ['releng/build/eclipse'],
+  'eclipse-instances': ['releng/metaborg/releng'],
+  'intellij'         : ['spoofax-intellij'],
+}
+
+# Steps that only build the Maven reactor in their (single) input directory, which may be fused into a single reactor
+# with other such steps. Reactors of steps in _cleanReactorSteps are always cleaned.
+_reactorSteps = {'poms', 'java', 'java-uber', 'java-libs', 'language-prereqs', 'languages', 'dynsem', 'spt',
+  'eclipse-prereqs', 'eclipse'}
+_cleanReactorSteps = {'dynsem'}
+
+# Steps that run Gradle instead of Maven.
+_gradleSteps = {'intellij'}
+
+# Steps that stamp the Eclipse qualifier into the versions of their artifacts: Tycho builds of Eclipse plugins, and
+# StrategoXT when it is built. Other steps pass the qualifier to Maven as well, but their plain Maven modules ignore it,
+# so only the fingerprints of these steps include the qualifier, which changes with every commit to any submodule.
+_qualifierSteps = {'strategoxt', 'eclipse-prereqs', 'eclipse'}
+
+# Maven thread counts of steps that are not built with the global thread count by default. DynSem is built serially
+# because of incompatibilities/bugs with its annotation processor.
+_defaultStepThreads = {'dynsem': 1}
 
 
 class RelengBuilder(object):
@@ -19,12 +68,27 @@ class RelengBuilder(object):
     self.__repo = repo
 
     self.clean = True
+    self.smartClean = False
     self.skipTests = False
     self.offline = False
     self.debug = False
     self.quiet = False
     self.copyArtifactsTo = None
+    self.copyArtifactsHardlink = False
+    self.copyArtifactsDeleteStale = False
     self.generateJavaDoc = False
+    self.jobs = 1
+    # Memory budget in bytes of concurrently executed steps, or None for the default budget, and expected peak memory
+    # usage in bytes of steps by step identifier, which override measurements of previous builds.
+    self.memoryBudget = None
+    self.stepMemory = {}
+    self.incremental = False
+    self.affected = False
+    # Whether to resume the deployment of a previous build that completed but whose deployment did not.
+    self.resumeDeployment = True
+    self.traceFile = None
+    # Whether to write a record of each build into the .build-records directory.
+    self.buildRecords = False
 
     self.buildStratego = False
     self.bootstrapStratego = False
@@ -33,12 +97,20 @@ class RelengBuilder(object):
     self.eclipseQualifier = None
     self.eclipseGenMoreRepos = []
     self.eclipseGenMoreIUs = []
+    self.eclipseGenJobs = 1
+    self.eclipseGenMirror = None
+    self.eclipseGenArchiveJobs = None
 
     self.mavenSettingsFile = None
     self.mavenGlobalSettingsFile = None
     self.mavenCleanLocalRepo = False
+    self.mavenCleanLocalRepoTargeted = False
     self.mavenLocalRepo = None
     self.mavenOpts = None
+    self.mavenDaemon = False
+    self.mavenFuseReactors = False
+    self.mavenThreads = None
+    self.mavenStepThreads = {}
 
     self.mavenDeployer = None
 
@@ -47,15 +119,24 @@ class RelengBuilder(object):
 
     self.nexusDeployer = None
     self.bintrayDeployer = None
+    self.updateSiteDeployer = None
 
-    builder = Builder(copyOptions=True, dependencyAnalysis=buildDeps)
+    builder = ParallelBuilder(copyOptions=True, dependencyAnalysis=buildDeps)
     self.__builder = builder
+    self.__buildDeps = buildDeps
+    self.__stepOptionNames = {}
+    self.__submoduleStates = {}
+
+    def add_step(identifier, depIds, method):
+      builder.add_build_step(identifier, depIds, method)
+      self.__stepOptionNames[identifier] = _option_names(method)
+      return identifier
 
     # Main targets
     mainTargets = []
 
     def add_main_target(identifier, depIds, method):
-      builder.add_build_step(identifier, depIds, method)
+      add_step(identifier, depIds, method)
       mainTargets.append(identifier)
       return identifier
 
@@ -81,13 +162,20 @@ class RelengBuilder(object):
     builder.add_target('all', mainTargets)
 
     # Additional targets
-    builder.add_build_step('java-libs', [java], RelengBuilder.__build_java_libs)
-    builder.add_build_step('eclipse-instances', [eclipse], RelengBuilder.__build_eclipse_instances)
+    add_step('java-libs', [java], RelengBuilder.__build_java_libs)
+    add_step('eclipse-instances', [eclipse], RelengBuilder.__build_eclipse_instances)
 
   @property
   def targets(self):
     return self.__builder.all_steps_ordered
 
+  def dependency_graph(self, *targets):
+    """
+    Returns a dictionary from the identifier of each step to execute for given targets, to the set of identifiers of
+    steps it depends on.
+    """
+    return self.__builder.dependency_graph(*targets)
+
   def build(self, *targets):
     basedir = self.__repo.working_tree_dir
 
@@ -102,13 +190,25 @@ class RelengBuilder(object):
       qualifier = create_qualifier(self.__repo)
     print('Using Eclipse qualifier {}.'.format(qualifier))
 
-    maven = Maven()
+    incremental = self.incremental
+    affected = self.affected
+    if (incremental or affected) and self.mavenCleanLocalRepo:
+      print('Building all steps: cleaning the local Maven repository invalidates all previous builds')
+      incremental = affected = False
+    if (incremental or affected) and self.mavenDeployer and not self.mavenDeployer.snapshot:
+      print('Building all steps: release deployments require a full build')
+      incremental = affected = False
+
+    maven = MetaborgMaven()
     maven.errors = True
     maven.batch = True
     # Disable annoying warnings when using Cygwin on Windows.
     maven.env['CYGWIN'] = 'nodosfilewarning'
     if self.clean:
       maven.targets.append('clean')
+      if self.smartClean:
+        reactorDirs = [os.path.join(basedir, _stepInputDirs[stepId][0]) for stepId in sorted(_reactorSteps)]
+        maven.smartClean = SmartClean(os.path.join(basedir, '.smart-clean.json'), reactorDirs)
     maven.skipTests = self.skipTests
     maven.offline = self.offline
     maven.debug = self.debug
@@ -119,7 +219,6 @@ class RelengBuilder(object):
     maven.globalSettingsFile = self.mavenGlobalSettingsFile
     if self.mavenDeployer:
       # Always deploy locally first. If build succeeds, copy locally deployed artifacts to remote artifact server.
-      self.mavenDeployer.maven_local_deploy_clean()
       maven.properties.update(self.mavenDeployer.maven_local_deploy_properties())
       if not self.mavenDeployer.snapshot:
         maven.profiles.append('release')
@@ -128,8 +227,12 @@ class RelengBuilder(object):
     maven.profiles.append('!add-spoofax-eclipse-repos')
     maven.localRepo = self.mavenLocalRepo
     maven.opts = self.mavenOpts
+    if self.mavenDaemon:
+      # Keep warm Maven JVMs alive for all Maven runs in this build, isolated from daemons of other builds.
+      maven.daemon = True
+      maven.daemonStorage = os.path.join(basedir, '.mvnd')
 
-    gradle = Gradle()
+    gradle = MetaborgGradle()
     gradle.stacktrace = True
     gradle.info = True
     gradle.offline = self.offline
@@ -139,49 +242,332 @@ class RelengBuilder(object):
     gradle.noNative = not self.gradleNative
     gradle.daemon = self.gradleDaemon
 
-    if self.mavenCleanLocalRepo:
-      print(figlet.renderText('Cleaning local maven repository'))
-      # TODO: self.mavenLocalRepo can be None
-      _clean_local_repo(self.mavenLocalRepo)
-
-    print(figlet.renderText('Building'))
-    result = self.__builder.build(
-      *targets,
-      basedir=basedir,
-      skipTests=self.skipTests,
-      eclipseQualifier=qualifier,
-      eclipseGenMoreRepos=self.eclipseGenMoreRepos,
-      eclipseGenMoreIUs=self.eclipseGenMoreIUs,
-      buildStratego=buildStratego,
-      bootstrapStratego=self.bootstrapStratego,
-      testStratego=self.testStratego,
-      maven=maven,
-      mavenDeployer=self.mavenDeployer,
-      gradle=gradle,
-      bintrayDeployer=self.bintrayDeployer
-    )
+    trace = BuildTrace()
+    status = 'failed'
+    try:
+      self.__build(targets, basedir, figlet, trace, incremental, affected, buildStratego, qualifier, maven, gradle)
+      status = 'success'
+    finally:
+      maven.stop_daemons()
+      if self.buildRecords:
+        # Failing to write the record must not hide why the build failed.
+        try:
+          trace.write_record(os.path.join(basedir, '.build-records'), targets=list(targets), qualifier=qualifier,
+            status=status)
+        except Exception as detail:
+          print('Writing the build record failed: {}'.format(detail))
+      if self.traceFile:
+        print(figlet.renderText('Build trace'))
+        trace.print_summary()
+        trace.write_chrome_trace(_make_abs(self.traceFile, basedir))
+
+  def __build(self, targets, basedir, figlet, trace, incremental, affected, buildStratego, qualifier, maven, gradle):
+    options = {
+      'basedir'              : basedir,
+      'skipTests'            : self.skipTests,
+      'eclipseQualifier'     : qualifier,
+      'eclipseGenMoreRepos'  : self.eclipseGenMoreRepos,
+      'eclipseGenMoreIUs'    : self.eclipseGenMoreIUs,
+      'eclipseGenJobs'       : self.eclipseGenJobs,
+      'eclipseGenMirror'     : self.eclipseGenMirror,
+      'eclipseGenArchiveJobs': self.eclipseGenArchiveJobs,
+      'buildStratego'        : buildStratego,
+      'bootstrapStratego'    : self.bootstrapStratego,
+      'testStratego'         : self.testStratego,
+      'maven'                : maven,
+      'mavenDeployer'        : self.mavenDeployer,
+      'gradle'               : gradle,
+    }
 
-    if not result:
-      return
+    journal = None
+    journalKey = None
+    result = None
+    if self.mavenDeployer or self.nexusDeployer or self.bintrayDeployer or self.updateSiteDeployer:
+      journal = DeployJournal(os.path.join(basedir, '.deploy-journal'))
+      journalKey = self.__journal_key(targets, basedir, options)
+      if self.resumeDeployment:
+        result = self.__resumable_result(journal, journalKey)
+
+    stepIds = []
+    if result:
+      print(figlet.renderText('Resuming deployment'))
+      print('The previous build of {} completed but its deployment did not, resuming its deployment'.format(
+        ', '.join(targets)))
+    else:
+      if journal:
+        journal.start()
+      result, stepIds = self.__build_steps(targets, basedir, figlet, trace, incremental, affected, options)
+      if not result:
+        return
+      if journal:
+        journal.record_built(journalKey, result)
+
+    manifest = None
+    if self.nexusDeployer or self.bintrayDeployer or self.updateSiteDeployer or self.copyArtifactsTo:
+      print(figlet.renderText('Computing checksums'))
+      with trace.phase('checksums'):
+        manifest = ArtifactManifest.create(result.artifacts)
 
     if self.mavenDeployer:
       print(figlet.renderText('Deploying Maven artifacts'))
-      self.mavenDeployer.maven_remote_deploy()
-
-    if self.nexusDeployer:
-      print(figlet.renderText('Deploying artifacts to Nexus'))
-      for artifact in result.artifacts:
-        self.nexusDeployer.artifact_remote_deploy(artifact)
-
-    if self.bintrayDeployer:
-      print(figlet.renderText('Deploying artifacts to Bintray'))
-      for artifact in result.artifacts:
-        self.bintrayDeployer.artifact_remote_deploy(artifact)
+      self.mavenDeployer.journal = journal
+      self.mavenDeployer.settingsFiles = [self.mavenSettingsFile or MavenSettingsGenerator.user_settings_location(),
+        self.mavenGlobalSettingsFile]
+      with trace.phase('maven-deploy'):
+        self.mavenDeployer.maven_remote_deploy()
+
+    artifactDeployers = [(phase, deployer) for phase, deployer in
+      [('nexus-deploy', self.nexusDeployer), ('bintray-deploy', self.bintrayDeployer),
+        ('update-site-deploy', self.updateSiteDeployer)] if deployer]
+    if artifactDeployers:
+      print(figlet.renderText('Deploying artifacts'))
+
+      def deploy(phase, deployer):
+        deployer.manifest = manifest
+        deployer.journal = journal
+        with trace.phase(phase):
+          deployer.artifacts_remote_deploy(result.artifacts)
+
+      # Deploy to Nexus, Bintray, and the update site side by side.
+      with ThreadPoolExecutor(max_workers=len(artifactDeployers)) as executor:
+        futures = [executor.submit(deploy, phase, deployer) for phase, deployer in artifactDeployers]
+      for future in futures:
+        future.result()
 
     if self.copyArtifactsTo:
       print(figlet.renderText('Copying other artifacts'))
       copyTo = _make_abs(self.copyArtifactsTo, self.__repo.working_tree_dir)
-      result.copy_to(copyTo)
+      with trace.phase('copy-artifacts'):
+        manifest.copy_to(copyTo, self.copyArtifactsHardlink, self.copyArtifactsDeleteStale)
+        manifest.write(os.path.join(copyTo, 'checksums.json'))
+
+    if journal:
+      journal.record_done()
+    self.__record_green_build(os.path.join(basedir, '.last-green-build.json'), stepIds, basedir)
+
+  def __build_steps(self, targets, basedir, figlet, trace, incremental, affected, options):
+    """
+    Executes the build steps for given targets, and returns the build result and the identifiers of the executed steps,
+    or None and no identifiers if no steps were executed.
+    """
+    localRepoCleaner = None
+    if self.mavenCleanLocalRepo:
+      print(figlet.renderText('Cleaning local maven repository'))
+      localRepo = self.mavenLocalRepo or local_repository(
+        [self.mavenSettingsFile or MavenSettingsGenerator.user_settings_location(), self.mavenGlobalSettingsFile])
+      if self.mavenCleanLocalRepoTargeted:
+        localRepoCleaner = LocalRepoCleaner(localRepo)
+        with trace.phase('clean-local-repo'):
+          localRepoCleaner.clean(options['eclipseQualifier'], tycho_cache_inputs(os.path.join(basedir, 'releng')))
+      else:
+        with trace.phase('clean-local-repo'):
+          _clean_local_repo(localRepo)
+
+    # Incremental builds keep the locally deployed artifacts of previous builds, since skipped steps do not deploy.
+    if self.mavenDeployer and not incremental:
+      self.mavenDeployer.maven_local_deploy_clean()
+
+    print(figlet.renderText('Building'))
+    self.__builder.jobs = self.jobs
+    self.__builder.interceptors = [trace]
+    self.__builder.orderingDeps = {}
+    self.__submoduleStates = {}
+    greenBuildLocation = os.path.join(basedir, '.last-green-build.json')
+    stepIds = list(self.__builder.dependency_graph(*targets))
+    if affected:
+      targets = self.__affected_steps(targets, basedir, _read_green_build(greenBuildLocation))
+      if not targets:
+        print('No build steps are affected by changes since the last successful build')
+        return None, []
+      print('Build steps affected by changes since the last successful build: {}'.format(', '.join(targets)))
+      # Unaffected dependencies were built by the last successful build, do not execute them again.
+      self.__builder.dependencyAnalysis = False
+    if incremental:
+      cacheLocation = os.path.join(basedir, '.build-cache')
+      self.__builder.interceptors.append(StepCache(cacheLocation, self.__builder.deps, self.__step_inputs))
+    self.__builder.interceptors.append(_MavenThreads(self.__step_threads))
+    self.__configure_memory_budget(basedir)
+    if self.mavenFuseReactors:
+      reactors = self.__fused_reactors(targets, basedir)
+      for reactor in reactors:
+        for stepId in reactor.stepIds[1:]:
+          self.__builder.orderingDeps[stepId] = {reactor.leader}
+      self.__builder.interceptors.append(ReactorFusion(reactors))
+    try:
+      result = self.__builder.build(*targets, **options)
+    finally:
+      self.__builder.dependencyAnalysis = self.__buildDeps
+      if localRepoCleaner:
+        with trace.phase('clean-local-repo-wait'):
+          localRepoCleaner.wait()
+
+    if affected:
+      stepIds = targets
+    return result, stepIds
+
+  def __journal_key(self, targets, basedir, options):
+    """
+    Returns the key of the build of given targets with given step options. A deployment is only resumed by a build with
+    the same targets, build options, states of the submodules read by its steps, and deployment targets.
+    """
+    submodules = {}
+    for stepId in self.__builder.dependency_graph(*targets):
+      if stepId in self.__stepOptionNames:
+        submodules.update(self.__submodule_states(stepId, basedir))
+    # Deployers are described by their deployment targets, and runners by their configuration without the state of
+    # the current build.
+    buildOptions = {name: value for name, value in options.items() if name != 'mavenDeployer'}
+    buildOptions['maven'] = _maven_configuration(options['maven'])
+
+    deployTargets = []
+    if self.mavenDeployer:
+      deployTargets.append(self.mavenDeployer.url)
+    if self.nexusDeployer:
+      deployTargets.append([self.nexusDeployer.url, self.nexusDeployer.repository, self.nexusDeployer.version])
+    if self.bintrayDeployer:
+      deployTargets.append([self.bintrayDeployer.organization, self.bintrayDeployer.repository,
+        self.bintrayDeployer.version])
+    if self.updateSiteDeployer:
+      deployTargets.append(self.updateSiteDeployer.url)
+    return json.dumps({'targets': list(targets), 'options': describe_value(buildOptions), 'submodules': submodules,
+      'deploy': deployTargets}, sort_keys=True)
+
+  def __resumable_result(self, journal, journalKey):
+    result = journal.resumable_result(journalKey)
+    if not result:
+      return None
+    if not artifacts_exist(result):
+      print('Not resuming deployment of the previous build: its artifacts do not exist any more')
+      return None
+    if self.mavenDeployer and not os.path.isdir(self.mavenDeployer.maven_local_deploy_path()):
+      print('Not resuming deployment of the previous build: its local deployment repository does not exist any more')
+      return None
+    return result
+
+  def __affected_steps(self, targets, basedir, greenBuild):
+    """
+    Returns the identifiers of steps required for given targets, that read a submodule whose state differs from its
+    state at the last successful build of that step, or that depend on such a step, in build order.
+    """
+    depGraph = self.__builder.dependency_graph(*targets)
+    buildOrder = [stepId for stepId in self.__builder.all_steps_ordered if stepId in depGraph]
+    affected = set()
+
+    for stepId in buildOrder:
+      # Targets are not executed, affected steps are built directly instead.
+      if stepId not in self.__stepOptionNames:
+        continue
+      if depGraph[stepId] & affected:
+        affected.add(stepId)
+        continue
+      lastStates = greenBuild.get(stepId)
+      if lastStates is None:
+        print('Build step {} is affected: it has not been built successfully before'.format(stepId))
+        affected.add(stepId)
+        continue
+      states = self.__submodule_states(stepId, basedir)
+      # Submodules that are no longer read by the step are changes as well.
+      changed = sorted({name for name, state in states.items() if lastStates.get(name) != state} |
+        (set(lastStates) - set(states)))
+      if changed:
+        print('Build step {} is affected by changes to: {}'.format(stepId, ', '.join(changed)))
+        affected.add(stepId)
+    return [stepId for stepId in buildOrder if stepId in affected]
+
+  def __record_green_build(self, location, stepIds, basedir):
+    greenBuild = _read_green_build(location)
+    for stepId in stepIds:
+      if stepId in self.__stepOptionNames:
+        greenBuild[stepId] = self.__submodule_states(stepId, basedir)
+    temporaryLocation = '{}.tmp'.format(location)
+    with open(temporaryLocation, 'w') as file:
+      json.dump(greenBuild, file, indent=2, sort_keys=True)
+    os.replace(temporaryLocation, location)
+
+  def __fused_reactors(self, targets, basedir):
+    depGraph = self.__builder.dependency_graph(*targets)
+    buildOrder = [stepId for stepId in self.__builder.all_steps_ordered if stepId in depGraph]
+    reactorDirs = {stepId: os.path.join(basedir, _stepInputDirs[stepId][0]) for stepId in _reactorSteps}
+
+    fusionKeys = {}
+    for stepId, reactorDir in reactorDirs.items():
+      # Steps can only be fused when they agree on forcing the qualifier and on the number of threads, and load the same
+      # core extensions and configuration from the .mvn directory that Maven finds for their reactor.
+      configDir = maven_config_dir(reactorDir)
+      extensions = _maven_config_files(configDir) if configDir else None
+      threads = self.__step_threads(stepId)
+      # Building with 1 thread is the same as building serially.
+      if str(threads) == '1':
+        threads = None
+      fusionKeys[stepId] = ('eclipseQualifier' in self.__stepOptionNames[stepId], extensions, threads)
+
+    reactors = []
+    for group in fuse_reactor_steps(depGraph, buildOrder, reactorDirs, fusionKeys):
+      print('Fusing Maven reactors of steps {}'.format(', '.join(group)))
+      directories = [reactorDirs[stepId] for stepId in group]
+      cleanDirectories = [reactorDirs[stepId] for stepId in group if stepId in _cleanReactorSteps]
+      location = os.path.join(basedir, '.fused-reactors', group[0])
+      reactors.append(FusedReactor(group, directories, fusionKeys[group[0]][0], cleanDirectories, location))
+    return reactors
+
+  def __configure_memory_budget(self, basedir):
+    self.__builder.memoryBudget = None
+    self.__builder.stepMemory = None
+    if self.jobs <= 1:
+      return
+    budget = self.memoryBudget or default_memory_budget()
+    if not budget:
+      print('Not limiting the memory usage of concurrent build steps: the size of the physical memory is unknown')
+      return
+    # Processes that delegate to a daemon do not include the memory usage of the daemon in their measurements.
+    unmeasured = set()
+    if self.mavenDaemon:
+      unmeasured.update(stepId for stepId in self.__stepOptionNames if stepId not in _gradleSteps)
+    if self.gradleDaemon is not False:
+      unmeasured.update(_gradleSteps)
+    default = jvm_memory(self.mavenOpts) or budget // self.jobs
+    stepMemory = StepMemory(os.path.join(basedir, '.build-records'), self.stepMemory, default, unmeasured)
+    print('Limiting the expected memory usage of concurrent build steps to {}'.format(format_size(budget)))
+    self.__builder.memoryBudget = budget
+    self.__builder.stepMemory = stepMemory.expected
+
+  def __step_threads(self, stepId):
+    if stepId in self.mavenStepThreads:
+      return self.mavenStepThreads[stepId]
+    return _defaultStepThreads.get(stepId, self.mavenThreads)
+
+  def __submodule_states(self, stepId, basedir):
+    """
+    Returns a dictionary from names of submodules read by given step, to their current state.
+    """
+    submoduleNames = set()
+    for inputDir in _stepInputDirs.get(stepId, []):
+      location = os.path.join(basedir, inputDir)
+      for path in [location] + reactor_modules(location):
+        submodule = submodule_for_path(self.__repo, path)
+        if submodule:
+          submoduleNames.add(submodule.name)
+    states = {}
+    for submodule in self.__repo.submodules:
+      if submodule.name in submoduleNames:
+        if submodule.name not in self.__submoduleStates:
+          self.__submoduleStates[submodule.name] = submodule_state(submodule)
+        states[submodule.name] = self.__submoduleStates[submodule.name]
+    return states
+
+  def __step_inputs(self, stepId, options):
+    submodules = self.__submodule_states(stepId, options['basedir'])
+
+    optionNames = self.__stepOptionNames.get(stepId)
+    if optionNames is None:
+      optionNames = options.keys()
+    stepOptions = {name: options[name] for name in optionNames if name in options and name != 'eclipseQualifier'}
+    if stepId in _qualifierSteps and (stepId != 'strategoxt' or options['buildStratego']):
+      stepOptions['eclipseQualifier'] = options['eclipseQualifier']
+    if 'maven' in stepOptions:
+      stepOptions['maven'] = _maven_configuration(stepOptions['maven'])
+
+    return {'submodules': submodules, 'options': stepOptions}
 
   # Builders
 
@@ -212,11 +598,13 @@ class RelengBuilder(object):
       maven.run_in_dir(cwd, 'deploy:deploy-file', **properties)
 
   @staticmethod
-  def __build_or_download_strategoxt(buildStratego, **kwargs):
+  def __build_or_download_strategoxt(basedir, buildStratego, bootstrapStratego, testStratego, skipTests,
+      eclipseQualifier, maven, mavenDeployer, **_):
     if buildStratego:
-      return RelengBuilder.__build_strategoxt(**kwargs)
+      return RelengBuilder.__build_strategoxt(basedir, bootstrapStratego, testStratego, skipTests, eclipseQualifier,
+        maven, mavenDeployer)
     else:
-      return RelengBuilder.__download_strategoxt(**kwargs)
+      return RelengBuilder.__download_strategoxt(basedir, maven)
 
   @staticmethod
   def __download_strategoxt(basedir, maven, **_):
@@ -321,6 +709,7 @@ class RelengBuilder(object):
     # Don't skip expensive steps, always clean, because of incompatibilities/bugs with annotation processor.
     if 'clean' not in maven.targets:
       maven.targets.insert(0, 'clean')
+    maven.smartClean = None
     maven.run_in_dir(cwd, target, forceContextQualifier=eclipseQualifier)
 
   @staticmethod
@@ -347,21 +736,28 @@ class RelengBuilder(object):
     cwd = os.path.join(basedir, 'releng', 'build', 'eclipse')
     maven.run_in_dir(cwd, target, forceContextQualifier=eclipseQualifier)
     return StepResult([
-      DirArtifact(
+      MetaborgDirArtifact(
         'Spoofax Eclipse update site',
         _glob_one(os.path.join(basedir, 'spoofax-eclipse/org.metaborg.spoofax.eclipse.updatesite/target/site')),
-        os.path.join('spoofax', 'eclipse', 'site')
+        os.path.join('spoofax', 'eclipse', 'site'),
+        updateSite=True
       )
     ])
 
   @staticmethod
-  def __build_eclipse_instances(basedir, eclipseGenMoreRepos, eclipseGenMoreIUs, **_):
+  def __build_eclipse_instances(basedir, eclipseGenMoreRepos, eclipseGenMoreIUs, eclipseGenJobs, eclipseGenMirror,
+      eclipseGenArchiveJobs, **_):
     eclipsegenPath = '.eclipsegen'
 
     generator = MetaborgEclipseGenerator(basedir, eclipsegenPath, spoofax=True, spoofaxRepoLocal=True,
-      moreRepos=eclipseGenMoreRepos, moreIUs=eclipseGenMoreIUs)
-    archives = generator.generate_all(oss=Os.values(), archs=Arch.values(), fixIni=True, addJre=True,
-      archiveJreSeparately=True, name='spoofax', archivePrefix='spoofax')
+      moreRepos=eclipseGenMoreRepos, moreIUs=eclipseGenMoreIUs, mirror=eclipseGenMirror)
+    if eclipseGenJobs > 1:
+      archives = generator.generate_all_parallel(eclipseGenJobs, oss=Os.values(), archs=Arch.values(), fixIni=True,
+        addJre=True, archiveJreSeparately=True, name='spoofax', archivePrefix='spoofax',
+        archiveJobs=eclipseGenArchiveJobs)
+    else:
+      archives = generator.generate_all(oss=Os.values(), archs=Arch.values(), fixIni=True, addJre=True,
+        archiveJreSeparately=True, name='spoofax', archivePrefix='spoofax', archiveJobs=eclipseGenArchiveJobs)
 
     artifacts = []
     for archive in archives:
@@ -396,6 +792,71 @@ class RelengBuilder(object):
 
 # Private helper functions
 
+class _MavenThreads(object):
+  """
+  Build step interceptor that sets the number of Maven threads of each step.
+  """
+
+  def __init__(self, threadsOfStep):
+    self.threadsOfStep = threadsOfStep
+
+  def intercept(self, step, options, proceed):
+    threads = self.threadsOfStep(step.identifier)
+    if 'maven' in options and threads:
+      print('Building step {} with {} Maven thread(s)'.format(step, threads))
+      options['maven'].threads = threads
+    return proceed()
+
+
+def _maven_configuration(maven):
+  """
+  Returns the attributes of given Maven runner without the state of the current build: the reactors that were built
+  already, and the smart clean state, which is shared between steps and holds a lock.
+  """
+  return {name: value for name, value in vars(maven).items() if name not in ['prebuilt', 'smartClean']}
+
+
+def _maven_config_files(configDir):
+  """
+  Returns the contents of the core extensions and configuration files that Maven reads from given .mvn directory, with
+  None for files that do not exist.
+  """
+  contents = []
+  for name in ['extensions.xml', 'maven.config', 'jvm.config']:
+    location = os.path.join(configDir, name)
+    if os.path.isfile(location):
+      with open(location) as file:
+        contents.append(file.read())
+    else:
+      contents.append(None)
+  return tuple(contents)
+
+
+def _option_names(method):
+  """
+  Returns the names of the build options used by given step method, or None if it passes on all options.
+  """
+  names = []
+  for parameter in inspect.signature(method).parameters.values():
+    if parameter.kind == inspect.Parameter.VAR_KEYWORD:
+      if parameter.name != '_':
+        return None
+    else:
+      names.append(parameter.name)
+  return names
+
+
+def _read_green_build(location):
+  """
+  Reads the submodule states at the last successful build of each step, as a dictionary from step identifier to a
+  dictionary from submodule name to state.
+  """
+  if not os.path.isfile(location):
+    return {}
+  with open(location) as file:
+    return json.load(file)
+
+
 def _glob_one(path):
   globs = glob.glob(path)
   if not globs:
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import shelve
+import threading
+
+from buildorchestra.result import DirArtifact, FileArtifact
+
+
+class StepCache(object):
+  """
+  Build step interceptor that skips steps whose fingerprint matches the fingerprint stored at the last successful
+  execution of that step, and returns the result stored at that execution instead.
+
+  The fingerprint of a step covers the input state returned by `inputs(stepId, options)` and the fingerprints of the
+  steps it depends on, such that changing the inputs of a step also invalidates all steps that depend on it.
+  """
+
+  def __init__(self, location, deps, inputs):
+    """
+    :param location: Location of the shelve database to store fingerprints and results in.
+    :param deps: Dictionary from step identifier to identifiers of steps it depends on.
+    :param inputs: Function from step identifier and step options to a value describing the inputs of that step. Objects
+                   are described by their attributes.
+    """
+    self.location = location
+    self.deps = deps
+    self.inputs = inputs
+    self.__fingerprints = {}
+    self.__lock = threading.RLock()
+
+  def fingerprint(self, stepId, options):
+    with self.__lock:
+      if stepId in self.__fingerprints:
+        return self.__fingerprints[stepId]
+      state = {
+        'inputs': describe_value(self.inputs(stepId, options)),
+        'deps'  : {depId: self.fingerprint(depId, options) for depId in sorted(self.deps.get(stepId, set()))},
+      }
+      fingerprint = hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+      self.__fingerprints[stepId] = fingerprint
+      return fingerprint
+
+  def intercept(self, step, options, proceed):
+    stepId = step.identifier
+    fingerprint = self.fingerprint(stepId, options)
+
+    with self.__lock, shelve.open(self.location) as db:
+      entry = db.get(stepId)
+      if entry and entry['fingerprint'] == fingerprint and artifacts_exist(entry['result']):
+        print('Skipping build step {}: inputs unchanged since last build'.format(stepId))
+        return entry['result']
+      # Forget the stored result before executing, the outputs of the previous execution will be overwritten.
+      if stepId in db:
+        del db[stepId]
+
+    result = proceed()
+
+    with self.__lock, shelve.open(self.location) as db:
+      db[stepId] = {'fingerprint': fingerprint, 'result': result}
+    return result
+
+
+def describe_value(value):
+  """
+  Returns a JSON serializable description of given value, describing objects by their attributes, and objects without
+  attributes whose representation has their memory address by their type.
+  """
+  if value is None or isinstance(value, (str, int, float, bool)):
+    return value
+  if isinstance(value, dict):
+    return {str(k): describe_value(v) for k, v in value.items()}
+  if isinstance(value, (list, tuple)):
+    return [describe_value(v) for v in value]
+  if isinstance(value, (set, frozenset)):
+    return sorted(describe_value(v) for v in value)
+  if hasattr(value, '__dict__'):
+    return {'type': type(value).__name__, 'attributes': describe_value(vars(value))}
+  description = repr(value)
+  # Objects such as locks and thread-local data are represented with their memory address, which differs between builds.
+  if ' at 0x' in description:
+    return type(value).__name__
+  return description
+
+
+def artifacts_exist(result):
+  """
+  Returns whether the files and directories of the artifacts of given step or build result still exist.
+  """
+  if not result:
+    return True
+  for artifact in result.artifacts:
+    if isinstance(artifact, FileArtifact) and not os.path.isfile(artifact.srcFile):
+      return False
+    if isinstance(artifact, DirArtifact) and not os.path.isdir(artifact.srcDir):
+      return False
+  return True
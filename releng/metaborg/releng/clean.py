@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from metaborg.releng.maven import module_references, reactor_modules
+
+
+class SmartClean(object):
+  """
+  Cleans only the modules of a Maven reactor that changed since they were last built, by deleting their target
+  directory, instead of cleaning all modules. Other modules keep their build output, such that incremental compilation
+  and Tycho's caches can be used.
+
+  A module changed when the files in its directory (excluding build output and nested modules) changed, or when a module
+  it references, in any of the known reactors, changed since the module was last built. The state of each module is
+  stored when its reactor was built successfully.
+
+  The same instance is shared between copies of the Maven runner, since all steps clean and record the same modules.
+  """
+
+  def __init__(self, location, reactorDirs):
+    """
+    :param location: Location of the file to store module states in.
+    :param reactorDirs: Directories of all reactors that are built, used to find the modules that a module references.
+    """
+    self.location = location
+    self.reactorDirs = reactorDirs
+    self.__modules = None
+    self.__artifacts = None
+    self.__lock = threading.RLock()
+
+  def __deepcopy__(self, memo):
+    return self
+
+  def clean_reactor(self, reactorDir):
+    """
+    Deletes the target directory of each changed module in the reactor in given directory.
+    """
+    with self.__lock:
+      stored = self.__read()
+      keys = {}
+      modules = [os.path.normpath(reactorDir)] + reactor_modules(reactorDir)
+      changed = [module for module in modules if stored.get(module) != self.__key(module, keys)]
+    if not changed:
+      print('Smart clean: all {} modules unchanged, not cleaning'.format(len(modules)))
+      return
+    print('Smart clean: cleaning {} of {} modules'.format(len(changed), len(modules)))
+    for module in changed:
+      targetDir = os.path.join(module, 'target')
+      if os.path.isdir(targetDir):
+        print('Deleting {}'.format(targetDir))
+        shutil.rmtree(targetDir, ignore_errors=True)
+
+  def record_reactor(self, reactorDir):
+    """
+    Stores the state of each module in the reactor in given directory, after building it successfully. Files generated
+    into module directories by the build are part of the stored state.
+    """
+    with self.__lock:
+      stored = self.__read()
+      keys = {}
+      for module in [os.path.normpath(reactorDir)] + reactor_modules(reactorDir):
+        stored[module] = self.__key(module, keys)
+      temporaryLocation = '{}.tmp'.format(self.location)
+      with open(temporaryLocation, 'w') as file:
+        json.dump(stored, file, indent=2, sort_keys=True)
+      os.replace(temporaryLocation, self.location)
+
+  def __key(self, module, keys, visiting=frozenset()):
+    if module in keys:
+      return keys[module]
+    modules, artifacts = self.__index()
+    references = modules.get(module, set())
+    referenceKeys = {}
+    for artifactId in sorted(references):
+      referenceDir = artifacts.get(artifactId)
+      # Ignore references to modules that are themselves being keyed, for cyclic references.
+      if referenceDir and referenceDir != module and referenceDir not in visiting:
+        referenceKeys[artifactId] = self.__key(referenceDir, keys, visiting | {module})
+    state = {'files': _files_hash(module, set(modules)), 'references': referenceKeys}
+    key = hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+    keys[module] = key
+    return key
+
+  def __index(self):
+    if self.__modules is None:
+      modules = {}
+      artifacts = {}
+      for reactorDir in self.reactorDirs:
+        for module in [os.path.normpath(reactorDir)] + reactor_modules(reactorDir):
+          if module in modules:
+            continue
+          artifactId, references = module_references(module)
+          modules[module] = references
+          if artifactId:
+            artifacts.setdefault(artifactId, module)
+      self.__modules = modules
+      self.__artifacts = artifacts
+    return self.__modules, self.__artifacts
+
+  def __read(self):
+    if not os.path.isfile(self.location):
+      return {}
+    with open(self.location) as file:
+      return json.load(file)
+
+
+def _files_hash(module, moduleDirs):
+  """
+  Hashes the paths, sizes, and modification times of files in given module directory, skipping build output, hidden
+  directories, and directories of other modules.
+  """
+  digest = hashlib.sha1()
+  for root, dirs, files in os.walk(module):
+    dirs[:] = sorted(d for d in dirs if d != 'target' and not d.startswith('.') and
+    os.path.join(root, d) not in moduleDirs)
+    for name in sorted(files):
+      path = os.path.join(root, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      digest.update('{}:{}:{}\n'.format(os.path.relpath(path, module), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+  return digest.hexdigest()
@@ -1,4 +1,5 @@
 import os
+import shutil
 from os import path
 
 import jprops
@@ -6,12 +7,17 @@ from eclipsegen.generate import Os, Arch
 from git.repo.base import Repo
 from plumbum import cli
 
+from metaborg.releng.benchmark import Benchmark, print_results, write_results
 from metaborg.releng.bootstrap import Bootstrap
 from metaborg.releng.build import RelengBuilder
-from metaborg.releng.deploy import MetaborgBintrayDeployer, MetaborgMavenDeployer, MetaborgNexusDeployer
+from metaborg.releng.deploy import (MetaborgBintrayDeployer, MetaborgMavenDeployer, MetaborgNexusDeployer,
+  MetaborgUpdateSiteDeployer)
 from metaborg.releng.eclipse import MetaborgEclipseGenerator
 from metaborg.releng.icon import GenerateIcons
-from metaborg.releng.maven import MetaborgMavenSettingsGeneratorGenerator
+from metaborg.releng.m2snapshot import repository_key, restore_local_repo, snapshot_local_repo
+from metaborg.releng.maven import MetaborgMavenSettingsGeneratorGenerator, local_repository
+from metaborg.releng.memory import parse_size
+from metaborg.releng.p2mirror import P2Mirror
 from metaborg.releng.release import MetaborgRelease
 from metaborg.releng.versions import SetVersions
 from metaborg.util.git import (CheckoutAll, CleanAll, MergeAll, PushAll,
@@ -358,6 +364,18 @@ class MetaborgBuildShared(cli.Application):
     help='Pass quiet flag to builds',
     group='Build'
   )
+  traceFile = cli.SwitchAttr(
+    names=['--trace'], argtype=str, default=None,
+    help='Record the duration of each build step and the CPU time and peak memory usage of its Maven and Gradle '
+         'processes, print a summary, and write them to given file in Chrome trace event format',
+    group='Build'
+  )
+  buildRecords = cli.Flag(
+    names=['--build-records'], default=False,
+    help='Write a record of each build, with the timings, resource usage, and parsed Maven output of its steps, into '
+         '.build-records in the repository, and report Maven modules that became slower since the previous record',
+    group='Build'
+  )
 
   strategoBootstrap = cli.Flag(
     names=['-b', '--stratego-bootstrap'], default=False,
@@ -380,6 +398,22 @@ class MetaborgBuildShared(cli.Application):
     help='Additional units to install in Eclipse instance generation',
     group='Eclipse generation'
   )
+  eclipseGenJobs = cli.SwitchAttr(
+    names=['--eclipse-gen-jobs'], argtype=int, default=1,
+    help='Number of Eclipse instances to generate concurrently. When more than 1, bundles are downloaded once into a '
+         'bundle pool that all instances are installed from',
+    group='Eclipse generation'
+  )
+  eclipseGenMirror = cli.SwitchAttr(
+    names=['--eclipse-gen-mirror'], argtype=str, default=None,
+    help='Local p2 mirror, created with b p2-mirror sync, to install units from instead of the repositories it mirrors',
+    group='Eclipse generation'
+  )
+  eclipseGenArchiveJobs = cli.SwitchAttr(
+    names=['--eclipse-gen-archive-jobs'], argtype=int, default=None,
+    help='Number of threads to compress each Eclipse instance archive with. Defaults to the number of CPUs',
+    group='Eclipse generation'
+  )
 
   jvmStack = cli.SwitchAttr(
     names=['--jvm-stack'], default="16M",
@@ -417,7 +451,33 @@ class MetaborgBuildShared(cli.Application):
     help='Clean MetaBorg artifacts from the local Maven repository before building',
     group='Maven'
   )
+  mavenCleanTargeted = cli.Flag(
+    names=['--maven-clean-targeted'], default=False,
+    requires=['--maven-clean-local-repo'],
+    help='Only clean SNAPSHOT versions and versions with a qualifier older than the current build from the local Maven '
+         'repository, deleting them in the background while building, and keep the Tycho cache if the p2 '
+         'repositories it caches did not change',
+    group='Maven'
+  )
 
+  mavenDaemon = cli.Flag(
+    names=['--maven-daemon'], default=False,
+    help='Run Maven builds in warm Maven daemon (mvnd) JVMs that are kept alive during the entire build, instead of '
+         'starting a new JVM for each Maven run. Requires mvnd on the path',
+    group='Maven'
+  )
+  mavenThreads = cli.SwitchAttr(
+    names=['--maven-threads'], argtype=str, default=None,
+    help="Number of threads for Maven's parallel reactor builder, for example 4, or 1C for 1 thread per CPU core. "
+         "Can be set per build step with build.step.<step>.threads properties, for example build.step.java.threads",
+    group='Maven'
+  )
+  mavenFuseReactors = cli.Flag(
+    names=['--maven-fuse-reactors'], default=False,
+    help='Build the Maven reactors of build steps that can be built together, such as java and java-uber, in a single '
+         'generated Maven reactor',
+    group='Maven'
+  )
   mavenDeploy = cli.Flag(
     names=['-d', '--maven-deploy'], default=False,
     help='Deploy Maven artifacts',
@@ -507,6 +567,33 @@ class MetaborgBuildShared(cli.Application):
     group='Bintray'
   )
 
+  updateSiteDeploy = cli.Flag(
+    names=['--update-site-deploy'], default=False,
+    help='Enable publishing the Spoofax Eclipse update site incrementally, uploading only bundles and features that '
+         'changed since the previously published update site',
+    group='Update site'
+  )
+  updateSiteUrl = cli.SwitchAttr(
+    names=['--update-site-url'], argtype=str, default=None,
+    requires=['--update-site-deploy'],
+    help='URL to publish the update site to with HTTP PUT requests, or local directory to publish the update site to',
+    group='Update site'
+  )
+  updateSiteUsername = cli.SwitchAttr(
+    names=['--update-site-username'], argtype=str, default=None,
+    requires=['--update-site-deploy'],
+    help='Username to use for publishing the update site. When not set, defaults to the UPDATE_SITE_USERNAME '
+         'environment variable',
+    group='Update site'
+  )
+  updateSitePassword = cli.SwitchAttr(
+    names=['--update-site-password'], argtype=str, default=None,
+    requires=['--update-site-deploy'],
+    help='Password to use for publishing the update site. When not set, defaults to the UPDATE_SITE_PASSWORD '
+         'environment variable',
+    group='Update site'
+  )
+
   def make_builder(self, repo, buildProps, buildDeps=True, versionOverride=None):
     builder = RelengBuilder(repo, buildDeps=buildDeps)
 
@@ -519,18 +606,32 @@ class MetaborgBuildShared(cli.Application):
     builder.offline = self.offline
     builder.debug = self.debug
     builder.quiet = self.quiet
+    builder.traceFile = buildProps.get('build.trace', self.traceFile)
+    builder.buildRecords = buildProps.get_bool('build.records', self.buildRecords)
 
     builder.bootstrapStratego = buildProps.get_bool('stratego.bootstrap', self.strategoBootstrap)
     builder.testStratego = buildProps.get_bool('stratego.test', not self.strategoNoTests)
 
     builder.eclipseGenMoreRepos = buildProps.get_list('eclipse.generate.repos', self.eclipseGenMoreRepos)
     builder.eclipseGenMoreIUs = buildProps.get_list('eclipse.generate.ius', self.eclipseGenMoreIUs)
+    builder.eclipseGenJobs = int(buildProps.get('eclipse.generate.jobs', self.eclipseGenJobs))
+    builder.eclipseGenMirror = buildProps.get('eclipse.generate.mirror', self.eclipseGenMirror)
+    archiveJobs = buildProps.get('eclipse.generate.archive.jobs', self.eclipseGenArchiveJobs)
+    builder.eclipseGenArchiveJobs = int(archiveJobs) if archiveJobs else None
 
     builder.mavenSettingsFile = self.mavenSettings
     builder.mavenGlobalSettingsFile = self.mavenGlobalSettings
     builder.mavenLocalRepo = self.mavenLocalRepo
     builder.mavenCleanLocalRepo = self.mavenCleanRepo
+    builder.mavenCleanLocalRepoTargeted = buildProps.get_bool('maven.clean.targeted', self.mavenCleanTargeted)
     builder.mavenOpts = '-Xss{} -Xms{} -Xmx{}'.format(self.jvmStack, self.jvmMinHeap, self.jvmMaxHeap)
+    builder.mavenDaemon = buildProps.get_bool('maven.daemon', self.mavenDaemon)
+    builder.mavenFuseReactors = buildProps.get_bool('maven.fuse', self.mavenFuseReactors)
+    builder.mavenThreads = buildProps.get('maven.threads', self.mavenThreads)
+    for step in builder.targets:
+      stepThreads = buildProps.get('build.step.{}.threads'.format(step))
+      if stepThreads:
+        builder.mavenStepThreads[step] = stepThreads
 
     if buildProps.get_bool('maven.deploy.enable', self.mavenDeploy):
       mavenDeployIdentifier = buildProps.get('maven.deploy.id', self.mavenDeployIdentifier)
@@ -584,6 +685,16 @@ class MetaborgBuildShared(cli.Application):
     else:
       builder.bintrayDeployer = None
 
+    if buildProps.get_bool('updatesite.deploy.enable', self.updateSiteDeploy):
+      updateSiteUrl = buildProps.get('updatesite.deploy.url', self.updateSiteUrl)
+      if not updateSiteUrl:
+        raise Exception('Cannot publish update site: URL was not set')
+      updateSiteUsername = self.updateSiteUsername or os.environ.get('UPDATE_SITE_USERNAME')
+      updateSitePassword = self.updateSitePassword or os.environ.get('UPDATE_SITE_PASSWORD')
+      builder.updateSiteDeployer = MetaborgUpdateSiteDeployer(updateSiteUrl, updateSiteUsername, updateSitePassword)
+    else:
+      builder.updateSiteDeployer = None
+
     return builder
 
 
@@ -604,6 +715,11 @@ class MetaborgRelengBuild(MetaborgBuildShared):
     help='Skip clean up before building',
     group='Build'
   )
+  smartClean = cli.Flag(
+    names=['--smart-clean'], default=False, excludes=['--no-clean'],
+    help='Only clean Maven modules whose files, or referenced modules, changed since they were last built',
+    group='Build'
+  )
   noTests = cli.Flag(
     names=['-y', '--no-tests'], default=False,
     help='Skip tests after building',
@@ -619,6 +735,47 @@ class MetaborgRelengBuild(MetaborgBuildShared):
     help='Copy produced artifacts to given location',
     group='Build'
   )
+  copyArtifactsHardlink = cli.Flag(
+    names=['--copy-artifacts-hardlink'], default=False, requires=['--copy-artifacts'],
+    help='Hardlink copied artifacts when possible. Hardlinked artifacts change when the build changes them in place',
+    group='Build'
+  )
+  copyArtifactsDeleteStale = cli.Flag(
+    names=['--copy-artifacts-delete-stale'], default=False, requires=['--copy-artifacts'],
+    help='Delete files in copied directory artifacts that are not part of the artifact anymore',
+    group='Build'
+  )
+  jobs = cli.SwitchAttr(
+    names=['-J', '--jobs'], argtype=int, default=1,
+    help='Number of independent build steps to execute concurrently',
+    group='Build'
+  )
+  memoryBudget = cli.SwitchAttr(
+    names=['--memory-budget'], argtype=str, default=None,
+    help='Memory that build steps executed concurrently may use together, for example 14G. Steps that are expected to '
+         'exceed the budget are queued. Defaults to 90% of the physical memory. The expected memory usage of a step '
+         'is measured in the records of previous builds (see --build-records), or can be set with '
+         'build.step.<step>.memory properties, for example build.step.eclipse.memory=6G',
+    group='Build'
+  )
+  incremental = cli.Flag(
+    names=['-I', '--incremental'], default=False,
+    help='Skip build steps whose inputs (submodule revisions and changes, build options, and the Eclipse qualifier for '
+         'steps that build Eclipse plugins) are unchanged since their last successful build',
+    group='Build'
+  )
+  affected = cli.Flag(
+    names=['--affected'], default=False,
+    help='Only execute build steps that read submodules which changed since the last successful build, and build steps '
+         'that depend on those',
+    group='Build'
+  )
+  noResume = cli.Flag(
+    names=['--no-resume'], default=False,
+    help='Always build before deploying, instead of resuming the deployment of a previous build whose deployment did '
+         'not complete, and that had the same targets, build options, and submodule states',
+    group='Build'
+  )
 
   strategoBuild = cli.Flag(
     names=['-s', '--stratego-build'], default=False,
@@ -650,9 +807,23 @@ class MetaborgRelengBuild(MetaborgBuildShared):
       return 1
 
     builder.clean = not self.noClean
+    builder.smartClean = buildProps.get_bool('build.clean.smart', self.smartClean)
     builder.skipTests = self.noTests
     builder.generateJavaDoc = self.generateJavaDoc
+    builder.resumeDeployment = buildProps.get_bool('build.deploy.resume', not self.noResume)
     builder.copyArtifactsTo = buildProps.get('build.artifact.copy', self.copyArtifacts)
+    builder.copyArtifactsHardlink = buildProps.get_bool('build.artifact.copy.hardlink', self.copyArtifactsHardlink)
+    builder.copyArtifactsDeleteStale = buildProps.get_bool('build.artifact.copy.delete', self.copyArtifactsDeleteStale)
+    builder.jobs = int(buildProps.get('build.jobs', self.jobs))
+    memoryBudget = buildProps.get('build.memory.budget', self.memoryBudget)
+    if memoryBudget:
+      builder.memoryBudget = parse_size(memoryBudget)
+    for step in builder.targets:
+      stepMemory = buildProps.get('build.step.{}.memory'.format(step))
+      if stepMemory:
+        builder.stepMemory[step] = parse_size(stepMemory)
+    builder.incremental = buildProps.get_bool('build.incremental', self.incremental)
+    builder.affected = buildProps.get_bool('build.affected', self.affected)
 
     builder.buildStratego = buildProps.get_bool('stratego.build', self.strategoBuild)
 
@@ -803,6 +974,10 @@ class MetaborgRelengGenEclipse(cli.Application):
     names=['-i', '--install'], argtype=str, list=True,
     help='Additional units to install'
   )
+  mirror = cli.SwitchAttr(
+    names=['--p2-mirror'], argtype=str, default=None,
+    help='Local p2 mirror, created with b p2-mirror sync, to install units from instead of the repositories it mirrors'
+  )
 
   os = cli.SwitchAttr(
     names=['-o', '--os'], argtype=str, default=None,
@@ -829,6 +1004,16 @@ class MetaborgRelengGenEclipse(cli.Application):
     requires=['--archive', '--add-jre'],
     help='Archive the non-JRE and JRE embedded versions separately, resulting in 2 archives'
   )
+  archiveJobs = cli.SwitchAttr(
+    names=['--archive-jobs'], argtype=int, default=None,
+    requires=['--archive'],
+    help='Number of threads to compress archives with. Defaults to the number of CPUs'
+  )
+  regenerate = cli.Flag(
+    names=['--regenerate'], default=False,
+    help='Replace an Eclipse instance that was generated at destination with a new instance, instead of updating it in '
+         'place by uninstalling and installing only the units that changed'
+  )
 
   def main(self):
     print('Generating plain Eclipse instance')
@@ -850,9 +1035,10 @@ class MetaborgRelengGenEclipse(cli.Application):
       eclipseArch = Arch.get_current()
 
     generator = MetaborgEclipseGenerator(self.parent.repo.working_tree_dir, self.destination,
-      spoofax=False, moreRepos=self.moreRepos, moreIUs=self.moreIUs)
+      spoofax=False, moreRepos=self.moreRepos, moreIUs=self.moreIUs, mirror=self.mirror)
     generator.generate(os=eclipseOs, arch=eclipseArch, fixIni=True, addJre=self.addJre,
-      archiveJreSeparately=self.archiveJreSeparately, archive=self.archive)
+      archiveJreSeparately=self.archiveJreSeparately, archive=self.archive, archiveJobs=self.archiveJobs,
+      update=not self.regenerate)
 
     return 0
 
@@ -891,6 +1077,10 @@ class MetaborgRelengGenSpoofax(cli.Application):
     names=['-i', '--install'], argtype=str, list=True,
     help='Additional units to install'
   )
+  mirror = cli.SwitchAttr(
+    names=['--p2-mirror'], argtype=str, default=None,
+    help='Local p2 mirror, created with b p2-mirror sync, to install units from instead of the repositories it mirrors'
+  )
 
   os = cli.SwitchAttr(
     names=['-o', '--os'], argtype=str, default=None,
@@ -917,6 +1107,16 @@ class MetaborgRelengGenSpoofax(cli.Application):
     requires=['--archive', '--add-jre'],
     help='Archive the non-JRE and JRE embedded versions separately, resulting in 2 archives'
   )
+  archiveJobs = cli.SwitchAttr(
+    names=['--archive-jobs'], argtype=int, default=None,
+    requires=['--archive'],
+    help='Number of threads to compress archives with. Defaults to the number of CPUs'
+  )
+  regenerate = cli.Flag(
+    names=['--regenerate'], default=False,
+    help='Replace an Eclipse instance that was generated at destination with a new instance, instead of updating it in '
+         'place by uninstalling and installing only the units that changed'
+  )
 
   def main(self):
     print('Generating Eclipse instance for Spoofax users')
@@ -939,9 +1139,10 @@ class MetaborgRelengGenSpoofax(cli.Application):
 
     generator = MetaborgEclipseGenerator(self.parent.repo.working_tree_dir, self.destination,
       spoofax=True, spoofaxRepo=self.spoofaxRepo, spoofaxRepoLocal=self.localSpoofax, langDev=not self.noMeta,
-      lwbDev=not self.noMeta, moreRepos=self.moreRepos, moreIUs=self.moreIUs)
+      lwbDev=not self.noMeta, moreRepos=self.moreRepos, moreIUs=self.moreIUs, mirror=self.mirror)
     generator.generate(os=eclipseOs, arch=eclipseArch, fixIni=True, addJre=self.addJre,
-      archiveJreSeparately=self.archiveJreSeparately, archive=self.archive, archivePrefix='spoofax')
+      archiveJreSeparately=self.archiveJreSeparately, archive=self.archive, archivePrefix='spoofax',
+      archiveJobs=self.archiveJobs, update=not self.regenerate)
 
     return 0
 
@@ -997,6 +1198,170 @@ class MetaborgRelengGenMvnSettings(cli.Application):
     return 0
 
 
+@MetaborgReleng.subcommand("m2")
+class MetaborgRelengM2(cli.Application):
+  """
+  Snapshots and restores the third-party artifacts in the local Maven repository
+  """
+
+  def main(self):
+    if not self.nested_command:
+      print('Error: no command given')
+      self.help()
+      return 1
+    return 0
+
+
+class MetaborgRelengM2Shared(cli.Application):
+  directory = cli.SwitchAttr(names=['-d', '--directory'], argtype=str, mandatory=False, default='.m2-snapshots',
+    help='Directory to store snapshots in, relative to the repository')
+  mavenSettings = cli.SwitchAttr(names=['-i', '--maven-settings'], argtype=str, default=None,
+    help='Maven settings file location, to read the local Maven repository location from')
+  mavenLocalRepo = cli.SwitchAttr(names=['-l', '--maven-local-repo'], argtype=str, default=None,
+    help='Local Maven repository location. Defaults to the location in the Maven settings file, or ~/.m2/repository')
+
+  def snapshot_args(self):
+    repo = self.parent.parent.repo
+    localRepo = self.mavenLocalRepo or local_repository(
+      [self.mavenSettings or MetaborgMavenSettingsGeneratorGenerator.user_settings_location()])
+    snapshotDir = path.join(repo.working_tree_dir, self.directory)
+    return localRepo, snapshotDir, repository_key(repo.working_tree_dir)
+
+
+@MetaborgRelengM2.subcommand("snapshot")
+class MetaborgRelengM2Snapshot(MetaborgRelengM2Shared):
+  """
+  Packs the third-party artifacts in the local Maven repository into a snapshot, keyed by a hash of the POM files of
+  the build
+  """
+
+  def main(self):
+    snapshot_local_repo(*self.snapshot_args())
+    return 0
+
+
+@MetaborgRelengM2.subcommand("restore")
+class MetaborgRelengM2Restore(MetaborgRelengM2Shared):
+  """
+  Restores the snapshot for the current POM files of the build into the local Maven repository. Fails if there is no
+  such snapshot
+  """
+
+  jobs = cli.SwitchAttr(names=['-j', '--jobs'], argtype=int, default=None,
+    help='Number of threads to extract the snapshot with. Defaults to the number of CPUs')
+
+  def main(self):
+    localRepo, snapshotDir, key = self.snapshot_args()
+    if not restore_local_repo(localRepo, snapshotDir, key, self.jobs):
+      return 1
+    return 0
+
+
+@MetaborgReleng.subcommand("p2-mirror")
+class MetaborgRelengP2Mirror(cli.Application):
+  """
+  Mirrors the units that Eclipse instances are generated from into a local p2 mirror, and verifies the mirror
+  """
+
+  def main(self):
+    if not self.nested_command:
+      print('Error: no command given')
+      self.help()
+      return 1
+    return 0
+
+
+class MetaborgRelengP2MirrorShared(cli.Application):
+  directory = cli.SwitchAttr(names=['-d', '--directory'], argtype=str, mandatory=False, default='.p2-mirror',
+    help='Directory of the mirror, relative to the repository')
+  jobs = cli.SwitchAttr(names=['-j', '--jobs'], argtype=int, default=8,
+    help='Number of concurrent downloads or checksum verifications')
+
+  def p2_mirror(self, keepVersions=2):
+    repo = self.parent.parent.repo
+    return P2Mirror(path.join(repo.working_tree_dir, self.directory), keepVersions=keepVersions, jobs=self.jobs)
+
+
+@MetaborgRelengP2Mirror.subcommand("sync")
+class MetaborgRelengP2MirrorSync(MetaborgRelengP2MirrorShared):
+  """
+  Mirrors the units of all variants of Eclipse instances, and the units they depend on, downloading only artifacts that
+  are not mirrored yet
+  """
+
+  moreRepos = cli.SwitchAttr(
+    names=['-r', '--repo'], argtype=str, list=True,
+    help='Additional repositories to mirror units from'
+  )
+  moreIUs = cli.SwitchAttr(
+    names=['-i', '--install'], argtype=str, list=True,
+    help='Additional units to mirror'
+  )
+  keepVersions = cli.SwitchAttr(names=['--keep-versions'], argtype=int, default=2,
+    help='Number of most recently used versions to keep of each unit, evicting older versions that are no longer '
+         'required')
+
+  def main(self):
+    mirror = self.p2_mirror(self.keepVersions)
+    mirror.sync(MetaborgEclipseGenerator.mirror_sources(self.moreRepos),
+      MetaborgEclipseGenerator.mirror_ius(self.moreIUs))
+    return 0
+
+
+@MetaborgRelengP2Mirror.subcommand("verify")
+class MetaborgRelengP2MirrorVerify(MetaborgRelengP2MirrorShared):
+  """
+  Verifies the checksums of all mirrored artifacts, deleting corrupted artifacts such that the next sync downloads them
+  again
+  """
+
+  def main(self):
+    corrupted = self.p2_mirror().verify()
+    if corrupted:
+      print('Deleted {} corrupted artifacts, run b p2-mirror sync to download them again'.format(corrupted))
+      return 1
+    print('All artifacts are valid')
+    return 0
+
+
+@MetaborgReleng.subcommand("benchmark")
+class MetaborgRelengBenchmark(cli.Application):
+  """
+  Benchmarks building, releasing, and bulk git operations against synthetic repositories, with stand-ins for Maven and
+  Gradle, reporting orchestration overhead, scheduling efficiency, and scaling
+  """
+
+  directory = cli.SwitchAttr(names=['-d', '--directory'], argtype=str, mandatory=False, default='.benchmark',
+    help='Directory to create synthetic repositories in, relative to the repository. Deleted afterwards unless --keep')
+  submodules = cli.SwitchAttr(names=['-s', '--submodules'], argtype=int, list=True,
+    help='Number of submodules of a synthetic repository to benchmark. Defaults to 8, 16, and 32')
+  steps = cli.SwitchAttr(names=['-t', '--steps'], argtype=int, list=True,
+    help='Number of steps of a synthetic build graph to benchmark scheduling of. Defaults to 16, 64, and 256')
+  jobs = cli.SwitchAttr(names=['-j', '--jobs'], argtype=int, default=4, help='Number of steps to execute concurrently')
+  toolSeconds = cli.SwitchAttr(names=['--tool-seconds'], argtype=float, default=0.5,
+    help='Number of seconds that each run of the Maven and Gradle stand-ins takes')
+  skipRelease = cli.Flag(names=['--skip-release'], default=False, help='Skip benchmarking releases')
+  keep = cli.Flag(names=['--keep'], default=False, help='Keep the synthetic repositories afterwards')
+  output = cli.SwitchAttr(names=['-o', '--output'], argtype=str, default=None,
+    help='File to write the results to as JSON')
+  verbose = cli.Flag(names=['-v', '--verbose'], default=False, help='Show the output of benchmarked operations')
+
+  def main(self):
+    location = path.join(self.parent.repo.working_tree_dir, self.directory)
+    benchmark = Benchmark(location, jobs=self.jobs, toolSeconds=self.toolSeconds)
+    benchmark.release = not self.skipRelease
+    benchmark.verbose = self.verbose
+    try:
+      results = benchmark.run(self.submodules or [8, 16, 32], self.steps or [16, 64, 256])
+    finally:
+      if not self.keep:
+        shutil.rmtree(location, ignore_errors=True)
+    print_results(results)
+    if self.output:
+      write_results(results, self.output)
+    return 0
+
+
 @MetaborgReleng.subcommand("gen-icons")
 class MetaborgRelengGenIcons(cli.Application):
   """
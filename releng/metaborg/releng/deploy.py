@@ -1,11 +1,19 @@
+import hashlib
 import os
 import shutil
+import threading
+import time
+import xml.etree.ElementTree as ET
 
 from bintraypy.bintray import Bintray
-from buildorchestra.result import FileArtifact
-from mavenpy.run import Maven
+from buildorchestra.result import DirArtifact, FileArtifact
 from nexuspy.nexus import Nexus
 
+from metaborg.releng.maven import MetaborgMaven, merge_metadata, server_credentials
+from metaborg.util.checksum import algorithms, file_checksums
+from metaborg.util.p2 import artifact_checksums, compress_repository_xml, metadataFiles, p2Index, read_repository_xml
+from metaborg.util.upload import HttpUploader, MultipartFile, create_uploader
+
 
 class MetaborgFileArtifact(FileArtifact):
   def __init__(self, name, srcFile, dstFile, nexusMetadata=None, bintrayMetadata=None):
@@ -14,12 +22,28 @@ class MetaborgFileArtifact(FileArtifact):
     self.bintrayMetadata = bintrayMetadata
 
 
+class MetaborgDirArtifact(DirArtifact):
+  def __init__(self, name, srcDir, dstDir, updateSite=False):
+    super().__init__(name, srcDir, dstDir)
+    self.updateSite = updateSite
+
+
 class MetaborgMavenDeployer(object):
   def __init__(self, rootPath, identifier, url, snapshot=True):
     self.rootPath = rootPath
     self.identifier = identifier
     self.url = url
     self.snapshot = snapshot
+    # Maven settings files to read the username and password of the deployment server from, in order of precedence.
+    self.settingsFiles = []
+    # Number of concurrent uploads to the deployment server.
+    self.uploadJobs = 8
+    # DeployJournal to record uploaded files in and skip files that were already uploaded, or None.
+    self.journal = None
+
+  def __deepcopy__(self, memo):
+    # Build steps get copies of the build options, but share the deployer and its journal.
+    return self
 
   def maven_local_deploy_path(self):
     return os.path.join(self.rootPath, '.local-deploy-repository')
@@ -44,8 +68,50 @@ class MetaborgMavenDeployer(object):
     shutil.rmtree(path, ignore_errors=True)
 
   def maven_remote_deploy(self):
+    """
+    Uploads the files in the local deployment repository to the deployment server. Over HTTP, files are uploaded
+    concurrently, and maven-metadata.xml files are merged with the metadata on the server and uploaded last, such that
+    the server never refers to versions whose files are not uploaded yet. Files that the journal records as uploaded, or
+    whose SHA-1 matches the SHA-1 on the server, are not uploaded again. Other URLs are deployed with Maven's wagon.
+    """
+    if not self.url.startswith(('http://', 'https://')):
+      self.__wagon_remote_deploy()
+      return
+    try:
+      credentials = server_credentials(self.settingsFiles, self.identifier)
+    except RuntimeError as detail:
+      print('{}, deploying with Maven instead'.format(detail))
+      self.__wagon_remote_deploy()
+      return
+
+    uploader = HttpUploader(self.url, *(credentials or ()), jobs=self.uploadJobs)
+    files, metadataFiles = _repository_files(self.maven_local_deploy_path())
+    journalTarget = 'maven {}'.format(self.url)
+    journaled = set()
+    if self.journal:
+      journaled = {remotePath for localPath, remotePath in files if
+        self.journal.uploaded(journalTarget, remotePath, _local_sha1(localPath))}
+      files = [paths for paths in files if paths[1] not in journaled]
+    unchanged = _unchanged_files(uploader, files)
+    files = [paths for paths in files if paths[1] not in unchanged]
+    print('Uploading {} files and {} metadata files to {}, skipping {} files that are already on the server'.format(
+      len(files), len(metadataFiles), self.url, len(journaled) + len(unchanged)))
+
+    def upload(paths):
+      localPath, remotePath = paths
+      uploader.upload_file(localPath, remotePath)
+      if self.journal:
+        self.journal.record_uploaded(journalTarget, remotePath, _local_sha1(localPath))
+
+    uploader.for_each(upload, files)
+    # Upload metadata of versions before metadata of artifacts that refer to those versions.
+    for depth in sorted({path.count('/') for _, path in metadataFiles}, reverse=True):
+      uploader.for_each(lambda paths: _upload_metadata(uploader, *paths),
+        [paths for paths in metadataFiles if paths[1].count('/') == depth])
+
+  def __wagon_remote_deploy(self):
     path = self.maven_local_deploy_path()
-    maven = Maven()
+    maven = MetaborgMaven()
     maven.properties = {
       'wagon.sourceId': '"local-deploy"',
       'wagon.source'  : '"file:{}"'.format(path),
@@ -56,6 +122,87 @@ class MetaborgMavenDeployer(object):
     maven.run(self.rootPath, None)
 
 
+def _repository_files(repositoryDir):
+  """
+  Returns (local path, path relative to repository) tuples of files to upload from given Maven repository, separated
+  into artifact files and maven-metadata.xml files. Checksums of metadata files are not returned, since they are
+  computed when uploading merged metadata.
+  """
+  files = []
+  metadataFiles = []
+  for root, _, fileNames in os.walk(repositoryDir):
+    for fileName in sorted(fileNames):
+      path = os.path.join(root, fileName)
+      remotePath = os.path.relpath(path, repositoryDir).replace(os.sep, '/')
+      if fileName == 'maven-metadata.xml':
+        metadataFiles.append((path, remotePath))
+      elif fileName.startswith('maven-metadata.xml.'):
+        continue
+      elif fileName.endswith('.lastUpdated') or fileName in ('_remote.repositories', 'resolver-status.properties'):
+        continue
+      else:
+        files.append((path, remotePath))
+  return files, metadataFiles
+
+
+def _unchanged_files(uploader, files):
+  """
+  Probes the SHA-1 checksum on the server of each file that is not a checksum file concurrently, and returns the remote
+  paths of files, and their checksum files, whose SHA-1 on the server equals their local SHA-1.
+  """
+  checksumExtensions = tuple('.{}'.format(algorithm) for algorithm in algorithms + ['sha512'])
+  checksumFiles = {}
+  for _, remotePath in files:
+    if remotePath.endswith(checksumExtensions):
+      base = remotePath.rsplit('.', 1)[0]
+      checksumFiles.setdefault(base, []).append(remotePath)
+
+  def probe(paths):
+    localPath, remotePath = paths
+    if remotePath.endswith(checksumExtensions):
+      return []
+    remoteSha1 = uploader.download('{}.sha1'.format(remotePath))
+    if not remoteSha1 or _read_checksum(remoteSha1) != _local_sha1(localPath):
+      return []
+    return [remotePath] + checksumFiles.get(remotePath, [])
+
+  unchanged = set()
+  for paths in uploader.for_each(probe, files):
+    unchanged.update(paths)
+  return unchanged
+
+
+def _local_sha1(localPath):
+  checksumPath = '{}.sha1'.format(localPath)
+  if os.path.isfile(checksumPath):
+    with open(checksumPath, 'rb') as file:
+      return _read_checksum(file.read())
+  return file_checksums(localPath).sha1
+
+
+def _read_checksum(content):
+  # Checksum files may contain the name of the file after the checksum.
+  parts = content.decode('utf-8', errors='replace').split()
+  return parts[0].lower() if parts else None
+
+
+def _upload_metadata(uploader, localPath, remotePath):
+  with open(localPath, 'rb') as file:
+    content = file.read()
+  remoteContent = uploader.download(remotePath)
+  if remoteContent:
+    content = merge_metadata(content, remoteContent)
+    # Merging the remote metadata with itself normalizes its formatting like merged metadata.
+    if content == merge_metadata(remoteContent, remoteContent):
+      print('Skipping upload of {}: already on the server'.format(uploader.remote_url(remotePath)))
+      return
+  uploader.upload_bytes(content, remotePath)
+  for algorithm in algorithms:
+    if os.path.isfile('{}.{}'.format(localPath, algorithm)):
+      checksum = hashlib.new(algorithm, content).hexdigest()
+      uploader.upload_bytes(checksum.encode('utf-8'), '{}.{}'.format(remotePath, algorithm))
+
+
 class NexusMetadata(object):
   def __init__(self, groupId, artifactId, packaging=None, classifier=None):
     self.groupId = groupId
@@ -65,18 +212,69 @@ class NexusMetadata(object):
 
 
 class MetaborgNexusDeployer(object):
-  def __init__(self, url, repository, version, username, password):
+  def __init__(self, url, repository, version, username, password, jobs=4):
+    self.url = url
     self.repository = repository
     self.version = version
-    self.nexus = Nexus(url, username, password)
+    self.uploader = HttpUploader(url, username, password, jobs=jobs)
+    # Artifact manifest to get checksums of artifacts from, or None to hash them.
+    self.manifest = None
+    # DeployJournal to record uploaded artifacts in and skip artifacts that were already uploaded, or None.
+    self.journal = None
+
+  def artifacts_remote_deploy(self, artifacts):
+    _deploy_concurrently('Nexus', self.uploader, self.artifact_remote_deploy, artifacts)
 
   def artifact_remote_deploy(self, artifact):
-    if not hasattr(artifact, 'nexusMetadata'):
+    metadata = getattr(artifact, 'nexusMetadata', None)
+    if not metadata:
       print("Skipping deployment of artifact '{}' to Nexus: no Nexus metadata was set".format(artifact.name))
-      return
+      return False
+    localSha1 = self.__checksums(artifact).sha1
+    journalTarget = 'nexus {} {}'.format(self.url, self.repository)
+    parameters = self.__parameters(artifact)
+    journalPath = ':'.join(parameters.get(name, '') for name in ['g', 'a', 'v', 'p', 'c'])
+    if self.journal and self.journal.uploaded(journalTarget, journalPath, localSha1):
+      print("Skipping deployment of artifact '{}' to Nexus: already deployed by an earlier attempt".format(
+        artifact.name))
+      return False
+    if self.__remote_sha1(artifact) == localSha1:
+      print("Skipping deployment of artifact '{}' to Nexus: already deployed with SHA-1 {}".format(artifact.name,
+        localSha1))
+      return False
+    parameters['hasPom'] = 'false'
+    parameters['e'] = parameters['p']
+    body = MultipartFile(parameters, 'file', artifact.srcFile)
+    print("Uploading artifact '{}' to Nexus".format(artifact.name))
+    self.uploader.request('POST', Nexus.upload_path, body=body.open, expectedStatus=(201,),
+      headers={'Content-Type': body.contentType})
+    if self.journal:
+      self.journal.record_uploaded(journalTarget, journalPath, localSha1)
+    return True
+
+  def __remote_sha1(self, artifact):
+    """
+    Returns the SHA-1 of the artifact deployed to Nexus with the coordinates of given artifact, or None if no such
+    artifact is deployed.
+    """
+    response = self.uploader.request('GET', 'service/local/artifact/maven/resolve', params=self.__parameters(artifact),
+      expectedStatus=(200, 404))
+    if response.status_code != 200:
+      return None
+    return ET.fromstring(response.content).findtext('data/sha1')
+
+  def __checksums(self, artifact):
+    if self.manifest:
+      return self.manifest.checksums(artifact.srcFile)
+    return file_checksums(artifact.srcFile)
+
+  def __parameters(self, artifact):
     metadata = artifact.nexusMetadata
-    self.nexus.upload_artifact(artifact.srcFile, self.repository, metadata.groupId, metadata.artifactId, self.version,
-      metadata.packaging, metadata.classifier)
+    parameters = {'r': self.repository, 'g': metadata.groupId, 'a': metadata.artifactId, 'v': self.version}
+    parameters['p'] = metadata.packaging or os.path.splitext(artifact.srcFile)[1][1:]
+    if metadata.classifier:
+      parameters['c'] = metadata.classifier
+    return parameters
 
 
 class BintrayMetadata(object):
@@ -85,15 +283,155 @@ class BintrayMetadata(object):
 
 
 class MetaborgBintrayDeployer(object):
-  def __init__(self, organization, repository, version, username, key):
+  def __init__(self, organization, repository, version, username, key, jobs=4, url=Bintray.default_url):
     self.organization = organization
     self.repository = repository
     self.version = version
-    self.bintray = Bintray(username, key)
+    self.uploader = HttpUploader(url, username, key, jobs=jobs)
+    # Artifact manifest with checksums that Bintray verifies uploads with, or None to not verify uploads.
+    self.manifest = None
+    # DeployJournal to record uploaded artifacts in and skip artifacts that were already uploaded, or None.
+    self.journal = None
+    self.__remoteFiles = {}
+    self.__lock = threading.Lock()
+
+  def artifacts_remote_deploy(self, artifacts):
+    _deploy_concurrently('Bintray', self.uploader, self.artifact_remote_deploy, artifacts)
 
   def artifact_remote_deploy(self, artifact):
-    if not hasattr(artifact, 'bintrayMetadata'):
+    metadata = getattr(artifact, 'bintrayMetadata', None)
+    if not metadata:
       print("Skipping deployment of artifact '{}' to Bintray: no Bintray metadata was set".format(artifact.name))
-      return
-    self.bintray.upload_generic(self.organization, self.repository, artifact.bintrayMetadata.package, self.version,
-      artifact.srcFile, artifact.dstFile, publish=True)
+      return False
+    filePath = (artifact.dstFile or os.path.basename(artifact.srcFile)).replace(os.sep, '/')
+    path = 'content/{}/{}/{}/{}/{}'.format(self.organization, self.repository, metadata.package, self.version, filePath)
+    sha256 = (self.manifest.checksums(artifact.srcFile) if self.manifest else file_checksums(artifact.srcFile)).sha256
+    journalTarget = 'bintray {}/{}'.format(self.organization, self.repository)
+    if self.journal and self.journal.uploaded(journalTarget, path, sha256):
+      print("Skipping deployment of artifact '{}' to Bintray: already deployed by an earlier attempt".format(
+        artifact.name))
+      return False
+    if self.__remote_files(metadata.package).get(filePath) == sha256:
+      print("Skipping deployment of artifact '{}' to Bintray: already deployed with SHA-256 {}".format(artifact.name,
+        sha256))
+      return False
+    # Bintray rejects uploads whose content does not match the checksum in this header.
+    headers = {'X-Checksum-Sha2': sha256}
+    print("Uploading artifact '{}' to Bintray at {}".format(artifact.name, path))
+    self.uploader.request('PUT', path, body=lambda: open(artifact.srcFile, 'rb'), expectedStatus=(201,),
+      params={'publish': '1'}, headers=headers)
+    if self.journal:
+      self.journal.record_uploaded(journalTarget, path, sha256)
+    return True
+
+  def __remote_files(self, package):
+    """
+    Returns a dictionary from path to SHA-256 of the files in the version of given package on Bintray, requesting the
+    files of each package once.
+    """
+    with self.__lock:
+      if package not in self.__remoteFiles:
+        path = 'packages/{}/{}/{}/versions/{}/files'.format(self.organization, self.repository, package, self.version)
+        response = self.uploader.request('GET', path, expectedStatus=(200, 404))
+        files = response.json() if response.status_code == 200 else []
+        self.__remoteFiles[package] = {file['path']: file.get('sha256') for file in files}
+      return self.__remoteFiles[package]
+
+
+class MetaborgUpdateSiteDeployer(object):
+  def __init__(self, url, username=None, password=None, jobs=8):
+    self.url = url
+    self.uploader = create_uploader(url, username, password, jobs=jobs)
+    # Artifact manifest to get checksums of update site files from, or None to hash them.
+    self.manifest = None
+    # DeployJournal to record uploaded files in and skip files that were already uploaded, or None.
+    self.journal = None
+
+  def artifacts_remote_deploy(self, artifacts):
+    for artifact in artifacts:
+      if getattr(artifact, 'updateSite', False):
+        self.site_remote_deploy(artifact.srcDir)
+
+  def site_remote_deploy(self, siteDir):
+    """
+    Publishes the p2 update site in given directory incrementally. Bundles, features, and other files whose checksum
+    matches the checksum in the artifact metadata of the previously published site are not uploaded again. Other files
+    are uploaded concurrently. Metadata is uploaded last, artifact metadata before content metadata, such that clients
+    never see units whose artifacts are not uploaded yet. Metadata is also uploaded as XZ compressed variants, which p2
+    clients prefer through the uploaded p2.index.
+    """
+    remoteArtifacts = read_repository_xml('artifacts', self.uploader.download)
+    remoteChecksums = artifact_checksums(remoteArtifacts) if remoteArtifacts else {}
+    files = []
+    for root, _, fileNames in os.walk(siteDir):
+      for fileName in sorted(fileNames):
+        path = os.path.join(root, fileName)
+        remotePath = os.path.relpath(path, siteDir).replace(os.sep, '/')
+        if remotePath not in metadataFiles:
+          files.append((path, remotePath))
+
+    journalTarget = 'update-site {}'.format(self.url)
+    start = time.time()
+
+    def upload(paths):
+      localPath, remotePath = paths
+      checksums = self.manifest.checksums(localPath) if self.manifest else file_checksums(localPath)
+      if self.journal and self.journal.uploaded(journalTarget, remotePath, checksums.sha256):
+        return None
+      remoteChecksum = remoteChecksums.get(remotePath)
+      if remoteChecksum and getattr(checksums, remoteChecksum[0]) == remoteChecksum[1]:
+        return None
+      self.uploader.upload_file(localPath, remotePath)
+      if self.journal:
+        self.journal.record_uploaded(journalTarget, remotePath, checksums.sha256)
+      return checksums.size
+
+    sizes = [size for size in self.uploader.for_each(upload, files) if size is not None]
+    duration = time.time() - start
+    print('Uploaded {} of {} update site files to {}, skipping unchanged files: {:.1f} MB in {:.1f}s ({:.1f} MB/s)'
+      .format(len(sizes), len(files), self.url, sum(sizes) / _megabyte, duration,
+      sum(sizes) / _megabyte / max(duration, 0.001)))
+
+    for name in ['artifacts', 'content']:
+      content = read_repository_xml(name, lambda path: _read_file(os.path.join(siteDir, path)))
+      if content is None:
+        raise Exception('Cannot deploy update site {}: it has no {} metadata'.format(siteDir, name))
+      # Keep uncompressed metadata for clients that do not support XZ compressed metadata.
+      for fileName in ['{}.jar'.format(name), '{}.xml'.format(name)]:
+        if os.path.isfile(os.path.join(siteDir, fileName)):
+          self.uploader.upload_file(os.path.join(siteDir, fileName), fileName)
+      self.uploader.upload_bytes(compress_repository_xml(content), '{}.xml.xz'.format(name))
+    self.uploader.upload_bytes(p2Index.encode('utf-8'), 'p2.index')
+
+
+def _read_file(path):
+  if not os.path.isfile(path):
+    return None
+  with open(path, 'rb') as file:
+    return file.read()
+
+
+def _deploy_concurrently(target, uploader, deploy, artifacts):
+  """
+  Deploys artifacts concurrently with given deploy function, and reports the throughput of each deployed artifact and
+  the total deployment time.
+  """
+  start = time.time()
+
+  def deploy_artifact(artifact):
+    artifactStart = time.time()
+    if not deploy(artifact):
+      return 0
+    size = os.path.getsize(artifact.srcFile)
+    duration = time.time() - artifactStart
+    print("Deployed artifact '{}' to {}: {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(artifact.name, target,
+      size / _megabyte, duration, size / _megabyte / max(duration, 0.001)))
+    return size
+
+  sizes = uploader.for_each(deploy_artifact, artifacts)
+  duration = time.time() - start
+  print('Deployed {} artifacts to {}: {:.1f} MB in {:.1f}s ({:.1f} MB/s)'.format(len([s for s in sizes if s]), target,
+    sum(sizes) / _megabyte, duration, sum(sizes) / _megabyte / max(duration, 0.001)))
+
+
+_megabyte = 1024 * 1024
@@ -1,4 +1,41 @@
-from eclipsegen.generate import EclipseGenerator, EclipseMultiGenerator
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from shutil import rmtree, which
+
+from eclipsegen import director_path
+from eclipsegen.generate import Arch, EclipseGenerator, EclipseOutput, Os
+
+from metaborg.releng.p2mirror import P2Mirror
+from metaborg.util.archive import CompressionCache, open_archive, tree_entries
+from metaborg.util.p2 import parse_version
+from metaborg.util.process import run_process
+
+# Combinations of operating system and architecture that Eclipse does not support.
+_invalidCombinations = {('macosx', 'x86')}
+# Extensions of archives, by format as named by shutil.make_archive.
+_archiveExtensions = {'gztar': '.tar.gz', 'zip': '.zip'}
+# File in generated Eclipse instances that records what was generated, such that the instance can be updated in place.
+_instanceRecordName = '.metaborg-eclipse.json'
+# Installable unit and version, as listed by the director: id/version for installed roots, id=version for repositories.
+_listedUnit = re.compile(r'^([\w.\-]+)[/=](\S+)$')
+
+# Empty metadata repository, which makes a bundle pool, which only is an artifact repository, usable as a repository
+# that the p2 director installs units from.
+_emptyMetadataRepository = '''<?xml version='1.0' encoding='UTF-8'?>
+<?metadataRepository version='1.1.0'?>
+<repository name='Bundle pool'
+  type='org.eclipse.equinox.internal.p2.metadata.repository.LocalMetadataRepository' version='1'>
+  <properties size='1'>
+    <property name='p2.timestamp' value='0'/>
+  </properties>
+  <units size='0'/>
+</repository>
+'''
 
 
 class MetaborgEclipseGenerator(object):
@@ -80,7 +117,7 @@ class MetaborgEclipseGenerator(object):
   ]
 
   def __init__(self, workingDir, destination, spoofax=True, spoofaxRepo=None, spoofaxRepoLocal=False,
-      langDev=True, lwbDev=True, moreRepos=None, moreIUs=None):
+      langDev=True, lwbDev=True, moreRepos=None, moreIUs=None, mirror=None):
     if spoofaxRepoLocal:
       spoofaxRepo = MetaborgEclipseGenerator.spoofaxRepoLocal
     elif not spoofaxRepo:
@@ -123,17 +160,347 @@ class MetaborgEclipseGenerator(object):
     repos.extend(moreRepos)
     ius.extend(moreIUs)
 
+    if mirror:
+      # Install from the local p2 mirror instead of the repositories it mirrors.
+      p2Mirror = P2Mirror(mirror)
+      repos, groups = p2Mirror.repositories(repos)
+      # Units can only be checked when all repositories are mirrored, other repositories may provide them.
+      p2Mirror.check(groups, ius if len(repos) == len(groups) else [])
+
     self.workingDir = workingDir
     self.destination = destination
     self.repos = repos
     self.ius = ius
 
-  def generate(self, **kwargs):
-    generator = EclipseGenerator(self.workingDir, self.destination, repositories=self.repos, installUnits=self.ius,
-      **kwargs)
-    return generator.generate()
+  @staticmethod
+  def mirror_sources(moreRepos=None):
+    """
+    Returns the repositories that Eclipse instances are generated from, grouped for a p2 mirror: Spoofax repositories
+    are mirrored separately, such that a locally built Spoofax can be installed instead.
+    """
+    eclipseRepos = MetaborgEclipseGenerator.eclipseRepos + MetaborgEclipseGenerator.m2ePluginRepos + (moreRepos or [])
+    return {'eclipse': eclipseRepos, 'spoofax': [MetaborgEclipseGenerator.spoofaxRepo]}
+
+  @staticmethod
+  def mirror_ius(moreIUs=None):
+    """
+    Returns the installable units of all variants of Eclipse instances, to mirror into a p2 mirror.
+    """
+    ius = []
+    ius.extend(MetaborgEclipseGenerator.eclipseIUs)
+    ius.extend(MetaborgEclipseGenerator.eclipseLangDevIUs)
+    ius.extend(MetaborgEclipseGenerator.eclipseLwbDevIUs)
+    ius.extend(MetaborgEclipseGenerator.m2ePluginIUs)
+    ius.extend(MetaborgEclipseGenerator.m2ePluginLangDevIUs)
+    ius.extend(MetaborgEclipseGenerator.m2ePluginLwbDevIUs)
+    ius.extend(MetaborgEclipseGenerator.spoofaxIUs)
+    ius.extend(MetaborgEclipseGenerator.spoofaxLangDevIUs)
+    ius.extend(moreIUs or [])
+    return ius
+
+  def generate(self, archiveJobs=None, update=False, **kwargs):
+    """
+    Generates an Eclipse instance at the destination, or archives it there.
+
+    When `update` is set and the destination has an instance that was generated for the same operating system and
+    architecture, the instance is updated in place: units that are no longer requested are uninstalled, and only the
+    requested units that are not installed, or whose version differs from the version in the repositories, are
+    installed. An instance that was generated at the destination is only replaced when `update` is not set. Raises a
+    RuntimeError instead of replacing the instance when it cannot be updated.
+    """
+    generator = ArchivingEclipseGenerator(self.workingDir, self.destination, repositories=self.repos,
+      installUnits=self.ius, archiveJobs=archiveJobs, **kwargs)
+    if generator.archive:
+      return generator.generate()
+
+    location = generator.finalDestination
+    record = _read_instance_record(location)
+    if record and update:
+      if record['os'] != generator.os.name or record['arch'] != generator.arch.name:
+        raise RuntimeError('Eclipse instance at {} was generated for {}, {}, not for {}, {}; pass --regenerate to '
+          'replace it'.format(location, record['os'], record['arch'], generator.os.name, generator.arch.name))
+      self.__update(generator, record)
+      return [EclipseOutput(generator.os, generator.arch, generator.addJre, location)]
+    if record:
+      print('Deleting Eclipse instance at {}'.format(location))
+      rmtree(location)
+    outputs = generator.generate()
+    _write_instance_record(generator, self.ius)
+    return outputs
+
+  def generate_all(self, oss=None, archs=None, **kwargs):
+    """
+    Generates and archives Eclipse instances for all combinations of given operating systems and architectures, one
+    at a time. Files that are in the instances of multiple combinations, such as most plugins, are compressed once.
+    """
+    outputs = []
+    workingDir = os.path.abspath(self.workingDir)
+    with tempfile.TemporaryDirectory(prefix='.eclipsegen-compressed-', dir=workingDir) as cacheDir:
+      for eclipseOs, eclipseArch in _combinations(oss, archs):
+        print('Generating Eclipse for combination {}, {}'.format(eclipseOs.name, eclipseArch.name))
+        generator = ArchivingEclipseGenerator(self.workingDir, self.destination, os=eclipseOs, arch=eclipseArch,
+          repositories=self.repos, installUnits=self.ius, archive=True, compressionCache=CompressionCache(cacheDir),
+          **kwargs)
+        try:
+          outputs.extend(generator.generate())
+        finally:
+          generator.tempdir.cleanup()
+    return outputs
+
+  def generate_all_parallel(self, jobs, oss=None, archs=None, bundlePool=None, **kwargs):
+    """
+    Generates Eclipse instances for all combinations of given operating systems and architectures, like `generate_all`,
+    but generates up to `jobs` instances concurrently, each in a separate process.
+
+    Bundles are downloaded once into a bundle pool at `bundlePool`, or a temporary directory if not set, which all
+    instances are installed from. p2 verifies the checksums of bundles when it downloads them into the pool, and stores
+    each version of a bundle once. The pool is filled one combination at a time, since p2 does not support concurrent
+    modifications of a bundle pool, installing into throwaway instances that store their bundles in the pool. Like in
+    `generate_all`, files that are in the instances of multiple combinations are compressed once.
+    """
+    combinations = _combinations(oss, archs)
+    workingDir = os.path.abspath(self.workingDir)
+    temporaryPool = None
+    if not bundlePool:
+      temporaryPool = tempfile.TemporaryDirectory(prefix='.eclipsegen-pool-', dir=workingDir)
+      bundlePool = temporaryPool.name
+    cacheDir = tempfile.TemporaryDirectory(prefix='.eclipsegen-compressed-', dir=workingDir)
+    kwargs['compressionCache'] = CompressionCache(cacheDir.name)
+    try:
+      for eclipseOs, eclipseArch in combinations:
+        print('Downloading bundles for combination {}, {} into bundle pool {}'.format(eclipseOs.name, eclipseArch.name,
+          bundlePool))
+        self.__fill_bundle_pool(workingDir, bundlePool, eclipseOs, eclipseArch)
+      with open(os.path.join(bundlePool, 'content.xml'), 'w') as file:
+        file.write(_emptyMetadataRepository)
+
+      # Generators of different processes store JREs in the same directory, which they fail to create concurrently.
+      os.makedirs(os.path.join(os.path.expanduser('~'), '.eclipsegen'), exist_ok=True)
+      repositories = [bundlePool] + self.repos
+      outputs = []
+      with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_generate_instance, workingDir, self.destination, eclipseOs.name, eclipseArch.name,
+          repositories, self.ius, kwargs) for eclipseOs, eclipseArch in combinations]
+        for future in futures:
+          for osName, archName, withJre, location in future.result():
+            outputs.append(EclipseOutput(Os[osName].value, Arch[archName].value, withJre, location))
+      return outputs
+    finally:
+      cacheDir.cleanup()
+      if temporaryPool:
+        temporaryPool.cleanup()
+
+  def __update(self, generator, record):
+    """
+    Updates the Eclipse instance of given generator in place.
+    """
+    location = generator.finalDestination
+    workingDir = generator.workingDir
+    print('Updating Eclipse instance at {}'.format(location))
+    installed = _DirectorListing()
+    result = _run_director(['-destination {}'.format(location), '-profile SDKProfile', '-listInstalledRoots'],
+      workingDir, installed)
+    if result.returncode != 0:
+      raise RuntimeError('Listing installed units of Eclipse instance at {} failed; pass --regenerate to replace the '
+        'instance'.format(location))
+    available = _DirectorListing()
+    args = ['-r {}'.format(_to_uri(repo, workingDir)) for repo in self.repos]
+    args.append('-list {}'.format(','.join(self.ius)))
+    if _run_director(args, workingDir, available).returncode != 0:
+      raise RuntimeError('Listing installable units of repositories failed')
+
+    uninstall = [iu for iu in record['ius'] if iu not in self.ius and iu in installed.units]
+    install = [iu for iu in self.ius if iu not in installed.units or
+      (iu in available.units and available.units[iu] != installed.units[iu])]
+    if uninstall or install:
+      args = ['-r {}'.format(_to_uri(repo, workingDir)) for repo in self.repos]
+      # Units that are installed in another version are replaced by uninstalling and installing them in one operation.
+      args.extend('-u {}'.format(iu) for iu in uninstall + [iu for iu in install if iu in installed.units])
+      args.extend('-i {}'.format('{}/{}'.format(iu, available.units[iu]) if iu in available.units else iu) for iu in
+        install)
+      args.append('-destination {}'.format(location))
+      args.append('-profile SDKProfile')
+      args.append('-p2.os {}'.format(generator.os.eclipseOs))
+      args.append('-p2.ws {}'.format(generator.os.eclipseWs))
+      args.append('-p2.arch {}'.format(generator.arch.eclipseArch))
+      args.append('-roaming')
+      if _run_director(args, workingDir).returncode != 0:
+        raise RuntimeError('Updating Eclipse instance failed')
+    else:
+      print('Eclipse instance at {} is up to date'.format(location))
+
+    if generator.fixIni:
+      generator.fix_ini()
+    if generator.addJre and not os.path.isdir(os.path.join(location, 'jre')):
+      generator.add_jre()
+    _write_instance_record(generator, self.ius)
+
+  def __fill_bundle_pool(self, workingDir, bundlePool, eclipseOs, eclipseArch):
+    with tempfile.TemporaryDirectory(prefix='.eclipsegen-scratch-', dir=workingDir) as scratchDir:
+      args = ['-r {}'.format(_to_uri(repo, workingDir)) for repo in self.repos]
+      args.extend('-i {}'.format(iu) for iu in self.ius)
+      args.append('-destination {}'.format(scratchDir))
+      args.append('-bundlepool {}'.format(bundlePool))
+      args.append('-profile SDKProfile')
+      args.append('-profileProperties "org.eclipse.update.install.features=true"')
+      args.append('-p2.os {}'.format(eclipseOs.eclipseOs))
+      args.append('-p2.ws {}'.format(eclipseOs.eclipseWs))
+      args.append('-p2.arch {}'.format(eclipseArch.eclipseArch))
+      args.append('-roaming')
+      if _run_director(args, workingDir).returncode != 0:
+        raise RuntimeError('Filling bundle pool failed')
+
+
+class ArchivingEclipseGenerator(EclipseGenerator):
+  """
+  Eclipse instance generator that compresses archives on at most `archiveJobs` threads, defaulting to the number of
+  CPUs, instead of a single thread. When an instance is archived with and without JRE separately, the archive with JRE
+  extends the archive without JRE, appending only the JRE and the changed eclipse.ini, instead of compressing the
+  whole instance again. The compressed data of large files is taken from `compressionCache` when set.
+  """
+
+  def __init__(self, *args, archiveJobs=None, compressionCache=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.archiveJobs = archiveJobs
+    self.compressionCache = compressionCache
+
+  def generate(self):
+    if not self.archive:
+      return super().generate()
+
+    outputs = []
+    self.create_eclipse()
+    if self.fixIni:
+      self.fix_ini()
+    # Make everything writeable such that all files can be modified and deleted.
+    _make_writeable(self.finalDestination)
+    if self.addJre and self.archiveJreSeparately:
+      # Archive eclipse.ini last, such that the archive with JRE can replace it.
+      iniLocation = self.os.iniLocation(self.finalDestination)
+      writer = self.__open_archive(self.archiveSuffix)
+      for path, arcname in tree_entries(self.finalDestination, self.__archive_root(), exclude=[iniLocation]):
+        writer.add(path, arcname)
+      mark = writer.mark()
+      writer.add(iniLocation, self.__archive_name(iniLocation))
+      writer.close()
+      outputs.append(EclipseOutput(self.os, self.arch, False, writer.location))
+
+      self.add_jre()
+      _make_writeable(self.finalDestination)
+      jreLocation = os.path.join(self.finalDestination, 'jre')
+      print('Appending JRE to archive {}'.format(writer.location))
+      jreWriter = self.__open_archive('-jre' + self.archiveSuffix, base=writer.location, mark=mark)
+      for path, arcname in tree_entries(jreLocation, self.__archive_name(jreLocation)):
+        jreWriter.add(path, arcname)
+      jreWriter.add(iniLocation, self.__archive_name(iniLocation))
+      jreWriter.close()
+      outputs.append(EclipseOutput(self.os, self.arch, True, jreWriter.location))
+    else:
+      if self.addJre:
+        self.add_jre()
+        _make_writeable(self.finalDestination)
+      writer = self.__open_archive(self.archiveSuffix)
+      for path, arcname in tree_entries(self.finalDestination, self.__archive_root()):
+        writer.add(path, arcname)
+      writer.close()
+      outputs.append(EclipseOutput(self.os, self.arch, self.addJre, writer.location))
+    return outputs
+
+  def __open_archive(self, suffix, base=None, mark=None):
+    name = '{}-{}-{}{}'.format(self.archivePrefix, self.os.name, self.arch.name, suffix)
+    print('Archiving Eclipse instance {}'.format(name))
+    os.makedirs(self.requestedDestination, exist_ok=True)
+    location = os.path.join(self.requestedDestination, name + _archiveExtensions[self.os.archiveFormat])
+    return open_archive(location, self.os.archiveFormat, self.archiveJobs, base, mark, self.compressionCache)
+
+  def __archive_root(self):
+    """
+    Returns the name of the root directory in archives: the application bundle on macOS, or the name of the instance.
+    """
+    if self.finalDestination != self.destination:
+      return os.path.basename(self.finalDestination)
+    return self.name
+
+  def __archive_name(self, location):
+    return '{}/{}'.format(self.__archive_root(), os.path.relpath(location, self.finalDestination).replace(os.sep, '/'))
+
+
+def _generate_instance(workingDir, destination, osName, archName, repositories, installUnits, kwargs):
+  """
+  Generates and archives the Eclipse instance for given operating system and architecture. Executed in a separate
+  process, returns the outputs as (OS name, architecture name, with JRE, location) tuples.
+  """
+  print('Generating Eclipse for combination {}, {}'.format(osName, archName))
+  generator = ArchivingEclipseGenerator(workingDir, destination, os=Os[osName].value, arch=Arch[archName].value,
+    repositories=repositories, installUnits=installUnits, archive=True, **kwargs)
+  try:
+    outputs = generator.generate()
+  finally:
+    generator.tempdir.cleanup()
+  return [(output.os.name, output.arch.name, output.withJre, output.location) for output in outputs]
+
+
+class _DirectorListing(object):
+  """
+  Output parser that collects the installable units that the director lists, keeping the highest version of each.
+  """
+
+  def __init__(self):
+    # Dictionary from unit identifier to version.
+    self.units = {}
+
+  def feed(self, line):
+    match = _listedUnit.match(line.strip())
+    if not match:
+      return
+    unitId, version = match.groups()
+    if unitId not in self.units or parse_version(version) > parse_version(self.units[unitId]):
+      self.units[unitId] = version
+
+
+def _run_director(args, workingDir, outputParser=None):
+  directorPath = which('director', path=director_path())
+  if not directorPath:
+    raise RuntimeError('Director application was not found at {}, cannot generate Eclipse instance'.format(
+      director_path()))
+  cmd = ' '.join([directorPath] + args)
+  print(cmd)
+  try:
+    return run_process(cmd, cwd=workingDir, outputParser=outputParser)
+  except KeyboardInterrupt:
+    raise RuntimeError('Running director interrupted')
+
+
+def _read_instance_record(location):
+  path = os.path.join(location, _instanceRecordName)
+  if not os.path.isfile(path):
+    return None
+  try:
+    with open(path) as file:
+      return json.load(file)
+  except (OSError, ValueError):
+    return None
+
+
+def _write_instance_record(generator, ius):
+  with open(os.path.join(generator.finalDestination, _instanceRecordName), 'w') as file:
+    json.dump({'os': generator.os.name, 'arch': generator.arch.name, 'ius': ius}, file, indent=2)
+
+
+def _combinations(oss, archs):
+  return [(o, a) for o in (oss or Os.values()) for a in (archs or Arch.values()) if
+    (o.name, a.name) not in _invalidCombinations]
+
+
+def _make_writeable(directory):
+  for root, _, fileNames in os.walk(directory):
+    for name in fileNames:
+      os.chmod(os.path.join(root, name), 0o744)
+
 
-  def generate_all(self, **kwargs):
-    generator = EclipseMultiGenerator(self.workingDir, self.destination, repositories=self.repos, installUnits=self.ius,
-      **kwargs)
-    return generator.generate()
+def _to_uri(location, workingDir):
+  if location.startswith('http'):
+    return location
+  if not os.path.isabs(location):
+    location = os.path.normpath(os.path.join(workingDir, location))
+  return urllib.parse.urljoin('file:', urllib.request.pathname2url(location))
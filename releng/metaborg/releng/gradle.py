@@ -0,0 +1,17 @@
+import gradlepy.run
+from gradlepy.run import Gradle
+
+from metaborg.util.process import launch_with_run_process, run_processes_of
+
+run_processes_of(gradlepy.run)
+
+
+class MetaborgGradle(Gradle):
+  """
+  Gradle runner that runs the Gradle processes that gradlepy's Gradle runner launches through run_process, such that
+  their resource usage can be observed. Accepts the same configuration as gradlepy's Gradle runner.
+  """
+
+  def run(self, cwd, buildFile, *extraTargets, **extraProperties):
+    with launch_with_run_process():
+      super().run(cwd, buildFile, *extraTargets, **extraProperties)
@@ -0,0 +1,93 @@
+import json
+import os
+import pickle
+import threading
+
+
+class DeployJournal(object):
+  """
+  Append-only journal of a build and its deployment, such that an interrupted deployment can be resumed without
+  building again and without uploading files that were already uploaded. Each record is written as a line of JSON and
+  flushed to disk before it is considered written, such that the journal survives crashes. A record that was only
+  partially written by a crash is ignored.
+
+  The journal records that the build with a key completed, with its result, which files were uploaded to which targets
+  with which checksum, and that the deployment completed, after which the next build starts a new journal.
+  """
+
+  def __init__(self, location):
+    self.location = location
+    self.resultLocation = '{}.result'.format(location)
+    self.__lock = threading.Lock()
+    self.__built = None
+    self.__done = False
+    self.__uploaded = set()
+    self.__read()
+
+  def resumable_result(self, key):
+    """
+    Returns the result of the build with given key if it completed but its deployment did not, or None otherwise.
+    """
+    if self.__built != key or self.__done or not os.path.isfile(self.resultLocation):
+      return None
+    with open(self.resultLocation, 'rb') as file:
+      return pickle.load(file)
+
+  def start(self):
+    """
+    Starts a new journal, forgetting the previous build and uploads.
+    """
+    with self.__lock:
+      for location in [self.location, self.resultLocation]:
+        if os.path.exists(location):
+          os.remove(location)
+      self.__built = None
+      self.__done = False
+      self.__uploaded = set()
+
+  def record_built(self, key, result):
+    temporaryLocation = '{}.tmp'.format(self.resultLocation)
+    with open(temporaryLocation, 'wb') as file:
+      pickle.dump(result, file)
+      file.flush()
+      os.fsync(file.fileno())
+    os.replace(temporaryLocation, self.resultLocation)
+    self.__append({'type': 'built', 'key': key})
+    self.__built = key
+
+  def record_uploaded(self, target, path, checksum):
+    self.__append({'type': 'uploaded', 'target': target, 'path': path, 'checksum': checksum})
+    self.__uploaded.add((target, path, checksum))
+
+  def record_done(self):
+    self.__append({'type': 'done'})
+    self.__done = True
+
+  def uploaded(self, target, path, checksum):
+    """
+    Returns whether a file with given checksum was uploaded to given path of given target.
+    """
+    return (target, path, checksum) in self.__uploaded
+
+  def __append(self, record):
+    line = json.dumps(record, sort_keys=True) + '\n'
+    with self.__lock, open(self.location, 'a') as file:
+      file.write(line)
+      file.flush()
+      os.fsync(file.fileno())
+
+  def __read(self):
+    if not os.path.isfile(self.location):
+      return
+    with open(self.location) as file:
+      for line in file:
+        try:
+          record = json.loads(line)
+        except ValueError:
+          continue
+        if record['type'] == 'built':
+          self.__built = record['key']
+        elif record['type'] == 'uploaded':
+          self.__uploaded.add((record['target'], record['path'], record['checksum']))
+        elif record['type'] == 'done':
+          self.__done = True
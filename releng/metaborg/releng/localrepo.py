@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+# Timestamp in versions stamped with a build qualifier, such as 2.5.0.20170101-120000-master.
+_qualifierTimestamp = re.compile(r'(\d{8}-\d{6})')
+
+
+class LocalRepoCleaner(object):
+  """
+  Cleans MetaBorg artifacts from a local Maven repository while the build proceeds. Stale versions are moved aside into
+  a trash directory in the local repository, which is atomic since it does not leave the file system, and are then
+  deleted in the background using at most `jobs` threads. Release versions are kept.
+  """
+
+  def __init__(self, localRepo, jobs=4):
+    self.localRepo = localRepo
+    self.jobs = jobs
+    self.trashLocation = os.path.join(localRepo, '.metaborg-trash')
+    self.tychoCacheLocation = os.path.join(localRepo, '.cache', 'tycho')
+    self.tychoInputsLocation = os.path.join(localRepo, '.cache', 'tycho.metaborg-inputs')
+    self.__executor = None
+    self.__futures = []
+
+  def clean(self, qualifier, tychoInputs):
+    """
+    Moves SNAPSHOT versions of MetaBorg artifacts, and versions stamped with a qualifier older than given qualifier,
+    aside, and starts deleting them in the background. The Tycho cache is only deleted when given inputs of the Tycho
+    cache differ from the inputs of the previous clean.
+    """
+    os.makedirs(self.trashLocation, exist_ok=True)
+    # Also delete what an interrupted earlier clean moved aside but did not delete.
+    paths = [os.path.join(self.trashLocation, name) for name in os.listdir(self.trashLocation)]
+
+    timestamp = _qualifier_timestamp(qualifier)
+    versions = 0
+    for root, dirNames, _ in os.walk(os.path.join(self.localRepo, 'org', 'metaborg')):
+      for dirName in list(dirNames):
+        if _is_stale_version(dirName, timestamp):
+          paths.append(self.__move_aside(os.path.join(root, dirName)))
+          dirNames.remove(dirName)
+          versions += 1
+    print('Deleting {} SNAPSHOT and older qualified versions of MetaBorg artifacts from {} in the background'.format(
+      versions, self.localRepo))
+
+    if _read_file(self.tychoInputsLocation) != tychoInputs:
+      if os.path.isdir(self.tychoCacheLocation):
+        print('Deleting Tycho cache {} in the background: its inputs changed'.format(self.tychoCacheLocation))
+        paths.append(self.__move_aside(self.tychoCacheLocation))
+      os.makedirs(os.path.dirname(self.tychoInputsLocation), exist_ok=True)
+      with open(self.tychoInputsLocation, 'w') as file:
+        file.write(tychoInputs)
+    else:
+      print('Keeping Tycho cache {}: its inputs did not change'.format(self.tychoCacheLocation))
+
+    self.__executor = ThreadPoolExecutor(max_workers=self.jobs)
+    self.__futures = [self.__executor.submit(shutil.rmtree, path, True) for path in paths]
+
+  def wait(self):
+    """
+    Waits until everything that was moved aside has been deleted.
+    """
+    if not self.__executor:
+      return
+    for future in self.__futures:
+      future.result()
+    self.__executor.shutdown()
+    self.__executor = None
+    self.__futures = []
+
+  def __move_aside(self, path):
+    trashPath = os.path.join(self.trashLocation, uuid.uuid4().hex)
+    os.rename(path, trashPath)
+    return trashPath
+
+
+def tycho_cache_inputs(directory):
+  """
+  Returns a hash of the URLs of the p2 repositories declared in all POM files in given directory, which Tycho caches
+  metadata of.
+  """
+  urls = set()
+  for root, dirNames, fileNames in os.walk(directory):
+    dirNames[:] = [dirName for dirName in dirNames if dirName != 'target' and not dirName.startswith('.')]
+    if 'pom.xml' not in fileNames:
+      continue
+    try:
+      pom = ET.parse(os.path.join(root, 'pom.xml')).getroot()
+    except ET.ParseError:
+      continue
+    for element in pom.iter():
+      if not element.tag.endswith('}repository') and element.tag != 'repository':
+        continue
+      children = {child.tag.split('}')[-1]: (child.text or '').strip() for child in element}
+      if children.get('layout') == 'p2':
+        urls.add(children.get('url', ''))
+  return hashlib.sha256('\n'.join(sorted(urls)).encode('utf-8')).hexdigest()
+
+
+def _qualifier_timestamp(qualifier):
+  match = _qualifierTimestamp.search(qualifier or '')
+  return match.group(1) if match else None
+
+
+def _is_stale_version(version, timestamp):
+  if version.endswith('-SNAPSHOT'):
+    return True
+  versionTimestamp = _qualifier_timestamp(version)
+  return versionTimestamp is not None and timestamp is not None and versionTimestamp < timestamp
+
+
+def _read_file(location):
+  if not os.path.isfile(location):
+    return None
+  with open(location) as file:
+    return file.read()
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Directories, relative to the spoofax-releng repository, whose POM and extensions files determine the third-party
+# artifacts that are resolved into the local repository.
+_keyDirs = [os.path.join('releng', 'parent'), os.path.join('releng', 'build')]
+_keyFileNames = {'pom.xml', 'extensions.xml'}
+# Files that are already compressed, which are stored in snapshots without compressing them again.
+_compressedExtensions = ('.jar', '.zip', '.gz', '.xz', '.bz2', '.war', '.ear', '.tgz')
+
+
+def repository_key(basedir):
+  """
+  Returns a hash of the paths and contents of all POM and extensions files in the parent and build directories of the
+  spoofax-releng repository at given directory.
+  """
+  digest = hashlib.sha256()
+  for keyDir in _keyDirs:
+    for root, dirNames, fileNames in os.walk(os.path.join(basedir, keyDir)):
+      dirNames[:] = sorted(dirName for dirName in dirNames if dirName != 'target' and not dirName.startswith('.'))
+      for fileName in sorted(fileNames):
+        if fileName not in _keyFileNames:
+          continue
+        path = os.path.join(root, fileName)
+        digest.update(os.path.relpath(path, basedir).replace(os.sep, '/').encode('utf-8'))
+        with open(path, 'rb') as file:
+          digest.update(hashlib.sha256(file.read()).digest())
+  return digest.hexdigest()
+
+
+def snapshot_location(snapshotDir, key):
+  return os.path.join(snapshotDir, 'm2-{}.zip'.format(key))
+
+
+def snapshot_local_repo(localRepo, snapshotDir, key):
+  """
+  Packs the third-party part of the local Maven repository, everything outside org/metaborg, into a ZIP archive keyed
+  by given key in given directory. The central directory of the archive indexes its files, such that they can be
+  extracted in parallel. Returns the location of the archive.
+  """
+  files = []
+  for root, dirNames, fileNames in os.walk(localRepo):
+    relativeRoot = os.path.relpath(root, localRepo)
+    if relativeRoot == '.':
+      # Skip caches and indexes of Maven and Tycho.
+      dirNames[:] = [dirName for dirName in dirNames if not dirName.startswith('.')]
+    elif relativeRoot == 'org':
+      dirNames[:] = [dirName for dirName in dirNames if dirName != 'metaborg']
+    for fileName in fileNames:
+      # Files that record failed downloads would make Maven skip those downloads after restoring.
+      if fileName.endswith('.lastUpdated'):
+        continue
+      files.append(os.path.join(root, fileName))
+  files.sort()
+
+  location = snapshot_location(snapshotDir, key)
+  os.makedirs(snapshotDir, exist_ok=True)
+  temporaryLocation = '{}.{}.tmp'.format(location, os.getpid())
+  with zipfile.ZipFile(temporaryLocation, 'w', allowZip64=True) as archive:
+    for path in files:
+      compression = zipfile.ZIP_STORED if path.endswith(_compressedExtensions) else zipfile.ZIP_DEFLATED
+      archive.write(path, os.path.relpath(path, localRepo).replace(os.sep, '/'), compression)
+  os.replace(temporaryLocation, location)
+  print('Packed {} files of local repository {} into {}'.format(len(files), localRepo, location))
+  return location
+
+
+def restore_local_repo(localRepo, snapshotDir, key, jobs=None):
+  """
+  Extracts the snapshot with given key from given directory into the local Maven repository, using at most `jobs`
+  threads, defaulting to the number of CPUs. Extraction is skipped if the local repository already has all files of the
+  snapshot. Returns False if there is no snapshot with given key, True otherwise.
+  """
+  location = snapshot_location(snapshotDir, key)
+  if not os.path.isfile(location):
+    print('No snapshot of the local repository for key {} in {}'.format(key, snapshotDir))
+    return False
+
+  with zipfile.ZipFile(location) as archive:
+    members = [member for member in archive.infolist() if not member.is_dir()]
+  missing = [member for member in members if not _is_extracted(localRepo, member)]
+  if not missing:
+    print('Local repository {} is up to date with snapshot {}'.format(localRepo, location))
+    return True
+
+  jobs = min(jobs or os.cpu_count() or 1, len(missing))
+  # Distribute files over threads by size, largest files first, such that each thread extracts about as many bytes.
+  buckets = [[] for _ in range(jobs)]
+  bucketSizes = [0] * jobs
+  for member in sorted(missing, key=lambda member: member.file_size, reverse=True):
+    index = bucketSizes.index(min(bucketSizes))
+    buckets[index].append(member)
+    bucketSizes[index] += member.file_size
+
+  # Create directories up front, since threads creating the same directory concurrently fail.
+  for directory in {os.path.dirname(member.filename) for member in missing}:
+    os.makedirs(os.path.join(localRepo, *directory.split('/')), exist_ok=True)
+
+  def extract(bucket):
+    # Each thread reads the archive through its own file handle.
+    with zipfile.ZipFile(location) as threadArchive:
+      for member in bucket:
+        threadArchive.extract(member, localRepo)
+
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    list(executor.map(extract, buckets))
+  print('Extracted {} of {} files of snapshot {} into local repository {}'.format(len(missing), len(members), location,
+    localRepo))
+  return True
+
+
+def _is_extracted(localRepo, member):
+  path = os.path.join(localRepo, *member.filename.split('/'))
+  try:
+    return os.path.getsize(path) == member.file_size
+  except OSError:
+    return False
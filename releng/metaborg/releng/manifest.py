@@ -0,0 +1,109 @@
+import json
+import os
+
+from buildorchestra.result import DirArtifact, FileArtifact
+
+from metaborg.util.checksum import checksum_files, file_checksums
+from metaborg.util.filecopy import copy_files
+
+
+class ArtifactManifest(object):
+  """
+  Checksums of all files of the artifacts produced by a build. Deployers use the manifest to get checksums of artifacts
+  without reading them again.
+  """
+
+  def __init__(self, entries, dstDirs=None):
+    """
+    :param entries: List of (source path, destination path or None, FileChecksums) tuples.
+    :param dstDirs: Destination paths of directory artifacts.
+    """
+    self.entries = entries
+    self.dstDirs = dstDirs or []
+    self.__checksums = {os.path.abspath(path): checksums for path, _, checksums in entries}
+
+  @staticmethod
+  def create(artifacts, jobs=None):
+    """
+    Hashes all files of given file and directory artifacts concurrently.
+    """
+    files = []
+    dstDirs = []
+    for artifact in artifacts:
+      if isinstance(artifact, FileArtifact):
+        files.append((artifact.srcFile, artifact.dstFile))
+      elif isinstance(artifact, DirArtifact):
+        if artifact.dstDir:
+          dstDirs.append(artifact.dstDir)
+        for root, _, fileNames in os.walk(artifact.srcDir):
+          for fileName in sorted(fileNames):
+            path = os.path.join(root, fileName)
+            dstFile = None
+            if artifact.dstDir:
+              dstFile = os.path.join(artifact.dstDir, os.path.relpath(path, artifact.srcDir))
+            files.append((path, dstFile))
+    checksums = checksum_files({path for path, _ in files}, jobs)
+    return ArtifactManifest([(path, dstFile, checksums[path]) for path, dstFile in files], dstDirs)
+
+  def checksums(self, path):
+    """
+    Returns the FileChecksums of file at given path, hashing it if it is not in the manifest.
+    """
+    checksums = self.__checksums.get(os.path.abspath(path))
+    if not checksums:
+      checksums = file_checksums(path)
+      self.__checksums[os.path.abspath(path)] = checksums
+    return checksums
+
+  def copy_to(self, destDir, hardlink=False, deleteStale=False):
+    """
+    Copies all files that have a destination path to that path in given directory, like BuildResult.copy_to, but
+    concurrently, without copying data where the file system allows it, and skipping files that already exist at the
+    destination with the same content. When `deleteStale` is set, files in copied directory artifacts that are not part
+    of the artifact anymore are deleted.
+    """
+    files = [(path, os.path.join(destDir, dstFile)) for path, dstFile, _ in self.entries if dstFile]
+    print('Copying {} files of artifacts to {}'.format(len(files), destDir))
+
+    def unchanged(src, dst):
+      checksums = self.checksums(src)
+      dstStat = os.stat(dst)
+      if dstStat.st_size != checksums.size:
+        return False
+      # Copies keep the modification time of their source, only hash destinations whose time differs.
+      srcStat = os.stat(src)
+      if dstStat.st_mtime_ns == srcStat.st_mtime_ns:
+        return True
+      if file_checksums(dst).sha256 != checksums.sha256:
+        return False
+      # Skip hashing the destination next time.
+      os.utime(dst, ns=(srcStat.st_atime_ns, srcStat.st_mtime_ns))
+      return True
+
+    counts = copy_files(files, hardlink=hardlink, unchanged=unchanged)
+    print('Copied files: {}'.format(
+      ', '.join('{} {}'.format(count, method) for method, count in sorted(counts.items()))))
+
+    if not deleteStale:
+      return
+    copied = {os.path.normpath(dst) for _, dst in files}
+    for dstDir in self.dstDirs:
+      for root, _, fileNames in os.walk(os.path.join(destDir, dstDir)):
+        for fileName in fileNames:
+          path = os.path.normpath(os.path.join(root, fileName))
+          if path not in copied:
+            print('Deleting stale file {}'.format(path))
+            os.remove(path)
+
+  def write(self, location):
+    """
+    Writes the checksums of all files that have a destination path, keyed by destination path, in JSON format.
+    """
+    files = {}
+    for _, dstFile, checksums in self.entries:
+      if dstFile:
+        files[dstFile.replace(os.sep, '/')] = vars(checksums)
+    os.makedirs(os.path.dirname(location), exist_ok=True)
+    with open(location, 'w') as file:
+      json.dump({'files': files}, file, indent=2, sort_keys=True)
+    print('Wrote checksums of {} files to {}'.format(len(files), location))
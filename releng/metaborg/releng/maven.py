@@ -1,5 +1,31 @@
+import copy
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from shutil import which
+
+import mavenpy.run
+from mavenpy.run import Maven
 from mavenpy.settings import MavenSettingsGenerator
 
+from metaborg.releng.mavenlog import MavenLogParser
+from metaborg.util.process import launch_with_run_process, run_process, run_processes_of
+
+run_processes_of(mavenpy.run)
+
+# Path of the Maven executable of the run on each thread. mavenpy looks up the mvn executable itself to start its
+# command with, this returns the executable of the run instead, such that runs with the Maven daemon client do not
+# require mvn on the path.
+_runExecutables = threading.local()
+
+
+def _run_executable(name):
+  return getattr(_runExecutables, 'path', None) or which(name)
+
+
+mavenpy.run.which = _run_executable
+
 
 class MetaborgMavenSettingsGeneratorGenerator(MavenSettingsGenerator):
   defaultSettingsLocation = MavenSettingsGenerator.user_settings_location()
@@ -27,3 +53,339 @@ class MetaborgMavenSettingsGeneratorGenerator(MavenSettingsGenerator):
       mirrors.append(('metaborg-central-mirror', centralMirror, 'central'))
 
     MavenSettingsGenerator.__init__(self, location=location, repositories=repositories, mirrors=mirrors)
+
+
+class MetaborgMaven(Maven):
+  """
+  Maven runner that runs the Maven processes that mavenpy's Maven runner launches through run_process, such that their
+  resource usage can be observed. Accepts the same configuration as mavenpy's Maven runner.
+
+  When `daemon` is set, Maven is run with the Maven daemon (mvnd) client instead, which executes builds in long-lived
+  warm JVMs, and which does not require the regular Maven client on the path. Each run still passes its complete
+  command line, so goals, profiles, and properties may differ between runs. Daemons are started with `opts` as JVM
+  arguments; runs with different `opts` use different daemons. When `daemonStorage` is set, daemons are registered in
+  that directory, isolating them from other daemons on the machine.
+
+  The output of each run is parsed with a MavenLogParser, which is available as the outputParser of the ProcessResult
+  that observers of processes receive.
+
+  When `smartClean` is set to a SmartClean, runs of reactors with the clean target only clean the modules that changed
+  since their last build, except when clean is passed as an extra target.
+  """
+
+  def __init__(self):
+    super().__init__()
+    # Number of threads for Maven's parallel reactor builder, such as 4 or 1C (1 thread per core). None to build
+    # serially.
+    self.threads = None
+    self.daemon = False
+    self.daemonStorage = None
+    # Directories whose reactors have already been built, runs in these directories are skipped.
+    self.prebuilt = set()
+    self.smartClean = None
+
+  def run(self, cwd, buildFile, *extraTargets, **extraProperties):
+    if cwd and not buildFile and os.path.normpath(cwd) in self.prebuilt:
+      print('Skipping Maven run in {}: reactor was already built'.format(cwd))
+      return
+    smartCleans = self.__smart_cleans(cwd, buildFile, extraTargets)
+    if smartCleans:
+      self.smartClean.clean_reactor(cwd)
+    # Run with a copy whose configuration is adjusted for this run, since mavenpy builds the command from it.
+    maven = copy.copy(self)
+    if smartCleans:
+      maven.targets = [target for target in self.targets if target != 'clean']
+    if self.daemon:
+      # Daemons are started with the options as JVM arguments instead.
+      maven.opts = None
+    executable = self.__executable()
+    _runExecutables.path = executable
+    try:
+      with launch_with_run_process(lambda cmd: self.__rewrite_command(executable, cmd), MavenLogParser()):
+        Maven.run(maven, cwd, buildFile, *extraTargets, **extraProperties)
+    finally:
+      _runExecutables.path = None
+    if smartCleans:
+      self.smartClean.record_reactor(cwd)
+
+  def stop_daemons(self):
+    """
+    Stops all Maven daemons registered in `daemonStorage`, or all daemons of the current user if it is not set.
+    """
+    if not self.daemon or not which('mvnd'):
+      return
+    cmd = ' '.join(['"{}"'.format(self.__executable())] + self.__daemon_args() + ['--stop'])
+    print(cmd)
+    env = os.environ.copy()
+    env.update(self.env)
+    run_process(cmd, env=env)
+
+  def __rewrite_command(self, executable, cmd):
+    """
+    Rewrites given command built by mavenpy with given executable, to quote the executable and to pass the options of
+    this runner that mavenpy does not support.
+    """
+    args = ['"{}"'.format(executable)]
+    if self.daemon:
+      args.extend(self.__daemon_args())
+    threads = self.threads
+    if self.daemon and not threads:
+      # The daemon builds modules in parallel by default, build serially like the regular Maven client does.
+      threads = 1
+    if threads:
+      args.append('--threads {}'.format(threads))
+    # mavenpy starts the command with the unquoted executable, whose path may contain spaces.
+    rewritten = ' '.join(args) + cmd[len(executable):]
+    if len(args) > 1:
+      print('Running {}'.format(rewritten))
+    return rewritten
+
+  def __executable(self):
+    name = 'mvnd' if self.daemon else 'mvn'
+    path = which(name)
+    if not path:
+      raise RuntimeError("Cannot run Maven, executable {} not found on the path".format(name))
+    return path
+
+  def __smart_cleans(self, cwd, buildFile, extraTargets):
+    return self.smartClean and cwd and not buildFile and 'clean' in self.targets and 'clean' not in extraTargets
+
+  def __daemon_args(self):
+    args = []
+    if self.daemonStorage:
+      args.append('-Dmvnd.daemonStorage="{}"'.format(self.daemonStorage))
+    if self.opts:
+      args.append('-Dmvnd.jvmArgs="{}"'.format(self.opts))
+    return args
+
+
+_pomNamespace = {'pom': 'http://maven.apache.org/POM/4.0.0'}
+
+
+def _namespace_of(element):
+  if element.tag.startswith('{'):
+    return element.tag[:element.tag.index('}') + 1]
+  return ''
+
+
+def _merge_children(local, remote, listTag, key):
+  """
+  Adds the children of the `listTag` element of `remote` whose key is not a key of a child of the same element of
+  `local`, before the children of `local`.
+  """
+  remoteList = remote.find(listTag)
+  if remoteList is None:
+    return
+  localList = local.find(listTag)
+  if localList is None:
+    localList = ET.SubElement(local, listTag)
+  localKeys = {key(child) for child in localList}
+  for index, child in enumerate(child for child in list(remoteList) if key(child) not in localKeys):
+    localList.insert(index, child)
+
+
+def _manifest_required_bundles(manifestFile):
+  with open(manifestFile, encoding='utf-8', errors='replace') as file:
+    # Lines starting with a space continue the previous line.
+    headers = re.sub(r'\r?\n ', '', file.read())
+  match = re.search(r'^Require-Bundle:(.*)$', headers, re.MULTILINE)
+  if not match:
+    return []
+  # Split on commas that are not inside quoted attribute values such as bundle-version="[1.0,2.0)".
+  clauses = re.findall(r'(?:[^,"]|"[^"]*")+', match.group(1))
+  return [clause.split(';', 1)[0].strip() for clause in clauses if clause.strip()]
+
+
+def reactor_modules(pomDir):
+  """
+  Returns the absolute paths of all modules in the reactor of the POM file in given directory, including nested modules.
+  Property references in module paths, such as ${repo.root}, are resolved with properties defined in the POM itself.
+  """
+  pomFile = os.path.join(pomDir, 'pom.xml')
+  if not os.path.isfile(pomFile):
+    return []
+  root = ET.parse(pomFile).getroot()
+
+  properties = {}
+  for element in root.findall('pom:properties/*', _pomNamespace):
+    name = element.tag.split('}', 1)[-1]
+    properties[name] = (element.text or '').strip()
+
+  def resolve(value):
+    for _ in range(10):
+      resolved = re.sub(r'\$\{([^}]+)\}', lambda m: properties.get(m.group(1), m.group(0)), value)
+      if resolved == value:
+        break
+      value = resolved
+    return value
+
+  modules = []
+  for element in root.findall('pom:modules/pom:module', _pomNamespace):
+    moduleDir = os.path.normpath(os.path.join(pomDir, resolve((element.text or '').strip())))
+    modules.append(moduleDir)
+    modules.extend(reactor_modules(moduleDir))
+  return modules
+
+
+def module_references(moduleDir):
+  """
+  Returns the artifact identifier of the Maven module in given directory, and the set of identifiers of artifacts it
+  references: its parent, dependencies, plugins, and extensions, and for Tycho modules, the bundles it requires and the
+  plugins and features it includes.
+  """
+  artifactId = None
+  references = set()
+
+  pomFile = os.path.join(moduleDir, 'pom.xml')
+  if os.path.isfile(pomFile):
+    root = ET.parse(pomFile).getroot()
+    artifactId = (root.findtext('pom:artifactId', '', _pomNamespace) or '').strip() or None
+    for path in ['pom:parent', 'pom:dependencies/pom:dependency', 'pom:build/pom:plugins/pom:plugin',
+      'pom:build/pom:extensions/pom:extension']:
+      for element in root.findall(path, _pomNamespace):
+        reference = (element.findtext('pom:artifactId', '', _pomNamespace) or '').strip()
+        if reference:
+          references.add(reference)
+
+  manifestFile = os.path.join(moduleDir, 'META-INF', 'MANIFEST.MF')
+  if os.path.isfile(manifestFile):
+    references.update(_manifest_required_bundles(manifestFile))
+
+  for fileName, tags, attributes in [
+    ('feature.xml', ['plugin', 'includes', 'import'], ['id', 'plugin', 'feature']),
+    ('category.xml', ['feature', 'bundle'], ['id']),
+  ]:
+    metadataFile = os.path.join(moduleDir, fileName)
+    if os.path.isfile(metadataFile):
+      root = ET.parse(metadataFile).getroot()
+      for tag in tags:
+        for element in root.iter(tag):
+          references.update(element.get(attribute) for attribute in attributes if element.get(attribute))
+
+  references.discard(artifactId)
+  return artifactId, references
+
+
+def server_credentials(settingsFiles, serverId):
+  """
+  Returns the username and password of the server with given identifier in the first of given Maven settings files that
+  configures that server, or None if no settings file configures it. Raises a RuntimeError if the password is encrypted
+  with Maven's password encryption, since it cannot be decrypted here.
+  """
+  for settingsFile in settingsFiles:
+    if not settingsFile or not os.path.isfile(settingsFile):
+      continue
+    root = ET.parse(settingsFile).getroot()
+    namespace = _namespace_of(root)
+    for server in root.iter('{}server'.format(namespace)):
+      if (server.findtext('{}id'.format(namespace)) or '').strip() != serverId:
+        continue
+      username = (server.findtext('{}username'.format(namespace)) or '').strip()
+      password = (server.findtext('{}password'.format(namespace)) or '').strip()
+      if password.startswith('{') and password.endswith('}'):
+        raise RuntimeError('Password of server {} in {} is encrypted'.format(serverId, settingsFile))
+      return username, password
+  return None
+
+
+def local_repository(settingsFiles):
+  """
+  Returns the location of the local Maven repository configured in the first of given Maven settings files that
+  configures it, or the default ~/.m2/repository location if no settings file configures it.
+  """
+  for settingsFile in settingsFiles:
+    if not settingsFile or not os.path.isfile(settingsFile):
+      continue
+    root = ET.parse(settingsFile).getroot()
+    location = (root.findtext('{}localRepository'.format(_namespace_of(root))) or '').strip()
+    if location:
+      return os.path.expanduser(location.replace('${user.home}', '~'))
+  return os.path.join(os.path.expanduser('~'), '.m2', 'repository')
+
+
+def merge_metadata(localContent, remoteContent):
+  """
+  Merges the content of a maven-metadata.xml file of a local repository into the content of the same file in a remote
+  repository, like Maven does when deploying: versions and snapshot versions of both are kept, and the latest and
+  release versions, snapshot, and last updated timestamp of the local file take precedence. Returns the merged content.
+  """
+  local = ET.fromstring(localContent)
+  remote = ET.fromstring(remoteContent)
+  namespace = _namespace_of(local)
+  if namespace:
+    ET.register_namespace('', namespace[1:-1])
+
+  def tag(name):
+    return '{}{}'.format(namespace, name)
+
+  localVersioning = local.find(tag('versioning'))
+  remoteVersioning = remote.find(tag('versioning'))
+  if localVersioning is not None and remoteVersioning is not None:
+    for name in ['latest', 'release']:
+      if localVersioning.find(tag(name)) is None and remoteVersioning.find(tag(name)) is not None:
+        localVersioning.insert(0, remoteVersioning.find(tag(name)))
+
+    _merge_children(localVersioning, remoteVersioning, tag('versions'), lambda e: (e.text or '').strip())
+    _merge_children(localVersioning, remoteVersioning, tag('snapshotVersions'),
+      lambda e: (e.findtext(tag('classifier')) or '', e.findtext(tag('extension')) or ''))
+
+    localUpdated = localVersioning.find(tag('lastUpdated'))
+    remoteUpdated = remoteVersioning.findtext(tag('lastUpdated'))
+    if localUpdated is not None and remoteUpdated and remoteUpdated > (localUpdated.text or ''):
+      localUpdated.text = remoteUpdated
+
+  _merge_children(local, remote, tag('plugins'), lambda e: e.findtext(tag('prefix')))
+
+  return b'<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(local, encoding='UTF-8').split(b'?>', 1)[-1].lstrip()
+
+
+def maven_config_dir(directory):
+  """
+  Returns the .mvn directory that Maven uses when run in given directory, or None if there is none. Like Maven, this is
+  the .mvn directory in the closest of given directory and its ancestors that has one.
+  """
+  directory = os.path.abspath(directory)
+  while True:
+    configDir = os.path.join(directory, '.mvn')
+    if os.path.isdir(configDir):
+      return configDir
+    parent = os.path.dirname(directory)
+    if parent == directory:
+      return None
+    directory = parent
+
+
+def write_aggregator_pom(directory, artifactId, moduleDirs):
+  """
+  Writes a POM file to given directory that aggregates the reactors in given directories into a single reactor. The
+  aggregator POM itself is never installed or deployed.
+  """
+  os.makedirs(directory, exist_ok=True)
+  modules = ''.join('    <module>{}</module>\n'.format(os.path.relpath(moduleDir, directory).replace(os.sep, '/'))
+    for moduleDir in moduleDirs)
+  with open(os.path.join(directory, 'pom.xml'), 'w') as file:
+    file.write(_aggregatorPomTemplate.format(artifactId=artifactId, modules=modules))
+
+
+_aggregatorPomTemplate = """<?xml version="1.0" encoding="UTF-8"?>
+<project
+  xmlns="http://maven.apache.org/POM/4.0.0"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+  xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd"
+>
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>org.metaborg</groupId>
+  <artifactId>{artifactId}</artifactId>
+  <version>0.0.0-aggregator</version>
+  <packaging>pom</packaging>
+  <description>Generated aggregator POM, do not edit</description>
+
+  <properties>
+    <maven.install.skip>true</maven.install.skip>
+    <maven.deploy.skip>true</maven.deploy.skip>
+  </properties>
+
+  <modules>
+{modules}  </modules>
+</project>
+"""
@@ -0,0 +1,107 @@
+import re
+from collections import deque
+
+_reactorSummary = re.compile(r'^\[INFO\] Reactor Summary')
+_moduleResult = re.compile(
+  r'^\[INFO\] (?P<name>.*?) ?\.* (?P<status>SUCCESS|FAILURE|SKIPPED)(?: \[ *(?P<time>[^\]]*)\])?\s*$')
+_separator = re.compile(r'^\[INFO\] -{20,}\s*$')
+_mojoExecution = re.compile(r'^\[INFO\] --- .* @ (?P<module>\S+) ---')
+_testResults = re.compile(
+  r'Tests run: (?P<run>\d+), Failures: (?P<failures>\d+), Errors: (?P<errors>\d+), Skipped: (?P<skipped>\d+)\s*$')
+_failure = re.compile(
+  r'^\[ERROR\] Failed to execute goal (?P<goal>\S+) .*?on project (?P<module>[^:]+): (?P<message>.*)$')
+
+# Maximum number of failures and standard error lines to keep, and maximum length of kept failure messages and lines,
+# to bound memory usage.
+_maxFailures = 100
+_maxErrorLines = 50
+_maxMessageLength = 1000
+
+
+class MavenLogParser(object):
+  """
+  Parses Maven output line by line, extracting the status and duration of each module from the reactor summary, the
+  goals that failed, and test counts per module. Maven logs to standard output; standard error, which is fed
+  separately, only has output of the JVM and of tools that bypass Maven's logger, of which the last lines are kept.
+  Only the extracted information is kept, such that memory usage does not grow with the size of the output.
+
+  Test counts are attributed to the module of the last mojo execution that was logged, which may be wrong when modules
+  are built in parallel.
+  """
+
+  def __init__(self):
+    # List of {'name', 'status', 'duration'} dictionaries in reactor order, duration in seconds or None if skipped.
+    self.modules = []
+    # List of {'module', 'goal', 'message'} dictionaries.
+    self.failures = []
+    # Dictionary from module artifact identifier to {'run', 'failures', 'errors', 'skipped'} test counts.
+    self.tests = {}
+    # Last lines of standard error.
+    self.errorLines = deque(maxlen=_maxErrorLines)
+    self.__inSummary = False
+    self.__module = None
+
+  def feed(self, line):
+    if not line.startswith('['):
+      return
+    if self.__inSummary:
+      self.__feed_summary(line)
+      return
+    if line.startswith('[INFO] R') and _reactorSummary.match(line):
+      self.__inSummary = True
+      self.modules = []
+    elif line.startswith('[INFO] ---'):
+      match = _mojoExecution.match(line)
+      if match:
+        self.__module = match.group('module')
+    elif 'Tests run: ' in line:
+      match = _testResults.search(line)
+      # Test counts of a single test class are followed by their time, only module totals match.
+      if match and 'Time elapsed' not in line:
+        counts = self.tests.setdefault(self.__module or '', {'run': 0, 'failures': 0, 'errors': 0, 'skipped': 0})
+        for name in counts:
+          counts[name] += int(match.group(name))
+    elif line.startswith('[ERROR] Failed to execute goal') and len(self.failures) < _maxFailures:
+      match = _failure.match(line)
+      if match:
+        self.failures.append({'module': match.group('module'), 'goal': match.group('goal'),
+          'message': match.group('message')[:_maxMessageLength]})
+
+  def feed_error(self, line):
+    if line.strip():
+      self.errorLines.append(line[:_maxMessageLength])
+
+  def record(self):
+    """
+    Returns the extracted information as a dictionary that can be serialized to JSON.
+    """
+    totals = {'run': 0, 'failures': 0, 'errors': 0, 'skipped': 0}
+    for counts in self.tests.values():
+      for name in totals:
+        totals[name] += counts[name]
+    return {'modules': self.modules, 'failures': self.failures, 'tests': self.tests, 'testTotals': totals,
+      'errorOutput': list(self.errorLines)}
+
+  def __feed_summary(self, line):
+    match = _moduleResult.match(line)
+    if match:
+      self.modules.append({'name': match.group('name'), 'status': match.group('status'),
+        'duration': _parse_duration(match.group('time'))})
+    elif self.modules and (_separator.match(line) or not line.startswith('[INFO]')):
+      self.__inSummary = False
+
+
+def _parse_duration(text):
+  """
+  Parses a duration from the reactor summary, such as '2.345 s', '2.345s', '01:02 min', or '1:02:03 h', to seconds.
+  """
+  if not text:
+    return None
+  value = text.strip().split(' ')[0].rstrip('s')
+  seconds = 0.0
+  try:
+    for part in value.split(':'):
+      seconds = seconds * 60 + float(part)
+  except ValueError:
+    return None
+  return seconds
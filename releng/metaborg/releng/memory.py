@@ -0,0 +1,110 @@
+import json
+import os
+import re
+
+_size = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*$', re.IGNORECASE)
+_sizeUnits = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+_maxHeap = re.compile(r'-Xmx(\S+)')
+
+# Fraction of the maximum heap size that a JVM uses outside of its heap, for metaspace, code, and thread stacks.
+_jvmOverhead = 0.25
+
+
+class StepMemory(object):
+  """
+  Estimates the peak memory usage of build steps, in bytes. The estimate of a step is, in order of preference: the
+  configured memory usage of the step, the largest peak memory usage of its processes in the `count` latest build
+  records in `recordsLocation`, or `default`.
+
+  Steps in `unmeasured` run processes that do their work in daemons, such as the Maven daemon or Gradle daemon, whose
+  memory usage is not included in the measurements. Their measurements are ignored.
+  """
+
+  def __init__(self, recordsLocation, configured, default, unmeasured=(), count=10):
+    self.configured = configured
+    self.default = default
+    self.unmeasured = set(unmeasured)
+    self.measured = _measured_memory(recordsLocation, count)
+
+  def expected(self, stepId):
+    if stepId in self.configured:
+      return self.configured[stepId]
+    if stepId not in self.unmeasured and stepId in self.measured:
+      return self.measured[stepId]
+    return self.default
+
+
+def parse_size(text):
+  """
+  Parses a memory size such as '512M', '2g', or '1.5GB' to bytes. Sizes without unit are in bytes.
+  """
+  match = _size.match(text)
+  if not match:
+    raise ValueError('Invalid memory size {}, expected a number followed by an optional K, M, G, or T unit'.format(
+      text))
+  return int(float(match.group(1)) * _sizeUnits[match.group(2).lower()])
+
+
+def jvm_memory(opts):
+  """
+  Returns the expected peak memory usage of a JVM started with given options: its maximum heap size, plus the memory it
+  uses outside of its heap. Returns None if the options do not set a maximum heap size and the size of the physical
+  memory, a quarter of which is the default maximum heap size, is unknown.
+  """
+  match = _maxHeap.search(opts or '')
+  if match:
+    maxHeap = parse_size(match.group(1))
+  else:
+    physicalMemory = physical_memory()
+    if not physicalMemory:
+      return None
+    maxHeap = physicalMemory // 4
+  return int(maxHeap * (1 + _jvmOverhead))
+
+
+def physical_memory():
+  """
+  Returns the size of the physical memory of this machine in bytes, or None if this platform does not report it.
+  """
+  try:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+  except (AttributeError, ValueError, OSError):
+    return None
+
+
+def default_memory_budget():
+  """
+  Returns the default memory budget for concurrent build steps: the physical memory, minus a tenth for the operating
+  system and this process. Returns None if the size of the physical memory is unknown.
+  """
+  physicalMemory = physical_memory()
+  if not physicalMemory:
+    return None
+  return int(physicalMemory * 0.9)
+
+
+def format_size(size):
+  return '{:.1f}G'.format(size / _sizeUnits['g'])
+
+
+def _measured_memory(location, count):
+  """
+  Returns a dictionary from identifier of each build step in the `count` latest build records in given directory, to
+  the largest peak memory usage of its processes.
+  """
+  if not os.path.isdir(location):
+    return {}
+  measured = {}
+  for name in sorted(name for name in os.listdir(location) if name.endswith('.json'))[-count:]:
+    try:
+      with open(os.path.join(location, name)) as file:
+        record = json.load(file)
+    except (OSError, ValueError):
+      continue
+    for step in record.get('steps', []):
+      if step.get('category') != 'step':
+        continue
+      for process in step['processes']:
+        if process.get('maxRss'):
+          measured[step['name']] = max(measured.get(step['name'], 0), process['maxRss'])
+  return measured
@@ -0,0 +1,453 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from metaborg.util.p2 import (
+  artifact_descriptors, composite_children, parse_version, read_repository_xml, repository_units
+)
+from metaborg.util.upload import HttpUploader, create_uploader
+
+_indexName = '.metaborg-p2-mirror.json'
+
+# Mapping rules of the artifact repositories of the mirror, from artifact classifier to the path of its artifacts.
+_mappings = {
+  'osgi.bundle': 'plugins/{id}_{version}.jar',
+  'org.eclipse.update.feature': 'features/{id}_{version}.jar',
+  'binary': 'binary/{id}_{version}',
+}
+
+_metadataHeader = '''<?xml version='1.0' encoding='UTF-8'?>
+<?metadataRepository version='1.1.0'?>
+'''
+_artifactsHeader = '''<?xml version='1.0' encoding='UTF-8'?>
+<?artifactRepository version='1.1.0'?>
+'''
+
+
+class P2Mirror(object):
+  """
+  Local mirror of remote p2 repositories, holding only the installable units that are installed into Eclipse instances,
+  and the units they depend on, such that Eclipse instances are generated without downloading from remote repositories.
+
+  Source repositories are mirrored in groups, each group into a p2 repository in a subdirectory of the mirror, such
+  that generators can leave out a group, for example to install Spoofax from a locally built repository instead. The
+  checksums of artifacts are verified when they are downloaded. Versions of units that are no longer required are
+  evicted least recently used first, keeping at most `keepVersions` versions of each unit, but always keeping the
+  versions that are required.
+  """
+
+  def __init__(self, location, keepVersions=2, jobs=8):
+    self.location = os.path.abspath(location)
+    self.keepVersions = keepVersions
+    self.jobs = jobs
+
+  def sync(self, sources, ius):
+    """
+    Mirrors given installable units, and the units they depend on, from given source repositories.
+
+    The dependency closure includes the units of all operating systems and architectures, since filters of units are
+    ignored. Of each unit that provides a required capability, the highest version that satisfies the requirement is
+    mirrored. Optional requirements are followed when a source provides them, unless they are not greedy.
+
+    :param sources: Dictionary from group name to list of URLs of source repositories, which may be composite.
+    :param ius: Identifiers of the installable units to mirror, of which the highest versions are mirrored.
+    """
+    print('Reading metadata of source repositories')
+    groupOfUnit = {}
+    units = {}
+    artifacts = {}
+    for group, urls in sources.items():
+      for url in urls:
+        for unit, artifactDescriptors, repoUrl in _read_repositories(url):
+          if unit.key not in units:
+            units[unit.key] = unit
+            groupOfUnit[unit.key] = group
+          for key, descriptor in artifactDescriptors.items():
+            artifacts.setdefault(key, (repoUrl,) + descriptor)
+
+    closure = _closure(units, ius)
+    now = time.time()
+    index = self.__read_index()
+    groups = {}
+    for key in closure:
+      groups.setdefault(groupOfUnit[key], []).append(units[key])
+
+    for group in set(groups) | set(index['groups']):
+      groupUnits = groups.get(group, [])
+      lastUsed = index['groups'].setdefault(group, {})
+      for unit in groupUnits:
+        lastUsed[unit.key] = now
+      self.__sync_group(group, groupUnits, artifacts, lastUsed)
+
+    index['sources'] = sources
+    index['ius'] = sorted(set(ius))
+    index['synced'] = now
+    self.__write_index(index)
+
+  def verify(self):
+    """
+    Verifies the checksums of all artifacts in the mirror, and deletes artifacts that do not match their checksum, such
+    that the next sync downloads them again. Returns the number of deleted artifacts.
+    """
+    corrupted = []
+    for group in self.__read_index()['groups']:
+      groupDir = os.path.join(self.location, group)
+      descriptors = self.__read_artifact_descriptors(groupDir)
+      paths = [(os.path.join(groupDir, path), checksum) for path, checksum, _ in descriptors.values()]
+      with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+        for (path, checksum), valid in zip(paths, executor.map(lambda item: _verified(*item), paths)):
+          if not valid:
+            corrupted.append(path)
+    for path in corrupted:
+      print('Deleting corrupted or missing artifact {}'.format(path))
+      if os.path.isfile(path):
+        os.remove(path)
+    return len(corrupted)
+
+  def check(self, groups, ius):
+    """
+    Checks that given groups were mirrored, that given installable units were mirrored, and that the artifacts of the
+    groups exist with their expected size. Raises a RuntimeError if not.
+    """
+    index = self.__read_index()
+    missingGroups = [group for group in groups if group not in index['groups']]
+    if missingGroups:
+      raise RuntimeError('p2 mirror {} does not mirror {}, run b p2-mirror sync first'.format(self.location,
+        ', '.join(missingGroups)))
+    missingIUs = [iu for iu in ius if iu not in index['ius']]
+    if missingIUs:
+      raise RuntimeError('p2 mirror {} does not mirror installable units {}, run b p2-mirror sync with -i {}'.format(
+        self.location, ', '.join(missingIUs), ' -i '.join(missingIUs)))
+    for group in groups:
+      groupDir = os.path.join(self.location, group)
+      for path, _, element in self.__read_artifact_descriptors(groupDir).values():
+        size = _descriptor_properties(element).get('download.size')
+        location = os.path.join(groupDir, path)
+        if not os.path.isfile(location) or (size and os.path.getsize(location) != int(size)):
+          raise RuntimeError('Artifact {} of p2 mirror {} is missing or incomplete, run b p2-mirror sync first'.format(
+            location, self.location))
+
+  def repositories(self, repos):
+    """
+    Returns given list of repositories, with the repositories that are mirrored replaced by the mirror of their group,
+    and the names of those groups.
+    """
+    if not os.path.isfile(os.path.join(self.location, _indexName)):
+      raise RuntimeError('{} is not a p2 mirror, run b p2-mirror sync first'.format(self.location))
+    sources = self.__read_index()['sources']
+    groupOfSource = {_normalize_url(url): group for group, urls in sources.items() for url in urls}
+    result = []
+    groups = []
+    for repo in repos:
+      group = groupOfSource.get(_normalize_url(repo))
+      if not group:
+        result.append(repo)
+      elif group not in groups:
+        groups.append(group)
+        result.append(os.path.join(self.location, group))
+    return result, groups
+
+  def __sync_group(self, group, units, artifacts, lastUsed):
+    groupDir = os.path.join(self.location, group)
+    keys = {unit.key for unit in units}
+    # Keep units of earlier syncs that are not required any more, from the metadata in the mirror.
+    oldUnits = [unit for unit in _read_units(groupDir) if unit.key not in keys and unit.key in lastUsed]
+    oldDescriptors = self.__read_artifact_descriptors(groupDir)
+    kept, evicted = self.__evict(units, oldUnits, lastUsed)
+    for unit in evicted:
+      print('Evicting {} from p2 mirror group {}'.format(unit.key, group))
+      del lastUsed[unit.key]
+
+    descriptors = {}
+    downloads = []
+    for unit in kept:
+      for key in unit.artifacts:
+        if key in descriptors:
+          continue
+        if unit.key in keys and key in artifacts:
+          repoUrl, sourcePath, checksum, element = artifacts[key]
+          path = _mirror_path(key)
+          if not path:
+            print('Skipping artifact {} with unsupported classifier'.format(' '.join(key)))
+            continue
+          descriptors[key] = (path, checksum, element)
+          downloads.append((repoUrl, sourcePath, os.path.join(groupDir, path), checksum))
+        elif key in oldDescriptors:
+          descriptors[key] = oldDescriptors[key]
+        else:
+          print('Skipping artifact {} that no source repository has'.format(' '.join(key)))
+
+    self.__download(downloads)
+    paths = {path for path, _, _ in descriptors.values()}
+    for path, _, _ in oldDescriptors.values():
+      location = os.path.join(groupDir, path)
+      if path not in paths and os.path.isfile(location):
+        os.remove(location)
+
+    _write_metadata(groupDir, group, kept)
+    _write_artifacts(groupDir, group, descriptors)
+    print('Mirrored {} installable units with {} artifacts into {}'.format(len(kept), len(descriptors), groupDir))
+
+  def __evict(self, units, oldUnits, lastUsed):
+    """
+    Returns the units to keep: all given required units, and old units that are among the `keepVersions` most recently
+    used versions of their unit identifier, and the old units to evict.
+    """
+    versions = {}
+    for unit in units + oldUnits:
+      versions.setdefault(unit.id, []).append(unit)
+    required = {unit.key for unit in units}
+    kept = list(units)
+    evicted = []
+    for unitVersions in versions.values():
+      unitVersions.sort(key=lambda unit: (lastUsed.get(unit.key, 0), parse_version(unit.version)), reverse=True)
+      for position, unit in enumerate(unitVersions):
+        if unit.key in required:
+          continue
+        if position < self.keepVersions:
+          kept.append(unit)
+        else:
+          evicted.append(unit)
+    return kept, evicted
+
+  def __download(self, downloads):
+    uploaders = {}
+    for repoUrl, _, _, _ in downloads:
+      if repoUrl not in uploaders:
+        uploaders[repoUrl] = create_uploader(repoUrl, jobs=self.jobs)
+
+    def download(item):
+      repoUrl, sourcePath, location, checksum = item
+      if os.path.isfile(location) and _verified(location, checksum):
+        return False
+      _download_artifact(uploaders[repoUrl], sourcePath, location, checksum)
+      return True
+
+    with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+      downloaded = sum(executor.map(download, downloads))
+    print('Downloaded {} artifacts, {} were already mirrored'.format(downloaded, len(downloads) - downloaded))
+
+  @staticmethod
+  def __read_artifact_descriptors(groupDir):
+    content = _read_local(groupDir, 'artifacts')
+    if content is None:
+      return {}
+    return artifact_descriptors(content)
+
+  def __read_index(self):
+    path = os.path.join(self.location, _indexName)
+    if not os.path.isfile(path):
+      return {'sources': {}, 'ius': [], 'groups': {}}
+    with open(path) as file:
+      return json.load(file)
+
+  def __write_index(self, index):
+    path = os.path.join(self.location, _indexName)
+    temporaryPath = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporaryPath, 'w') as file:
+      json.dump(index, file, indent=2, sort_keys=True)
+    os.replace(temporaryPath, path)
+
+
+def _read_repositories(url):
+  """
+  Yields the installable units, artifact descriptors, and URL, of the repository at given URL, or of each of its
+  children if it is a composite repository.
+  """
+  url = url.rstrip('/')
+  reader = create_uploader(url)
+  children = read_repository_xml('compositeContent', reader.download)
+  if children is not None:
+    for child in composite_children(children):
+      childUrl = child if '://' in child or os.path.isabs(child) else '{}/{}'.format(url, child)
+      for repository in _read_repositories(childUrl):
+        yield repository
+    return
+  content = read_repository_xml('content', reader.download)
+  if content is None:
+    raise RuntimeError('{} is not a p2 repository'.format(url))
+  artifactsXml = read_repository_xml('artifacts', reader.download)
+  descriptors = artifact_descriptors(artifactsXml) if artifactsXml is not None else {}
+  for unit in repository_units(content):
+    yield unit, descriptors, url
+
+
+def _closure(units, ius):
+  """
+  Returns the keys of given installable units with given identifiers, and all units they require. Of each unit that
+  provides a required capability, the highest version that satisfies the requirement is included, such that the
+  planner can choose between providers. Non-greedy requirements are followed unless they are optional, since the
+  planner does not install their providers, but requires them to be installed. Raises a RuntimeError when a required
+  match expression is not supported, instead of leaving out the units it requires.
+  """
+  # Providers by (namespace, name) for requirements on a name, and by namespace for requirements with a filter.
+  providers = {}
+  latest = {}
+  for unit in units.values():
+    for capability in unit.provides:
+      candidate = (parse_version(capability.version), capability, unit)
+      providers.setdefault((capability.namespace, capability.name), []).append(candidate)
+      providers.setdefault(capability.namespace, []).append(candidate)
+    if unit.id not in latest or parse_version(unit.version) > parse_version(latest[unit.id].version):
+      latest[unit.id] = unit
+  for candidates in providers.values():
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+  missing = [iu for iu in ius if iu not in latest]
+  if missing:
+    raise RuntimeError('Source repositories do not have installable units {}'.format(', '.join(missing)))
+
+  closure = set()
+  work = [latest[iu] for iu in ius]
+  while work:
+    unit = work.pop()
+    if unit.key in closure:
+      continue
+    closure.add(unit.key)
+    for requirement in unit.requires:
+      if requirement.optional and not requirement.greedy:
+        continue
+      if not requirement.supported:
+        if not requirement.optional:
+          raise RuntimeError('{} requires {}, which is not a supported match expression'.format(unit.key,
+            requirement))
+        print('Warning: not following optional requirement {} of {}, which is not a supported match expression'.format(
+          requirement, unit.key))
+        continue
+      if requirement.name is not None:
+        candidates = providers.get((requirement.namespace, requirement.name), [])
+      else:
+        candidates = providers.get(requirement.namespace, [])
+      providerIds = set()
+      for _, capability, provider in candidates:
+        if provider.id not in providerIds and requirement.matches(capability):
+          providerIds.add(provider.id)
+          work.append(provider)
+      if not providerIds and not requirement.optional:
+        print('Warning: {} requires {}, which no source repository provides'.format(unit.key, requirement))
+  return closure
+
+
+def _download_artifact(uploader, sourcePath, location, checksum):
+  """
+  Downloads an artifact to given location, replacing it atomically after verifying its checksum.
+  """
+  print('Downloading {}'.format(uploader.remote_url(sourcePath)))
+  os.makedirs(os.path.dirname(location), exist_ok=True)
+  temporaryLocation = '{}.{}.tmp'.format(location, uuid.uuid4().hex)
+  digest = hashlib.new(checksum[0]) if checksum else None
+  try:
+    with open(temporaryLocation, 'wb') as file:
+      if isinstance(uploader, HttpUploader):
+        response = uploader.request('GET', sourcePath, stream=True)
+        chunks = response.iter_content(1024 * 1024)
+      else:
+        chunks = _read_chunks(uploader.remote_url(sourcePath))
+      for chunk in chunks:
+        file.write(chunk)
+        if digest:
+          digest.update(chunk)
+    if digest and digest.hexdigest() != checksum[1]:
+      raise RuntimeError('{} checksum of {} is {}, but expected {}'.format(checksum[0], uploader.remote_url(sourcePath),
+        digest.hexdigest(), checksum[1]))
+    os.replace(temporaryLocation, location)
+  finally:
+    if os.path.isfile(temporaryLocation):
+      os.remove(temporaryLocation)
+
+
+def _read_chunks(path):
+  with open(path, 'rb') as file:
+    while True:
+      chunk = file.read(1024 * 1024)
+      if not chunk:
+        return
+      yield chunk
+
+
+def _verified(location, checksum):
+  if not os.path.isfile(location):
+    return False
+  if not checksum:
+    return True
+  digest = hashlib.new(checksum[0])
+  for chunk in _read_chunks(location):
+    digest.update(chunk)
+  return digest.hexdigest() == checksum[1]
+
+
+def _mirror_path(key):
+  classifier, unitId, version = key
+  if classifier not in _mappings:
+    return None
+  return _mappings[classifier].format(id=unitId, version=version)
+
+
+def _descriptor_properties(element):
+  return {prop.get('name'): prop.get('value') for prop in element.iterfind('properties/property')}
+
+
+def _read_local(groupDir, name):
+  return read_repository_xml(name, create_uploader(groupDir).download)
+
+
+def _read_units(groupDir):
+  content = _read_local(groupDir, 'content')
+  if content is None:
+    return []
+  return repository_units(content)
+
+
+def _write_metadata(groupDir, group, units):
+  root = ET.Element('repository', {'name': 'Metaborg p2 mirror: {}'.format(group),
+    'type': 'org.eclipse.equinox.internal.p2.metadata.repository.LocalMetadataRepository', 'version': '1'})
+  _add_properties(root)
+  unitsElement = ET.SubElement(root, 'units', {'size': str(len(units))})
+  for unit in sorted(units, key=lambda unit: unit.key):
+    unitsElement.append(unit.element)
+  _write_xml(os.path.join(groupDir, 'content.xml'), _metadataHeader, root)
+
+
+def _write_artifacts(groupDir, group, descriptors):
+  root = ET.Element('repository', {'name': 'Metaborg p2 mirror: {}'.format(group),
+    'type': 'org.eclipse.equinox.p2.artifact.repository.simpleRepository', 'version': '1'})
+  _add_properties(root)
+  mappings = ET.SubElement(root, 'mappings', {'size': str(len(_mappings))})
+  for classifier, path in sorted(_mappings.items()):
+    ET.SubElement(mappings, 'rule', {'filter': '(& (classifier={}))'.format(classifier),
+      'output': '${{repoUrl}}/{}'.format(path.replace('{id}', '${id}').replace('{version}', '${version}'))})
+  artifacts = ET.SubElement(root, 'artifacts', {'size': str(len(descriptors))})
+  for key in sorted(descriptors):
+    element = descriptors[key][2]
+    # Mirrored artifacts are in their canonical format, without processing steps.
+    for processing in element.findall('processing'):
+      element.remove(processing)
+    artifacts.append(element)
+  _write_xml(os.path.join(groupDir, 'artifacts.xml'), _artifactsHeader, root)
+
+
+def _add_properties(root):
+  properties = ET.SubElement(root, 'properties', {'size': '1'})
+  ET.SubElement(properties, 'property', {'name': 'p2.timestamp', 'value': str(int(time.time() * 1000))})
+
+
+def _write_xml(path, header, root):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  temporaryPath = '{}.{}.tmp'.format(path, os.getpid())
+  with open(temporaryPath, 'wb') as file:
+    file.write(header.encode('utf-8'))
+    file.write(ET.tostring(root, encoding='unicode').encode('utf-8'))
+  os.replace(temporaryPath, path)
+  # Remove compressed metadata of earlier syncs, which p2 would read instead.
+  for extension in ['.jar', '.xml.xz']:
+    stale = path[:-len('.xml')] + extension
+    if os.path.isfile(stale):
+      os.remove(stale)
+
+
+def _normalize_url(url):
+  return url.rstrip('/')
@@ -0,0 +1,113 @@
+import os
+import shutil
+from copy import copy
+
+from metaborg.releng.maven import maven_config_dir, write_aggregator_pom
+
+
+class FusedReactor(object):
+  """
+  Group of build steps that each build a single Maven reactor, which are built together in one aggregated reactor.
+  """
+
+  def __init__(self, stepIds, directories, forceQualifier, cleanDirectories, location):
+    """
+    :param stepIds: Identifiers of the steps in the group, the first step is the leader that builds the fused reactor.
+    :param directories: Reactor directories of the steps, in the same order.
+    :param forceQualifier: Whether the Eclipse qualifier is forced when building the reactors.
+    :param cleanDirectories: Reactor directories that must always be cleaned before building.
+    :param location: Directory to generate the aggregator POM in.
+    """
+    self.stepIds = stepIds
+    self.directories = directories
+    self.forceQualifier = forceQualifier
+    self.cleanDirectories = cleanDirectories
+    self.location = location
+    self.built = False
+
+  @property
+  def leader(self):
+    return self.stepIds[0]
+
+  def build(self, eclipseQualifier, maven, mavenDeployer, **_):
+    print('Building reactors of steps {} in a single reactor'.format(', '.join(self.stepIds)))
+    if 'clean' not in maven.targets or maven.smartClean:
+      # Fully clean these reactors, since the fused reactor is not cleaned, or only smart cleaned.
+      cleaner = copy(maven)
+      cleaner.targets = []
+      cleaner.smartClean = None
+      for directory in self.cleanDirectories:
+        cleaner.run_in_dir(directory, 'clean')
+
+    shutil.rmtree(self.location, ignore_errors=True)
+    write_aggregator_pom(self.location, 'build.fused.{}'.format(self.leader), self.directories)
+    # Core extensions and configuration are loaded from the .mvn directory that Maven finds from the directory it is run
+    # in. Steps are only fused when the .mvn directories of their reactors have identical extensions and configuration.
+    configDir = maven_config_dir(self.directories[0])
+    if configDir:
+      shutil.copytree(configDir, os.path.join(self.location, '.mvn'))
+
+    target = 'deploy' if mavenDeployer else 'install'
+    properties = {'forceContextQualifier': eclipseQualifier} if self.forceQualifier else {}
+    maven.run_in_dir(self.location, target, **properties)
+    self.built = True
+
+
+class ReactorFusion(object):
+  """
+  Build step interceptor that builds the Maven reactors of a group of steps in a single Maven run when executing the
+  leader of the group, and skips the Maven runs of each step in the group for reactors that were already built in that
+  run. The steps themselves are still executed to produce their results. When the leader is not executed, or skipped,
+  the other steps in its group build their reactors themselves.
+  """
+
+  def __init__(self, reactors):
+    self.reactors = reactors
+    self.__reactorOfStep = {stepId: reactor for reactor in reactors for stepId in reactor.stepIds}
+
+  def intercept(self, step, options, proceed):
+    reactor = self.__reactorOfStep.get(step.identifier)
+    if not reactor:
+      return proceed()
+    if step.identifier == reactor.leader:
+      reactor.build(**options)
+    if reactor.built:
+      options['maven'].prebuilt.update(os.path.normpath(directory) for directory in reactor.directories)
+    return proceed()
+
+
+def fuse_reactor_steps(depGraph, buildOrder, reactorDirs, fusionKeys):
+  """
+  Groups steps that build a single Maven reactor into groups that can be built as a single reactor. A step joins a
+  group when it has the same fusion key as the group, and all of its dependencies are in the group or are dependencies
+  of the leader of the group, such that the group can be built when the leader is ready to be built.
+
+  :param depGraph: Dictionary from identifiers of steps to execute to identifiers of steps they depend on.
+  :param buildOrder: Identifiers of steps to execute in dependency order.
+  :param reactorDirs: Dictionary from identifiers of steps that build a single reactor, to the reactor directory.
+  :param fusionKeys: Dictionary from step identifiers to a key. Only steps with equal keys are grouped.
+  :return: List of groups with more than one step, as lists of step identifiers with the leader first.
+  """
+  ancestors = {}
+
+  def ancestors_of(stepId):
+    if stepId not in ancestors:
+      result = set()
+      for depId in depGraph.get(stepId, set()):
+        result.add(depId)
+        result.update(ancestors_of(depId))
+      ancestors[stepId] = result
+    return ancestors[stepId]
+
+  groups = []
+  for stepId in buildOrder:
+    if stepId not in reactorDirs:
+      continue
+    for group in groups:
+      leader = group[0]
+      if fusionKeys[leader] == fusionKeys[stepId] and depGraph[stepId] <= set(group) | ancestors_of(leader):
+        group.append(stepId)
+        break
+    else:
+      groups.append([stepId])
+  return [group for group in groups if len(group) > 1]
@@ -341,7 +341,8 @@ class MetaborgRelease(object):
           return
 
         print('DONE')
-        self.reset()
+        # Resetting would delete the state while it is open, after which closing it writes the state again.
+        db.clear()
 
       steps = {
         0 : Step0,
@@ -390,8 +391,11 @@ class MetaborgRelease(object):
 
   def reset(self):
     location = self.__shelve_location()
-    if os.path.isfile(location):
-      os.remove(location)
+    # Depending on the database module, shelve stores the state in the location itself, or in files with extensions.
+    directory, name = path.split(location)
+    for fileName in os.listdir(directory):
+      if fileName == name or fileName.startswith(name + '.'):
+        os.remove(path.join(directory, fileName))
 
   def __shelve_location(self):
     return path.join(path.expanduser('~'), '.spoofax-releng-release-state')
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metaborg.util.process import observe_processes
+
+
+class StepTrace(object):
+  def __init__(self, name, category, start, lane):
+    self.name = name
+    self.category = category
+    self.start = start
+    self.end = None
+    self.lane = lane
+    self.status = 'running'
+    self.processes = []
+
+  @property
+  def duration(self):
+    return (self.end or time.time()) - self.start
+
+  @property
+  def cpuTime(self):
+    times = [process.cpuTime for process in self.processes if process.cpuTime is not None]
+    return sum(times) if times else None
+
+  @property
+  def maxRss(self):
+    rss = [process.maxRss for process in self.processes if process.maxRss is not None]
+    return max(rss) if rss else None
+
+
+class BuildTrace(object):
+  """
+  Build step interceptor that records the start and end time and status of each step, and the CPU time, peak memory
+  usage, and exit status of the Maven and Gradle processes each step runs. Phases of the build outside of steps, such as
+  deployment, can be recorded with `phase`.
+  """
+
+  def __init__(self):
+    self.start = time.time()
+    self.traces = []
+    self.__lanes = {}
+    self.__lock = threading.Lock()
+
+  def intercept(self, step, options, proceed):
+    with self.__record(step.identifier, 'step'):
+      return proceed()
+
+  @contextmanager
+  def phase(self, name):
+    with self.__record(name, 'phase'):
+      yield
+
+  def write_chrome_trace(self, location):
+    """
+    Writes the trace in Chrome's trace event format, which can be viewed with chrome://tracing.
+    """
+    events = []
+    for lane in sorted(set(self.__lanes.values())):
+      events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane, 'args': {'name': 'Lane {}'.format(lane)}})
+    for trace in self.traces:
+      events.append({
+        'name': trace.name, 'cat': trace.category, 'ph': 'X', 'pid': 1, 'tid': trace.lane,
+        'ts'  : self.__micros(trace.start),
+        'dur' : self.__micros(trace.start + trace.duration) - self.__micros(trace.start),
+        'args': {'status': trace.status, 'cpuTime': trace.cpuTime, 'maxRss': trace.maxRss},
+      })
+      for process in trace.processes:
+        events.append({
+          'name': process.cmd.split(' ', 1)[0], 'cat': 'process', 'ph': 'X', 'pid': 1, 'tid': trace.lane,
+          'ts'  : self.__micros(process.start), 'dur': self.__micros(process.end) - self.__micros(process.start),
+          'args': {
+            'command'   : process.cmd, 'directory': process.cwd, 'exitStatus': process.returncode,
+            'userTime'  : process.userTime, 'systemTime': process.systemTime, 'maxRss': process.maxRss,
+          },
+        })
+    with open(location, 'w') as file:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, indent=1)
+    print('Wrote build trace to {}'.format(location))
+
+  def write_record(self, directory, keep=100, **properties):
+    """
+    Writes a machine-readable record of the build into a new JSON file in given directory, with given properties, and
+    the steps of the build with the processes they ran and the information parsed from the output of those processes.
+    Reports Maven modules that became slower since the previous record. Only the `keep` latest records are kept.
+    """
+    steps = []
+    for trace in sorted(self.traces, key=lambda t: t.start):
+      processes = []
+      for process in trace.processes:
+        processes.append({
+          'command'   : process.cmd, 'directory': process.cwd, 'exitStatus': process.returncode,
+          'duration'  : process.duration, 'cpuTime': process.cpuTime, 'maxRss': process.maxRss,
+          'output'    : process.outputParser.record() if process.outputParser else None,
+        })
+      steps.append({'name': trace.name, 'category': trace.category, 'status': trace.status,
+        'duration': trace.duration, 'processes': processes})
+    record = dict(properties, start=self.start, duration=time.time() - self.start, steps=steps)
+
+    os.makedirs(directory, exist_ok=True)
+    previousLocations = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    name = 'build-{}.json'.format(time.strftime('%Y%m%d-%H%M%S', time.localtime(self.start)))
+    location = os.path.join(directory, name)
+    with open(location, 'w') as file:
+      json.dump(record, file, indent=1)
+    print('Wrote build record to {}'.format(location))
+
+    if previousLocations:
+      with open(os.path.join(directory, previousLocations[-1])) as file:
+        _print_slowdowns(json.load(file), record)
+    for name in previousLocations[:max(len(previousLocations) + 1 - keep, 0)]:
+      os.remove(os.path.join(directory, name))
+
+  def print_summary(self):
+    rows = [('Step', 'Status', 'Wall time', 'CPU time', 'Peak RSS', 'Processes')]
+    for trace in sorted(self.traces, key=lambda t: t.start):
+      rows.append((trace.name, trace.status, _format_seconds(trace.duration), _format_seconds(trace.cpuTime),
+      _format_bytes(trace.maxRss), str(len(trace.processes))))
+    rows.append(('Total', '', _format_seconds(time.time() - self.start), '', '', ''))
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    for row in rows:
+      print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+  @contextmanager
+  def __record(self, name, category):
+    with self.__lock:
+      trace = StepTrace(name, category, time.time(), self.__lane())
+      self.traces.append(trace)
+    try:
+      with observe_processes(trace.processes.append):
+        yield trace
+      trace.status = 'success'
+    except BaseException:
+      trace.status = 'failed'
+      raise
+    finally:
+      trace.end = time.time()
+
+  def __lane(self):
+    thread = threading.get_ident()
+    if thread not in self.__lanes:
+      self.__lanes[thread] = len(self.__lanes) + 1
+    return self.__lanes[thread]
+
+  def __micros(self, timestamp):
+    return int((timestamp - self.start) * 1000000)
+
+
+def module_durations(record):
+  """
+  Returns a dictionary from the name of each Maven module that was built successfully in given build record to its
+  duration in seconds.
+  """
+  durations = {}
+  for step in record['steps']:
+    for process in step['processes']:
+      for module in (process.get('output') or {}).get('modules', []):
+        if module['status'] == 'SUCCESS' and module['duration'] is not None:
+          durations[module['name']] = durations.get(module['name'], 0) + module['duration']
+  return durations
+
+
+def _print_slowdowns(previousRecord, record, minSeconds=10, minFactor=1.5):
+  previous = module_durations(previousRecord)
+  slowdowns = []
+  for name, duration in module_durations(record).items():
+    if name in previous and duration - previous[name] >= minSeconds and duration >= previous[name] * minFactor:
+      slowdowns.append((duration - previous[name], name, previous[name], duration))
+  if slowdowns:
+    print('Maven modules that became slower since the previous build:')
+    for _, name, previousDuration, duration in sorted(slowdowns, reverse=True):
+      print('  {}: {} -> {}'.format(name, _format_seconds(previousDuration), _format_seconds(duration)))
+
+
+def _format_seconds(seconds):
+  if seconds is None:
+    return '-'
+  if seconds < 60:
+    return '{:.1f}s'.format(seconds)
+  minutes, seconds = divmod(int(round(seconds)), 60)
+  hours, minutes = divmod(minutes, 60)
+  if hours:
+    return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds)
+  if minutes:
+    return '{}m{:02d}s'.format(minutes, seconds)
+  return '{}s'.format(seconds)
+
+
+def _format_bytes(size):
+  if size is None:
+    return '-'
+  for unit in ['B', 'KB', 'MB']:
+    if size < 1024:
+      return '{:.0f}{}'.format(size, unit)
+    size /= 1024
+  return '{:.1f}GB'.format(size)
@@ -0,0 +1,403 @@
+import collections
+import hashlib
+import os
+import struct
+import tarfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the blocks that are compressed concurrently, and of the window of preceding data that primes the compression
+# of each block, as in pigz.
+_blockSize = 128 * 1024
+_windowSize = 32 * 1024
+# Final empty deflate block, which ends a deflate stream whose blocks all end with a sync flush.
+_finalBlock = b'\x03\x00'
+
+# Minimum size of files whose compressed data is cached, smaller files are cheaper to compress than to cache.
+_minCachedSize = 64 * 1024
+
+_zip64Limit = 0xFFFFFFFF
+_zipUtf8Flag = 0x800
+
+# Position in an archive, after which entries can be replaced by appending other entries to a copy of the part of the
+# archive before the position. `offset` is the size of the part of the archive file before the position, `tarOffset`
+# the size of the uncompressed tar stream before the position, and `records` the central directory records of ZIP
+# entries before the position.
+ArchiveMark = collections.namedtuple('ArchiveMark', ['offset', 'tarOffset', 'records'])
+
+
+def open_archive(location, archiveFormat, jobs=None, base=None, mark=None, cache=None):
+  """
+  Opens an archive for writing at given location, compressing on at most `jobs` threads, defaulting to the number of
+  CPUs.
+
+  :param archiveFormat: Format of the archive as named by shutil.make_archive: 'gztar' or 'zip'.
+  :param base: Location of an archive to extend, whose part before `mark`, a mark of its writer, is copied to the new
+               archive without compressing it again.
+  :param cache: CompressionCache to reuse the compressed data of large files from, or None to compress all files.
+  :return: TarGzWriter or ZipWriter.
+  """
+  if archiveFormat == 'gztar':
+    return TarGzWriter(location, jobs, base, mark, cache)
+  if archiveFormat == 'zip':
+    return ZipWriter(location, jobs, base, mark, cache)
+  raise RuntimeError('Unsupported archive format {}'.format(archiveFormat))
+
+
+def tree_entries(directory, arcBase, exclude=()):
+  """
+  Returns the (path, archive name) tuples of given directory and everything in it, parents before their children, in
+  a deterministic order. Archive names are relative to the directory, prefixed with `arcBase`, which is the archive
+  name of the directory itself. Paths in `exclude` are left out.
+  """
+  exclude = {os.path.normpath(path) for path in exclude}
+  entries = [(directory, arcBase)]
+  for root, dirNames, fileNames in os.walk(directory):
+    dirNames[:] = sorted(name for name in dirNames if os.path.normpath(os.path.join(root, name)) not in exclude)
+    relativeRoot = os.path.relpath(root, directory)
+    arcRoot = arcBase if relativeRoot == '.' else '{}/{}'.format(arcBase, relativeRoot.replace(os.sep, '/'))
+    for name in dirNames + sorted(fileNames):
+      path = os.path.join(root, name)
+      if os.path.normpath(path) not in exclude:
+        entries.append((path, '{}/{}'.format(arcRoot, name)))
+  return entries
+
+
+class CompressionCache(object):
+  """
+  Cache of compressed file contents in a directory, keyed by the SHA-256 hash of the content, such that files that are
+  in multiple archives are compressed once. Contents are compressed into raw deflate streams without preset dictionary
+  that end with a sync flush, such that they can be inserted into the deflate stream of a gzip file, or be completed
+  into the data of a ZIP entry. Can be used from multiple threads and processes at the same time.
+  """
+
+  def __init__(self, location, level=6):
+    self.location = location
+    self.level = level
+
+  def compress(self, data):
+    """
+    Returns the cached compressed data of given content, compressing and caching it if it is not cached yet.
+    """
+    key = hashlib.sha256(data).hexdigest()
+    path = os.path.join(self.location, key[:2], key)
+    if os.path.isfile(path):
+      with open(path, 'rb') as file:
+        return file.read()
+    compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporaryPath = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temporaryPath, 'wb') as file:
+      file.write(compressed)
+    os.replace(temporaryPath, path)
+    return compressed
+
+
+class ParallelGzipWriter(object):
+  """
+  File-like object that gzip compresses data written to it into `fileobj`, compressing blocks of data concurrently on
+  at most `jobs` threads. Like pigz, each block is compressed with the preceding 32 KiB of data as dictionary, and ends
+  with a sync flush, such that the compressed blocks concatenate into a single deflate stream.
+
+  `finish_member` ends the current gzip member, after which writes start a new member. Files with multiple members are
+  valid gzip files, which decompress to the concatenation of their members. `begin_precompressed` inserts compressed
+  data, such as from a CompressionCache, into the deflate stream instead of compressing the data again.
+  """
+
+  def __init__(self, fileobj, jobs=None, level=6, offset=0):
+    self.fileobj = fileobj
+    self.level = level
+    self.jobs = jobs or os.cpu_count() or 1
+    self.__executor = ThreadPoolExecutor(max_workers=self.jobs)
+    self.__pending = collections.deque()
+    self.__buffer = bytearray()
+    self.__window = b''
+    self.__memberStarted = False
+    self.__crc = 0
+    self.__size = 0
+    self.__position = offset
+    self.__skip = 0
+
+  def write(self, data):
+    if not self.__memberStarted:
+      self.__start_member()
+    length = len(data)
+    self.__position += length
+    if self.__skip:
+      # Data of begin_precompressed, which is already compressed.
+      skipped = min(self.__skip, length)
+      self.__skip -= skipped
+      data = data[skipped:]
+    self.__buffer.extend(data)
+    while len(self.__buffer) >= _blockSize:
+      block = bytes(self.__buffer[:_blockSize])
+      del self.__buffer[:_blockSize]
+      self.__submit(block)
+    return length
+
+  def begin_precompressed(self, data, compress):
+    """
+    Compresses `data` with given function, instead of in blocks, and skips the next `len(data)` bytes that are written,
+    which must be `data`. The function must return a raw deflate stream without preset dictionary that ends with a sync
+    flush, such as CompressionCache.compress, and is called on a thread of this writer.
+    """
+    if not self.__memberStarted:
+      self.__start_member()
+    if self.__buffer:
+      self.__submit(bytes(self.__buffer))
+      self.__buffer = bytearray()
+    self.__skip = len(data)
+    self.__submit(data, compress)
+
+  def tell(self):
+    """
+    Returns the position in the uncompressed data.
+    """
+    return self.__position
+
+  def finish_member(self):
+    """
+    Ends the current gzip member, and returns the size of the compressed file.
+    """
+    if self.__memberStarted:
+      if self.__buffer:
+        self.__submit(bytes(self.__buffer))
+        self.__buffer = bytearray()
+      while self.__pending:
+        self.__write_oldest()
+      self.fileobj.write(_finalBlock)
+      self.fileobj.write(struct.pack('<LL', self.__crc & 0xFFFFFFFF, self.__size & 0xFFFFFFFF))
+      self.__memberStarted = False
+    return self.fileobj.tell()
+
+  def close(self):
+    # An empty file is not a valid gzip file, write an empty member instead.
+    if not self.__memberStarted and not self.fileobj.tell():
+      self.__start_member()
+    self.finish_member()
+    self.__executor.shutdown()
+
+  def flush(self):
+    pass
+
+  def __start_member(self):
+    self.fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<L', int(time.time())) + b'\x00\xff')
+    self.__window = b''
+    self.__crc = 0
+    self.__size = 0
+    self.__memberStarted = True
+
+  def __submit(self, block, compress=None):
+    if compress:
+      future = self.__executor.submit(compress, block)
+    else:
+      future = self.__executor.submit(_deflate_block, block, self.__window, self.level)
+    self.__pending.append((block, future))
+    self.__window = block[-_windowSize:] if len(block) >= _windowSize else (self.__window + block)[-_windowSize:]
+    # Bound the memory usage of blocks that are compressed but not written yet.
+    while len(self.__pending) > self.jobs * 2:
+      self.__write_oldest()
+
+  def __write_oldest(self):
+    block, future = self.__pending.popleft()
+    self.fileobj.write(future.result())
+    self.__crc = zlib.crc32(block, self.__crc)
+    self.__size += len(block)
+
+
+class TarGzWriter(object):
+  """
+  Writes a gzip compressed tar archive, compressing with a ParallelGzipWriter. The compressed data of large regular
+  files is taken from `cache` when set.
+  """
+
+  def __init__(self, location, jobs=None, base=None, mark=None, cache=None):
+    self.location = location
+    self.cache = cache
+    self.__file = open(location, 'wb')
+    tarOffset = 0
+    if base:
+      _copy_prefix(base, self.__file, mark.offset)
+      tarOffset = mark.tarOffset
+    self.__gzip = ParallelGzipWriter(self.__file, jobs, offset=tarOffset)
+    self.__tar = tarfile.TarFile(fileobj=self.__gzip, mode='w')
+
+  def add(self, path, arcname):
+    if self.cache and not os.path.islink(path) and os.path.isfile(path) and os.path.getsize(path) >= _minCachedSize:
+      tarinfo = self.__tar.gettarinfo(path, arcname)
+      with open(path, 'rb') as file:
+        data = file.read()
+      self.__tar.addfile(tarinfo, _PrecompressedFile(data, self.__gzip, self.cache.compress))
+    else:
+      self.__tar.add(path, arcname, recursive=False)
+
+  def mark(self):
+    """
+    Returns a mark of the current position, after which entries can be replaced by extending this archive.
+    """
+    offset = self.__gzip.finish_member()
+    return ArchiveMark(offset, self.__gzip.tell(), None)
+
+  def close(self):
+    self.__tar.close()
+    self.__gzip.close()
+    self.__file.close()
+
+
+class ZipWriter(object):
+  """
+  Writes a ZIP archive, deflating entries concurrently on at most `jobs` threads. Entries are deflated in memory, and
+  stored instead if deflating does not make them smaller. The deflated data of large files is taken from `cache` when
+  set. Symbolic links are followed.
+  """
+
+  def __init__(self, location, jobs=None, base=None, mark=None, cache=None):
+    self.location = location
+    self.cache = cache
+    self.jobs = jobs or os.cpu_count() or 1
+    self.__file = open(location, 'wb')
+    self.__records = []
+    if base:
+      _copy_prefix(base, self.__file, mark.offset)
+      self.__records = list(mark.records)
+    self.__executor = ThreadPoolExecutor(max_workers=self.jobs)
+    self.__pending = collections.deque()
+
+  def add(self, path, arcname):
+    stat = os.stat(path)
+    isDir = os.path.isdir(path)
+    if isDir:
+      arcname = arcname.rstrip('/') + '/'
+    self.__pending.append((arcname, stat, isDir, self.__executor.submit(_deflate_file, None if isDir else path,
+      self.cache)))
+    while len(self.__pending) > self.jobs * 2:
+      self.__write_oldest()
+
+  def mark(self):
+    """
+    Returns a mark of the current position, after which entries can be replaced by extending this archive.
+    """
+    while self.__pending:
+      self.__write_oldest()
+    return ArchiveMark(self.__file.tell(), None, list(self.__records))
+
+  def close(self):
+    while self.__pending:
+      self.__write_oldest()
+    self.__executor.shutdown()
+    self.__write_central_directory()
+    self.__file.close()
+
+  def __write_oldest(self):
+    arcname, stat, isDir, future = self.__pending.popleft()
+    method, crc, size, data = future.result()
+    name = arcname.encode('utf-8')
+    flags = _zipUtf8Flag if not arcname.isascii() else 0
+    dosTime, dosDate = _dos_time(stat.st_mtime)
+    offset = self.__file.tell()
+    if size >= _zip64Limit or len(data) >= _zip64Limit:
+      raise RuntimeError('Entry {} is too large to archive'.format(arcname))
+    self.__file.write(struct.pack('<4sHHHHHLLLHH', b'PK\x03\x04', 20, flags, method, dosTime, dosDate, crc, len(data),
+      size, len(name), 0))
+    self.__file.write(name)
+    self.__file.write(data)
+    externalAttributes = (stat.st_mode & 0xFFFF) << 16
+    if isDir:
+      externalAttributes |= 0x10
+    self.__records.append((name, flags, method, dosTime, dosDate, crc, len(data), size, externalAttributes, offset))
+
+  def __write_central_directory(self):
+    start = self.__file.tell()
+    for name, flags, method, dosTime, dosDate, crc, compressedSize, size, externalAttributes, offset in self.__records:
+      extra = b''
+      version = 20
+      if offset >= _zip64Limit:
+        extra = struct.pack('<HHQ', 1, 8, offset)
+        offset = _zip64Limit
+        version = 45
+      self.__file.write(struct.pack('<4sBBHHHHHLLLHHHHHLL', b'PK\x01\x02', version, 3, version, flags, method, dosTime,
+        dosDate, crc, compressedSize, size, len(name), len(extra), 0, 0, 0, externalAttributes, offset))
+      self.__file.write(name)
+      self.__file.write(extra)
+    end = self.__file.tell()
+    count = len(self.__records)
+    size = end - start
+    if count >= 0xFFFF or size >= _zip64Limit or start >= _zip64Limit:
+      self.__file.write(struct.pack('<4sQHHLLQQQQ', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count, size, start))
+      self.__file.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, end, 1))
+      count = min(count, 0xFFFF)
+      size = min(size, _zip64Limit)
+      start = min(start, _zip64Limit)
+    self.__file.write(struct.pack('<4sHHHHLLH', b'PK\x05\x06', 0, 0, count, count, size, start, 0))
+
+
+def _deflate_block(block, window, level):
+  if window:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, window)
+  else:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+  return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class _PrecompressedFile(object):
+  """
+  File-like object that TarFile.addfile reads the data of a file from. When TarFile starts reading, it has written the
+  header of the file, and makes `gzip` insert the compressed data of the file instead of compressing it again.
+  """
+
+  def __init__(self, data, gzip, compress):
+    self.data = data
+    self.gzip = gzip
+    self.compress = compress
+    self.position = 0
+
+  def read(self, size=-1):
+    if self.position == 0:
+      self.gzip.begin_precompressed(self.data, self.compress)
+    end = len(self.data) if size < 0 else self.position + size
+    chunk = self.data[self.position:end]
+    self.position += len(chunk)
+    return chunk
+
+
+def _deflate_file(path, cache=None):
+  """
+  Returns the ZIP compression method, CRC-32, uncompressed size, and data of the file at given path, or of an empty
+  directory entry if path is None.
+  """
+  if path is None:
+    return 0, 0, 0, b''
+  with open(path, 'rb') as file:
+    data = file.read()
+  if cache and len(data) >= _minCachedSize:
+    compressed = cache.compress(data) + _finalBlock
+  else:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+  if len(compressed) < len(data):
+    return 8, zlib.crc32(data), len(data), compressed
+  return 0, zlib.crc32(data), len(data), data
+
+
+def _dos_time(timestamp):
+  local = time.localtime(timestamp)
+  # DOS dates start at 1980.
+  if local.tm_year < 1980:
+    return 0, (1 << 5) | 1
+  dosTime = (local.tm_hour << 11) | (local.tm_min << 5) | (local.tm_sec // 2)
+  dosDate = ((local.tm_year - 1980) << 9) | (local.tm_mon << 5) | local.tm_mday
+  return dosTime, dosDate
+
+
+def _copy_prefix(location, target, size):
+  with open(location, 'rb') as source:
+    remaining = size
+    while remaining:
+      chunk = source.read(min(remaining, 1024 * 1024))
+      if not chunk:
+        raise RuntimeError('Archive {} is smaller than its mark'.format(location))
+      target.write(chunk)
+      remaining -= len(chunk)
@@ -0,0 +1,51 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Checksum algorithms computed for each file, in the order they are reported.
+algorithms = ['sha256', 'sha1', 'md5']
+
+_chunkSize = 4 * 1024 * 1024
+
+
+class FileChecksums(object):
+  def __init__(self, size, sha256, sha1, md5):
+    self.size = size
+    self.sha256 = sha256
+    self.sha1 = sha1
+    self.md5 = md5
+
+
+def file_checksums(path):
+  """
+  Computes the checksums of given file in a single streaming pass, without reading the whole file into memory.
+  """
+  digests = [hashlib.new(algorithm) for algorithm in algorithms]
+  size = 0
+  with open(path, 'rb', buffering=0) as file:
+    buffer = bytearray(_chunkSize)
+    view = memoryview(buffer)
+    while True:
+      length = file.readinto(buffer)
+      if not length:
+        break
+      size += length
+      # Hashing releases the GIL for large buffers, such that multiple files are hashed concurrently.
+      for digest in digests:
+        digest.update(view[:length])
+  return FileChecksums(size, *[digest.hexdigest() for digest in digests])
+
+
+def checksum_files(paths, jobs=None):
+  """
+  Computes the checksums of given files concurrently, using at most `jobs` threads, defaulting to the number of CPUs.
+  Returns a dictionary from path to FileChecksums.
+  """
+  paths = list(paths)
+  if not paths:
+    return {}
+  jobs = min(jobs or os.cpu_count() or 1, len(paths))
+  # Hash largest files first, so that a large file does not end up being hashed alone at the end.
+  paths.sort(key=lambda path: os.path.getsize(path), reverse=True)
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    return dict(zip(paths, executor.map(file_checksums, paths)))
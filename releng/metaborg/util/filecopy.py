@@ -0,0 +1,103 @@
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  import fcntl
+except ImportError:
+  # Not available on Windows.
+  fcntl = None
+
+# Linux ioctl request to clone (reflink) a file, sharing its data blocks copy-on-write.
+_FICLONE = 0x40049409
+
+
+def copy_file(src, dst, hardlink=False):
+  """
+  Copies file at `src` to `dst` without copying data through user space where possible: by reflinking on file systems
+  that support copy-on-write clones, by hardlinking when `hardlink` is set and both are on the same file system, or by
+  copying in the kernel with copy_file_range or sendfile. The destination is replaced atomically.
+
+  Hardlinked destinations share data with the source, so changing the source in place also changes the destination.
+
+  :return: Method that was used to copy the file: 'reflink', 'hardlink', or 'copy'.
+  """
+  os.makedirs(os.path.dirname(dst), exist_ok=True)
+  temporaryDst = '{}.{}.tmp'.format(dst, os.getpid())
+  try:
+    if hardlink and _same_device(src, dst):
+      os.link(src, temporaryDst)
+      method = 'hardlink'
+    else:
+      method = _copy_data(src, temporaryDst)
+      shutil.copystat(src, temporaryDst)
+    os.replace(temporaryDst, dst)
+  except BaseException:
+    if os.path.lexists(temporaryDst):
+      os.remove(temporaryDst)
+    raise
+  return method
+
+
+def copy_files(files, jobs=None, hardlink=False, unchanged=None):
+  """
+  Copies files concurrently with copy_file, using at most `jobs` threads, defaulting to the number of CPUs.
+
+  :param files: Iterable of (source, destination) path tuples.
+  :param unchanged: Function from source and existing destination path to whether the destination already has the same
+                    content as the source, in which case it is not copied. Destinations that are the same file as their
+                    source are never copied.
+  :return: Dictionary from copy method, or 'unchanged' for skipped files, to the number of files copied with it.
+  """
+
+  def copy(paths):
+    src, dst = paths
+    if os.path.isfile(dst) and (os.path.samefile(src, dst) or (unchanged and unchanged(src, dst))):
+      return 'unchanged'
+    return copy_file(src, dst, hardlink)
+
+  counts = {}
+  with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+    for method in executor.map(copy, files):
+      counts[method] = counts.get(method, 0) + 1
+  return counts
+
+
+def _same_device(src, dst):
+  return os.stat(src).st_dev == os.stat(os.path.dirname(dst)).st_dev
+
+
+def _copy_data(src, dst):
+  with open(src, 'rb') as srcFile, open(dst, 'wb') as dstFile:
+    if fcntl and sys.platform.startswith('linux'):
+      try:
+        fcntl.ioctl(dstFile.fileno(), _FICLONE, srcFile.fileno())
+        return 'reflink'
+      except OSError:
+        pass
+
+    size = os.fstat(srcFile.fileno()).st_size
+    copyRange = getattr(os, 'copy_file_range', None) or getattr(os, 'sendfile', None)
+    if copyRange:
+      try:
+        offset = 0
+        while offset < size:
+          if copyRange is os.sendfile:
+            copied = os.sendfile(dstFile.fileno(), srcFile.fileno(), offset, size - offset)
+          else:
+            copied = copyRange(srcFile.fileno(), dstFile.fileno(), size - offset, offset, offset)
+          if not copied:
+            break
+          offset += copied
+        if offset == size:
+          return 'copy'
+      except OSError:
+        pass
+      # Kernel copy is not supported between these files, start over in user space.
+      srcFile.seek(0)
+      dstFile.seek(0)
+      dstFile.truncate()
+
+    shutil.copyfileobj(srcFile, dstFile, 1024 * 1024)
+  return 'copy'
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import os
 import re
 import time
@@ -245,6 +246,41 @@ def SetRemote(submodule, toType):
   origin.config_writer.set('url', newUrl)
 
 
+def submodule_for_path(repo, location):
+  """
+  Returns the submodule of given repository that contains given absolute path, or None if it is not in a submodule.
+  """
+  location = os.path.normpath(location)
+  for submodule in repo.submodules:
+    submodulePath = os.path.normpath(os.path.join(repo.working_tree_dir, submodule.path))
+    if location == submodulePath or location.startswith(submodulePath + os.sep):
+      return submodule
+  return None
+
+
+def submodule_state(submodule):
+  """
+  Returns a string that identifies the state of the working tree of given submodule: its HEAD commit SHA, followed by a
+  hash over its uncommitted changes and untracked files if it is dirty.
+  """
+  if not submodule.module_exists():
+    return 'uninitialized'
+  subrepo = submodule.module()
+  sha = subrepo.head.commit.hexsha
+  if not subrepo.is_dirty(untracked_files=True):
+    return sha
+  dirtyHash = hashlib.sha1()
+  dirtyHash.update(subrepo.git.diff('HEAD').encode('utf-8'))
+  for untrackedFile in sorted(subrepo.untracked_files):
+    dirtyHash.update(untrackedFile.encode('utf-8'))
+    untrackedPath = os.path.join(subrepo.working_tree_dir, untrackedFile)
+    if os.path.isfile(untrackedPath):
+      with open(untrackedPath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+          dirtyHash.update(chunk)
+  return '{}-dirty-{}'.format(sha, dirtyHash.hexdigest())
+
+
 def create_qualifier(repo, branch=None):
   timestamp = LatestDate(repo)
   if not branch:
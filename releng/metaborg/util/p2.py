@@ -0,0 +1,360 @@
+import io
+import lzma
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+# Index that makes p2 clients read XZ compressed metadata, falling back to content.jar/content.xml and
+# artifacts.jar/artifacts.xml for clients that do not support XZ.
+p2Index = '''version=1
+metadata.repository.factory.order=content.xml.xz,content.xml,\\!
+artifact.repository.factory.order=artifacts.xml.xz,artifacts.xml,\\!
+'''
+
+# Files of a p2 repository that hold its metadata instead of its artifacts.
+metadataFiles = {'{}{}'.format(name, extension) for name in ['content', 'artifacts'] for extension in
+  ['.jar', '.xml', '.xml.xz']} | {'p2.index'}
+
+
+def read_repository_xml(name, read):
+  """
+  Reads the XML of p2 repository metadata, from its XZ compressed, jar, or plain XML file, in that order.
+
+  :param name: Name of the metadata: 'content' or 'artifacts'.
+  :param read: Function from path relative to the repository to the content of that file, or None if it does not exist.
+  :return: Content of the XML, or None if the repository does not have the metadata.
+  """
+  content = read('{}.xml.xz'.format(name))
+  if content is not None:
+    return lzma.decompress(content)
+  content = read('{}.jar'.format(name))
+  if content is not None:
+    with zipfile.ZipFile(io.BytesIO(content)) as jar:
+      return jar.read('{}.xml'.format(name))
+  return read('{}.xml'.format(name))
+
+
+def compress_repository_xml(content):
+  return lzma.compress(content, format=lzma.FORMAT_XZ)
+
+
+def artifact_checksums(artifactsXml):
+  """
+  Returns a dictionary from path relative to the repository to an (algorithm, checksum) tuple of each artifact in given
+  p2 artifact repository XML, with the SHA-256 checksum when the metadata has one, or the MD5 checksum otherwise.
+  Artifacts without checksums are not returned.
+  """
+  checksums = {}
+  for artifact, properties, path in _mapped_artifacts(ET.fromstring(artifactsXml)):
+    checksum = _artifact_checksum(properties)
+    if checksum:
+      checksums[path] = checksum
+  return checksums
+
+
+def artifact_descriptors(artifactsXml):
+  """
+  Returns a dictionary from (classifier, id, version) key to a (path relative to the repository, (algorithm, checksum)
+  tuple or None, descriptor element) tuple of each artifact in given p2 artifact repository XML in its canonical format.
+  Packed formats of artifacts are not returned.
+  """
+  descriptors = {}
+  for artifact, properties, path in _mapped_artifacts(ET.fromstring(artifactsXml)):
+    if properties.get('format'):
+      continue
+    key = (artifact.get('classifier'), artifact.get('id'), artifact.get('version'))
+    descriptors[key] = (path, _artifact_checksum(properties), artifact)
+  return descriptors
+
+
+def repository_units(contentXml):
+  """
+  Returns the installable units in given p2 metadata repository XML, as a list of InstallableUnit objects.
+  """
+  return [InstallableUnit(unit) for unit in ET.fromstring(contentXml).iterfind('units/unit')]
+
+
+def composite_children(compositeXml):
+  """
+  Returns the locations of the children of given composite p2 repository XML, which are absolute URLs or paths
+  relative to the composite repository.
+  """
+  return [child.get('location') for child in ET.fromstring(compositeXml).iterfind('children/child')]
+
+
+class InstallableUnit(object):
+  """
+  Installable unit of p2 metadata, with the capabilities it provides, the capabilities it requires, and the artifacts
+  it installs.
+  """
+
+  def __init__(self, element):
+    self.element = element
+    self.id = element.get('id')
+    self.version = element.get('version')
+    # List of ProvidedCapability objects.
+    self.provides = [ProvidedCapability(provided) for provided in element.iterfind('provides/provided')]
+    # List of Requirement objects.
+    self.requires = [Requirement(required) for required in element.iterfind('requires/required')]
+    # List of (classifier, id, version) tuples.
+    self.artifacts = [(artifact.get('classifier'), artifact.get('id'), artifact.get('version')) for artifact in
+      element.iterfind('artifacts/artifact')]
+
+  @property
+  def key(self):
+    return '{} {}'.format(self.id, self.version)
+
+
+class ProvidedCapability(object):
+  """
+  Capability that an installable unit provides, with its namespace, name, version, and attributes. The attributes
+  are the properties of the capability, and its name under the key of its namespace and its version under the
+  'version' key, which is what LDAP filters of generic requirements match against.
+  """
+
+  def __init__(self, element):
+    self.namespace = element.get('namespace')
+    self.name = element.get('name')
+    self.version = element.get('version', '0.0.0')
+    self.attributes = {self.namespace: self.name, 'version': self.version}
+    for prop in element.iterfind('properties/property'):
+      value = prop.get('value')
+      if (prop.get('type') or '').startswith('List'):
+        value = [item.strip() for item in value.split(',')]
+      self.attributes[prop.get('name')] = value
+
+
+class Requirement(object):
+  """
+  Capability that an installable unit requires, given as a namespace, name, and version range, or as a match
+  expression. Match expressions are supported when they match the name, namespace, and version range of a provided
+  capability, as p2 writes requirements on bundles and packages, or its namespace and an LDAP filter on its
+  attributes, as p2 writes generic OSGi requirements. Other match expressions are unsupported: `supported` is False
+  and they match no capability.
+  """
+
+  def __init__(self, element):
+    self.optional = element.get('optional') == 'true' or element.get('min') == '0'
+    self.greedy = element.get('greedy') != 'false'
+    self.namespace = element.get('namespace')
+    self.name = element.get('name')
+    self.range = element.get('range', '0.0.0')
+    self.filter = None
+    self.supported = True
+    self.expression = element.get('match')
+    if self.namespace is None:
+      self.range = None
+      self.supported = self.__parse_match(self.expression, element.get('matchParameters', '[]'))
+
+  def matches(self, capability):
+    """
+    Returns whether given ProvidedCapability satisfies this requirement.
+    """
+    if not self.supported:
+      return False
+    if self.namespace is not None and capability.namespace != self.namespace:
+      return False
+    if self.name is not None and capability.name != self.name:
+      return False
+    if self.range is not None and not in_range(capability.version, self.range):
+      return False
+    return self.filter is None or _ldap_matches(self.filter, capability.attributes)
+
+  def __str__(self):
+    if self.expression is not None:
+      return self.expression
+    return '{} {} {}'.format(self.namespace, self.name, self.range)
+
+  def __parse_match(self, expression, parameters):
+    match = _existsExpression.match(expression or '')
+    if not match:
+      return False
+    variable = match.group('variable')
+    parameters = [_match_value(value) for value in _matchValue.findall(parameters)]
+    for condition in match.group('conditions').split('&&'):
+      condition = _matchCondition.match(condition.strip())
+      if not condition or condition.group('variable') != variable:
+        return False
+      value = condition.group('value')
+      if value.startswith('$'):
+        index = int(value[1:])
+        if index >= len(parameters):
+          return False
+        kind, text = parameters[index]
+      else:
+        values = _matchValue.findall(value)
+        if len(values) != 1:
+          return False
+        kind, text = _match_value(values[0])
+      attribute, operator = condition.group('attribute'), condition.group('operator')
+      if attribute in ('name', 'namespace') and operator == '==' and kind == 'string':
+        setattr(self, attribute, text)
+      elif attribute == 'version' and operator == '~=' and kind == 'range':
+        self.range = text
+      elif attribute == 'attributes' and operator == '~=' and kind == 'filter':
+        self.filter = _parse_ldap(text)
+        if self.filter is None:
+          return False
+      else:
+        return False
+    return self.namespace is not None
+
+
+def parse_version(text):
+  """
+  Parses an OSGi version such as 1.2.3.v20170101 into a tuple that compares like the version does.
+  """
+  parts = text.strip().split('.', 3)
+  numbers = []
+  for part in parts[:3]:
+    try:
+      numbers.append(int(part))
+    except ValueError:
+      # Versions in a raw or other format: compare them as strings, after all OSGi versions.
+      return (float('inf'), 0, 0, text)
+  numbers.extend([0] * (3 - len(numbers)))
+  return tuple(numbers) + (parts[3] if len(parts) > 3 else '',)
+
+
+def in_range(version, versionRange):
+  """
+  Returns whether given OSGi version is in given OSGi version range, such as [1.0.0,2.0.0) or 1.0.0, which is the range
+  of versions of at least 1.0.0.
+  """
+  versionRange = versionRange.strip()
+  if versionRange.startswith('raw:'):
+    return True
+  parsed = parse_version(version)
+  if versionRange[:1] not in '[(':
+    return parsed >= parse_version(versionRange)
+  low, high = versionRange[1:-1].split(',')
+  lowVersion = parse_version(low)
+  highVersion = parse_version(high)
+  if parsed < lowVersion or (versionRange[0] == '(' and parsed == lowVersion):
+    return False
+  if parsed > highVersion or (versionRange[-1] == ')' and parsed == highVersion):
+    return False
+  return True
+
+
+def _mapped_artifacts(root):
+  """
+  Yields the artifact elements, properties, and paths relative to the repository, of the artifacts of given artifact
+  repository element that are mapped to a path by its mapping rules.
+  """
+  rules = []
+  for rule in root.iterfind('mappings/rule'):
+    conditions = dict(re.findall(r'\(([\w.]+)=([^)]*)\)', rule.get('filter', '')))
+    rules.append((conditions, rule.get('output')))
+
+  for artifact in root.iterfind('artifacts/artifact'):
+    properties = {prop.get('name'): prop.get('value') for prop in artifact.iterfind('properties/property')}
+    attributes = {'classifier': artifact.get('classifier'), 'format': properties.get('format')}
+    for conditions, output in rules:
+      if all(attributes.get(key) == value for key, value in conditions.items()):
+        path = output.replace('${repoUrl}', '').replace('${id}', artifact.get('id'))
+        path = path.replace('${version}', artifact.get('version'))
+        yield artifact, properties, path.lstrip('/')
+        break
+
+
+def _artifact_checksum(properties):
+  if 'download.checksum.sha-256' in properties:
+    return 'sha256', properties['download.checksum.sha-256'].lower()
+  if 'download.md5' in properties:
+    return 'md5', properties['download.md5'].lower()
+  return None
+
+
+# Match expression of a requirement on a provided capability, with the conditions that the capability must satisfy.
+_existsExpression = re.compile(r'^\s*providedCapabilities\.exists\(\s*(?P<variable>\w+)\s*\|(?P<conditions>.*)\)\s*$')
+_matchCondition = re.compile(r'^(?P<variable>\w+)\.(?P<attribute>\w+)\s*(?P<operator>==|~=)\s*(?P<value>.+)$')
+# Value in a match expression or its parameters: a parameter reference, range, filter, or string.
+_matchValue = re.compile(r"(\$\d+|(?:range|filter)\(\s*'[^']*'\s*\)|'[^']*')")
+
+
+def _match_value(text):
+  """
+  Returns a (kind, text) tuple of given value of a match expression, where kind is 'range', 'filter', 'string', or
+  'parameter'.
+  """
+  if text.startswith('$'):
+    return 'parameter', text
+  quoted = text[text.index("'") + 1:text.rindex("'")]
+  if text.startswith('range('):
+    return 'range', quoted
+  if text.startswith('filter('):
+    return 'filter', quoted
+  return 'string', quoted
+
+
+def _parse_ldap(text):
+  """
+  Parses an LDAP filter such as (&(osgi.ee=JavaSE)(version>=1.8)) into a tree of ('&' or '|', children), ('!', child),
+  and (operator, attribute, value) tuples. Returns None if the filter is malformed.
+  """
+  try:
+    node, position = _parse_ldap_node(text.strip(), 0)
+  except (IndexError, ValueError):
+    return None
+  return node if position == len(text.strip()) else None
+
+
+def _parse_ldap_node(text, position):
+  if text[position] != '(':
+    raise ValueError(text)
+  position += 1
+  operator = text[position]
+  if operator in '&|':
+    children = []
+    position += 1
+    while text[position] != ')':
+      child, position = _parse_ldap_node(text, position)
+      children.append(child)
+    return (operator, children), position + 1
+  if operator == '!':
+    child, position = _parse_ldap_node(text, position + 1)
+    if text[position] != ')':
+      raise ValueError(text)
+    return ('!', child), position + 1
+  end = text.index(')', position)
+  match = re.match(r'^\s*([^=<>~]+?)\s*(=|>=|<=|~=)(.*)$', text[position:end])
+  if not match:
+    raise ValueError(text)
+  return (match.group(2), match.group(1), match.group(3)), end + 1
+
+
+def _ldap_matches(node, attributes):
+  """
+  Returns whether given attributes satisfy given parsed LDAP filter. Versions are compared as OSGi versions, other
+  values as strings. Values of list attributes satisfy a comparison if any of their items does.
+  """
+  operator = node[0]
+  if operator == '&':
+    return all(_ldap_matches(child, attributes) for child in node[1])
+  if operator == '|':
+    return any(_ldap_matches(child, attributes) for child in node[1])
+  if operator == '!':
+    return not _ldap_matches(node[1], attributes)
+  _, attribute, expected = node
+  if attribute not in attributes:
+    return False
+  values = attributes[attribute]
+  if not isinstance(values, list):
+    values = [values]
+  return any(_ldap_compares(operator, attribute, value, expected) for value in values)
+
+
+def _ldap_compares(operator, attribute, value, expected):
+  if operator == '=' and '*' in expected:
+    pattern = '.*'.join(re.escape(part) for part in expected.split('*'))
+    return re.match('^{}$'.format(pattern), value) is not None
+  if operator == '~=':
+    return value.replace(' ', '').lower() == expected.replace(' ', '').lower()
+  if attribute == 'version':
+    value, expected = parse_version(value), parse_version(expected)
+  if operator == '>=':
+    return value >= expected
+  if operator == '<=':
+    return value <= expected
+  return value == expected
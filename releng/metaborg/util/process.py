@@ -0,0 +1,184 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_observers = threading.local()
+_launches = threading.local()
+
+
+class ProcessResult(object):
+  def __init__(self, cmd, cwd, start, end, returncode, userTime=None, systemTime=None, maxRss=None, outputParser=None):
+    self.cmd = cmd
+    self.cwd = cwd
+    self.start = start
+    self.end = end
+    self.returncode = returncode
+    # CPU times in seconds and peak resident set size in bytes, of the process and the processes it waited for. None
+    # when resource usage is not available on this platform.
+    self.userTime = userTime
+    self.systemTime = systemTime
+    self.maxRss = maxRss
+    # Parser that the output of the process was fed to, or None.
+    self.outputParser = outputParser
+
+  @property
+  def duration(self):
+    return self.end - self.start
+
+  @property
+  def cpuTime(self):
+    if self.userTime is None:
+      return None
+    return self.userTime + self.systemTime
+
+
+@contextmanager
+def observe_processes(observer):
+  """
+  Calls `observer` with the ProcessResult of each process run with run_process on the current thread, while in this
+  context.
+  """
+  if not hasattr(_observers, 'stack'):
+    _observers.stack = []
+  _observers.stack.append(observer)
+  try:
+    yield
+  finally:
+    _observers.stack.remove(observer)
+
+
+def run_process(cmd, cwd=None, env=None, outputParser=None):
+  """
+  Runs given shell command, waits for it to finish, and returns its ProcessResult, including its CPU time and peak
+  memory usage where the platform supports it.
+
+  When `outputParser` is set, the standard output and error of the process are written to standard output and error
+  line by line. Each line of standard output is also passed to the `feed` method of the parser, and each line of
+  standard error to its `feed_error` method, if it has one, which is called on another thread. Lines longer than 64KiB
+  are passed in parts.
+  """
+  start = time.time()
+  feedError = getattr(outputParser, 'feed_error', None)
+  if outputParser:
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, shell=True, stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE if feedError else None)
+  else:
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, shell=True)
+  try:
+    if outputParser:
+      # Write output that was printed before the output of the process first.
+      sys.stdout.flush()
+      sys.stderr.flush()
+      errorThread = None
+      if feedError:
+        errorThread = threading.Thread(target=_tee_output, args=(process.stderr, sys.stderr.buffer, feedError),
+          daemon=True)
+        errorThread.start()
+      _tee_output(process.stdout, sys.stdout.buffer, outputParser.feed)
+      if errorThread:
+        errorThread.join()
+    if hasattr(os, 'wait4'):
+      _, status, usage = os.wait4(process.pid, 0)
+      process.returncode = _exit_code(status)
+      # Linux reports the maximum resident set size in kilobytes, macOS in bytes.
+      maxRss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+      result = ProcessResult(cmd, cwd, start, time.time(), process.returncode, usage.ru_utime, usage.ru_stime, maxRss,
+        outputParser)
+    else:
+      process.communicate()
+      result = ProcessResult(cmd, cwd, start, time.time(), process.returncode, outputParser=outputParser)
+  except KeyboardInterrupt:
+    process.kill()
+    process.wait()
+    raise
+
+  for observer in getattr(_observers, 'stack', []):
+    observer(result)
+  return result
+
+
+def run_processes_of(module):
+  """
+  Makes given module, which launches processes with subprocess.Popen itself, launch processes through run_process on
+  threads that are in a `launch_with_run_process` context, by replacing its reference to the subprocess module.
+  """
+  module.subprocess = _launchingSubprocess
+
+
+@contextmanager
+def launch_with_run_process(rewrite=None, outputParser=None):
+  """
+  Runs processes that modules passed to `run_processes_of` launch on the current thread with run_process while in this
+  context, such that they can be observed. When `rewrite` is set, it is called with the shell command of each launched
+  process, and returns the shell command to run instead. `outputParser` is passed to run_process.
+  """
+  previous = getattr(_launches, 'launch', None)
+
+  def launch(cmd, cwd, env):
+    if rewrite:
+      cmd = rewrite(cmd)
+    return run_process(cmd, cwd=cwd, env=env, outputParser=outputParser)
+
+  _launches.launch = launch
+  try:
+    yield
+  finally:
+    _launches.launch = previous
+
+
+class _LaunchingSubprocess(object):
+  """
+  Stands in for the subprocess module in modules passed to `run_processes_of`.
+  """
+
+  def __getattr__(self, name):
+    return getattr(subprocess, name)
+
+  @staticmethod
+  def Popen(args, cwd=None, env=None, **kwargs):
+    launch = getattr(_launches, 'launch', None)
+    if not launch:
+      return subprocess.Popen(args, cwd=cwd, env=env, **kwargs)
+    return _LaunchedProcess(launch(args, cwd, env))
+
+
+class _LaunchedProcess(object):
+  """
+  Process launched through run_process, which has already finished.
+  """
+
+  def __init__(self, result):
+    self.result = result
+    self.returncode = result.returncode
+
+  def communicate(self, input=None, timeout=None):
+    return None, None
+
+  def wait(self, timeout=None):
+    return self.returncode
+
+
+_launchingSubprocess = _LaunchingSubprocess()
+
+
+def _tee_output(stream, output, feed):
+  with stream:
+    while True:
+      line = stream.readline(_maxLineLength)
+      if not line:
+        break
+      output.write(line)
+      output.flush()
+      feed(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+
+_maxLineLength = 64 * 1024
+
+
+def _exit_code(status):
+  if os.WIFSIGNALED(status):
+    return -os.WTERMSIG(status)
+  return os.WEXITSTATUS(status)
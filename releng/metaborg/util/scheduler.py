@@ -0,0 +1,194 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import deepcopy
+
+from buildorchestra.build import Builder
+from buildorchestra.result import BuildResult
+
+
+class ParallelBuilder(Builder):
+  """
+  Builder that executes build steps whose dependencies have completed concurrently, using at most `jobs` threads.
+  With a single job, steps are executed one at a time in dependency order, like the regular Builder.
+  When a step fails, no new steps are started, steps that are already running are allowed to finish, and the exception
+  of the first failed step is raised.
+
+  Interceptors can wrap the execution of each step. An interceptor is an object with an
+  `intercept(step, options, proceed)` method, which must return the result of the step, usually by calling `proceed()`.
+
+  Ordering dependencies force a step to execute after other steps when both are executed, without causing those steps
+  to be executed.
+
+  When `memoryBudget` is set, a step is only started when the expected peak memory usage of the running steps plus that
+  of the step, as returned by `stepMemory(stepId)`, fits the budget. Steps that do not fit are queued, while later steps
+  that do fit may start first. A step that does not fit the budget on its own is started when no other steps run.
+  """
+
+  def __init__(self, copyOptions=True, dependencyAnalysis=True, jobs=1):
+    super().__init__(copyOptions=copyOptions, dependencyAnalysis=dependencyAnalysis)
+    self.jobs = jobs
+    self.interceptors = []
+    self.orderingDeps = {}
+    self.memoryBudget = None
+    self.stepMemory = None
+
+  def build(self, *targets, **options):
+    if not targets: return
+
+    depGraph = self.dependency_graph(*targets)
+    buildOrder = [stepId for stepId in self.all_steps_ordered if stepId in depGraph]
+    print('Executing build steps: {}'.format(', '.join(buildOrder)))
+
+    results = self.__execute(depGraph, buildOrder, options)
+    print('All done!')
+
+    artifacts = []
+    for stepId in buildOrder:
+      result = results.get(stepId)
+      if result:
+        artifacts.extend(result.artifacts)
+    if artifacts:
+      print('Produced artifacts:')
+      for artifact in artifacts:
+        print('Artifact {}'.format(artifact))
+
+    return BuildResult(artifacts)
+
+  def dependency_graph(self, *targets):
+    """
+    Creates the dependency graph of steps to execute for given targets.
+
+    :param targets: Identifiers of steps or targets to build.
+    :return: Dictionary from step identifier to the set of identifiers of steps it depends on.
+    """
+    for target in targets:
+      if target not in self.steps:
+        raise RuntimeError('Target {} does not exist'.format(target))
+
+    if self.dependencyAnalysis:
+      stepIds = set()
+      for target in targets:
+        stepIds.update(self.__transitive_closure(target))
+      depGraph = {stepId: set(self.deps.get(stepId, set())) for stepId in stepIds}
+    else:
+      depGraph = {stepId: {depId for depId in self.deps.get(stepId, set()) if depId in targets} for stepId in targets}
+
+    for stepId, depIds in depGraph.items():
+      depIds.update(depId for depId in self.orderingDeps.get(stepId, set()) if depId in depGraph)
+    return depGraph
+
+  def execute_step(self, step, options):
+    """
+    Executes a single step. Called from a worker thread, may be overridden to wrap step execution.
+    """
+    print('Executing build step {}'.format(step))
+
+    def proceed():
+      return step.execute(**options)
+
+    execute = proceed
+    for interceptor in reversed(self.interceptors):
+      execute = _intercepted(interceptor, step, options, execute)
+    result = execute()
+
+    print('Executing build step {} completed'.format(step))
+    if result:
+      for artifact in result.artifacts:
+        print('  Produced artifact {}'.format(artifact))
+    return result
+
+  def __execute(self, depGraph, buildOrder, options):
+    jobs = max(1, self.jobs or 1)
+    if jobs > 1:
+      print('Executing up to {} build steps concurrently'.format(jobs))
+
+    remainingDeps = {stepId: set(depIds) for stepId, depIds in depGraph.items()}
+    dependents = {stepId: [] for stepId in depGraph}
+    for stepId, depIds in depGraph.items():
+      for depId in depIds:
+        dependents[depId].append(stepId)
+    # Keep the ready queue in build order, such that a single job executes steps in the same order as Builder.
+    position = {stepId: index for index, stepId in enumerate(buildOrder)}
+    ready = deque(stepId for stepId in buildOrder if not remainingDeps[stepId])
+
+    results = {}
+    running = {}
+    runningMemory = {}
+    queuedForMemory = set()
+    failure = None
+
+    def fits(stepId):
+      if not self.memoryBudget or not self.stepMemory or not running:
+        return True
+      memory = self.stepMemory(stepId)
+      if sum(runningMemory.values()) + memory <= self.memoryBudget:
+        return True
+      if stepId not in queuedForMemory:
+        queuedForMemory.add(stepId)
+        print('Queueing build step {}: its expected memory usage of {} MB does not fit the memory budget next to '
+              'running build step(s) {}'.format(stepId, memory // (1024 * 1024), ', '.join(sorted(runningMemory))))
+      return False
+
+    def complete(stepId):
+      newlyReady = []
+      for dependentId in dependents[stepId]:
+        remainingDeps[dependentId].discard(stepId)
+        if not remainingDeps[dependentId]:
+          newlyReady.append(dependentId)
+      ready.extend(sorted(newlyReady, key=lambda i: position[i]))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+      while running or (ready and not failure):
+        index = 0
+        while index < len(ready) and not failure and len(running) < jobs:
+          stepId = ready[index]
+          step = self.steps[stepId]
+          if step.shouldExecute and not fits(stepId):
+            index += 1
+            continue
+          del ready[index]
+          if not step.shouldExecute:
+            complete(stepId)
+            continue
+          stepOptions = deepcopy(options) if self.copyOptions else options
+          running[executor.submit(self.execute_step, step, stepOptions)] = stepId
+          if self.memoryBudget and self.stepMemory:
+            runningMemory[stepId] = self.stepMemory(stepId)
+
+        if not running:
+          continue
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+          stepId = running.pop(future)
+          runningMemory.pop(stepId, None)
+          try:
+            results[stepId] = future.result()
+          except Exception as detail:
+            print('Executing build step {} failed: {}'.format(stepId, detail))
+            if not failure:
+              failure = detail
+              if running:
+                print('Waiting for {} running build step(s) to finish'.format(len(running)))
+            continue
+          complete(stepId)
+
+    if failure:
+      raise failure
+
+    return results
+
+  def __transitive_closure(self, startId):
+    closure = set()
+    queue = deque([startId])
+    while queue:
+      identifier = queue.popleft()
+      closure.add(identifier)
+      for depId in self.deps.get(identifier, set()):
+        if depId not in closure:
+          queue.append(depId)
+    return closure
+
+
+def _intercepted(interceptor, step, options, proceed):
+  return lambda: interceptor.intercept(step, options, proceed)
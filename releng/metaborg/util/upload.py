@@ -0,0 +1,222 @@
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metaborg.util.filecopy import copy_file
+
+
+def create_uploader(url, username=None, password=None, jobs=8):
+  """
+  Returns an HttpUploader for HTTP(S) URLs, or a LocalUploader for other URLs, which are local directories.
+  """
+  if url.startswith(('http://', 'https://')):
+    return HttpUploader(url, username, password, jobs=jobs)
+  if url.startswith('file:'):
+    url = url[len('file:'):]
+  return LocalUploader(url, jobs=jobs)
+
+
+class HttpUploader(object):
+  """
+  Uploads files to an HTTP server, concurrently using at most `jobs` threads. Each thread keeps its connections to the
+  server alive between requests. Request bodies are streamed from disk. Requests that fail because of connection errors
+  or server errors are retried up to `retries` times, waiting `backoff` seconds before the first retry, doubling the
+  wait for each next retry.
+  """
+
+  def __init__(self, url, username=None, password=None, jobs=8, retries=3, backoff=1.0):
+    self.url = url.rstrip('/')
+    self.username = username
+    self.password = password
+    self.jobs = jobs
+    self.retries = retries
+    self.backoff = backoff
+    self.__sessions = threading.local()
+
+  def upload_files(self, files):
+    """
+    Uploads files concurrently with PUT requests, and waits until all uploads are done. When uploads fail, raises the
+    exception of the first failed upload in the order of given files, after all other uploads are done.
+
+    :param files: Iterable of (local path, remote path relative to the URL of the server) tuples.
+    """
+    self.for_each(lambda paths: self.upload_file(*paths), files)
+
+  def upload_file(self, localPath, remotePath):
+    print('Uploading {}'.format(self.remote_url(remotePath)))
+    self.request('PUT', remotePath, body=lambda: open(localPath, 'rb'))
+
+  def upload_bytes(self, content, remotePath):
+    print('Uploading {}'.format(self.remote_url(remotePath)))
+    self.request('PUT', remotePath, body=lambda: content)
+
+  def download(self, remotePath):
+    """
+    Returns the content of given remote file, or None if it does not exist.
+    """
+    response = self.request('GET', remotePath, expectedStatus=(200, 404))
+    if response.status_code == 404:
+      return None
+    return response.content
+
+  def request(self, method, remotePath, body=None, expectedStatus=(200, 201, 204), **kwargs):
+    """
+    Sends a request to the server, retrying on connection errors and server errors.
+
+    :param body: Function returning the request body: bytes, or a file-like object which is streamed and closed after
+                 sending. Called again for each retry.
+    :param expectedStatus: Status codes of successful responses. Other status codes raise a RuntimeError.
+    :param kwargs: Additional arguments to requests, such as params and headers.
+    :return: The response.
+    """
+    url = self.remote_url(remotePath)
+    attempt = 0
+    while True:
+      data = body() if body else None
+      response = None
+      try:
+        response = self.__session().request(method, url, data=data, **kwargs)
+      except (requests.ConnectionError, requests.Timeout) as detail:
+        error = detail
+      finally:
+        if hasattr(data, 'close'):
+          data.close()
+
+      if response is not None:
+        if response.status_code in expectedStatus:
+          return response
+        error = '{}\n{}'.format(response.status_code, response.text)
+        retry = response.status_code >= 500 or response.status_code == 429
+      else:
+        retry = True
+      if not retry or attempt >= self.retries:
+        raise RuntimeError('{} {} failed: {}'.format(method, url, error))
+      wait = self.backoff * (2 ** attempt)
+      print('{} {} failed, retrying in {:.0f}s: {}'.format(method, url, wait, error))
+      time.sleep(wait)
+      attempt += 1
+
+  def remote_url(self, remotePath):
+    return '{}/{}'.format(self.url, remotePath.lstrip('/'))
+
+  def for_each(self, function, items):
+    """
+    Calls function with each item concurrently, using at most `jobs` threads, and returns the results in order. Raises
+    the exception of the first failed call in the order of given items, after all calls are done.
+    """
+    return _for_each(self.jobs, function, items)
+
+  def __session(self):
+    session = getattr(self.__sessions, 'session', None)
+    if not session:
+      session = requests.Session()
+      if self.username:
+        session.auth = (self.username, self.password)
+      session.mount(self.url, HTTPAdapter(pool_maxsize=1))
+      self.__sessions.session = session
+    return session
+
+
+class LocalUploader(object):
+  """
+  Uploads files into a local directory, such as a directory that is served by a web server, with the same interface as
+  HttpUploader. Files are copied concurrently using at most `jobs` threads, and replaced atomically.
+  """
+
+  def __init__(self, path, jobs=8):
+    self.url = os.path.abspath(path)
+    self.jobs = jobs
+
+  def upload_files(self, files):
+    self.for_each(lambda paths: self.upload_file(*paths), files)
+
+  def upload_file(self, localPath, remotePath):
+    print('Copying to {}'.format(self.remote_url(remotePath)))
+    copy_file(localPath, self.remote_url(remotePath))
+
+  def upload_bytes(self, content, remotePath):
+    path = self.remote_url(remotePath)
+    print('Writing {}'.format(path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporaryPath = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporaryPath, 'wb') as file:
+      file.write(content)
+    os.replace(temporaryPath, path)
+
+  def download(self, remotePath):
+    path = self.remote_url(remotePath)
+    if not os.path.isfile(path):
+      return None
+    with open(path, 'rb') as file:
+      return file.read()
+
+  def remote_url(self, remotePath):
+    return os.path.join(self.url, *remotePath.strip('/').split('/'))
+
+  def for_each(self, function, items):
+    return _for_each(self.jobs, function, items)
+
+
+def _for_each(jobs, function, items):
+  with ThreadPoolExecutor(max_workers=jobs) as executor:
+    futures = [executor.submit(function, item) for item in items]
+  return [future.result() for future in futures]
+
+
+class MultipartFile(object):
+  """
+  Multipart form data request body with form fields followed by a single file, which is streamed from disk when the
+  request is sent instead of being loaded into memory.
+  """
+
+  def __init__(self, fields, fileField, filePath):
+    boundary = uuid.uuid4().hex
+    self.contentType = 'multipart/form-data; boundary={}'.format(boundary)
+    self.filePath = filePath
+    head = ''
+    for name, value in fields.items():
+      head += '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(boundary, name, value)
+    head += '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'.format(boundary, fileField,
+      os.path.basename(filePath))
+    head += 'Content-Type: application/octet-stream\r\n\r\n'
+    self.head = head.encode('utf-8')
+    self.tail = '\r\n--{}--\r\n'.format(boundary).encode('utf-8')
+
+  def open(self):
+    """
+    Returns a new file-like object that reads the request body.
+    """
+    return _ConcatenatedReader([io.BytesIO(self.head), open(self.filePath, 'rb'), io.BytesIO(self.tail)],
+      len(self.head) + os.path.getsize(self.filePath) + len(self.tail))
+
+
+class _ConcatenatedReader(object):
+  def __init__(self, files, length):
+    self.files = files
+    self.length = length
+
+  def __len__(self):
+    return self.length
+
+  def read(self, size=-1):
+    chunks = []
+    while self.files and size != 0:
+      chunk = self.files[0].read(size)
+      if not chunk:
+        self.files.pop(0).close()
+        continue
+      chunks.append(chunk)
+      if size > 0:
+        size -= len(chunk)
+    return b''.join(chunks)
+
+  def close(self):
+    for file in self.files:
+      file.close()
+    self.files = []
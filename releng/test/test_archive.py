@@ -0,0 +1,146 @@
+import gzip
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from metaborg.util.archive import CompressionCache, open_archive, tree_entries
+
+_formats = [('gztar', '.tar.gz'), ('zip', '.zip')]
+
+
+class ArchiveTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.source = os.path.join(self.directory, 'eclipse')
+    self.cache = CompressionCache(os.path.join(self.directory, 'cache'))
+    generator = random.Random(1)
+    self.files = {}
+    # Small files, which are compressed by the writer, and files of at least 64 KiB, which are precompressed by the
+    # cache, some of which span multiple compressed blocks, and some of which do not compress.
+    for index, size in enumerate([0, 100, 5000, 70 * 1024, 300 * 1024]):
+      self.__write('plugins/compressible{}.jar'.format(index),
+        bytes(generator.getrandbits(8) for _ in range(min(size, 100))) + b'hello world ' * (size // 12))
+    self.__write('plugins/random.jar', bytes(generator.getrandbits(8) for _ in range(80 * 1024)))
+    self.__write('eclipse.ini', b'-Xmx2G\n')
+    os.makedirs(os.path.join(self.source, 'empty'))
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_round_trip(self):
+    for archiveFormat, extension in _formats:
+      for cache in [None, self.cache]:
+        with self.subTest(archiveFormat=archiveFormat, cache=cache is not None):
+          location = os.path.join(self.directory, 'archive' + extension)
+          writer = open_archive(location, archiveFormat, jobs=4, cache=cache)
+          for path, arcname in tree_entries(self.source, 'eclipse'):
+            writer.add(path, arcname)
+          writer.close()
+          self.assertEqual(self.__read(location, archiveFormat), self.__expected())
+    self.assertTrue(os.listdir(self.cache.location))
+
+  def test_extend_mark(self):
+    ini = os.path.join(self.source, 'eclipse.ini')
+    for archiveFormat, extension in _formats:
+      with self.subTest(archiveFormat=archiveFormat):
+        base = os.path.join(self.directory, 'base' + extension)
+        writer = open_archive(base, archiveFormat, jobs=4, cache=self.cache)
+        for path, arcname in tree_entries(self.source, 'eclipse', exclude=[ini]):
+          writer.add(path, arcname)
+        mark = writer.mark()
+        writer.add(ini, 'eclipse/eclipse.ini')
+        writer.close()
+        self.assertEqual(self.__read(base, archiveFormat), self.__expected())
+
+        # Replace the entry after the mark, and add entries of a new directory.
+        extended = os.path.join(self.directory, 'extended' + extension)
+        jre = os.path.join(self.directory, 'jre')
+        os.makedirs(os.path.join(jre, 'bin'))
+        with open(os.path.join(jre, 'bin', 'java'), 'wb') as file:
+          file.write(b'java' * 50000)
+        with open(os.path.join(self.directory, 'eclipse.ini'), 'wb') as file:
+          file.write(b'-vm\njre/bin/java\n')
+        writer = open_archive(extended, archiveFormat, jobs=4, base=base, mark=mark, cache=self.cache)
+        for path, arcname in tree_entries(jre, 'eclipse/jre'):
+          writer.add(path, arcname)
+        writer.add(os.path.join(self.directory, 'eclipse.ini'), 'eclipse/eclipse.ini')
+        writer.close()
+
+        expected = self.__expected()
+        expected['eclipse/eclipse.ini'] = b'-vm\njre/bin/java\n'
+        expected['eclipse/jre/'] = None
+        expected['eclipse/jre/bin/'] = None
+        expected['eclipse/jre/bin/java'] = b'java' * 50000
+        self.assertEqual(self.__read(extended, archiveFormat), expected)
+        # The base archive is left as is.
+        self.assertEqual(self.__read(base, archiveFormat), self.__expected())
+        shutil.rmtree(jre)
+
+  @unittest.skipUnless(shutil.which('gzip') and shutil.which('tar'), 'requires gzip and tar')
+  def test_tools_read_extended_tar(self):
+    ini = os.path.join(self.source, 'eclipse.ini')
+    base = os.path.join(self.directory, 'base.tar.gz')
+    writer = open_archive(base, 'gztar', jobs=4, cache=self.cache)
+    for path, arcname in tree_entries(self.source, 'eclipse', exclude=[ini]):
+      writer.add(path, arcname)
+    mark = writer.mark()
+    writer.close()
+    extended = os.path.join(self.directory, 'extended.tar.gz')
+    writer = open_archive(extended, 'gztar', jobs=4, base=base, mark=mark, cache=self.cache)
+    writer.add(ini, 'eclipse/eclipse.ini')
+    writer.close()
+
+    subprocess.run(['gzip', '-t', extended], check=True)
+    target = os.path.join(self.directory, 'extracted')
+    os.makedirs(target)
+    subprocess.run(['tar', 'xzf', extended], cwd=target, check=True)
+    for arcname, data in self.files.items():
+      with open(os.path.join(target, arcname), 'rb') as file:
+        self.assertEqual(file.read(), data, arcname)
+
+  def __write(self, name, data):
+    path = os.path.join(self.source, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+      file.write(data)
+    self.files['eclipse/' + name] = data
+
+  def __expected(self):
+    expected = dict(self.files)
+    for name in ['eclipse/', 'eclipse/empty/', 'eclipse/plugins/']:
+      expected[name] = None
+    return expected
+
+  @staticmethod
+  def __read(location, archiveFormat):
+    """
+    Returns a dictionary from name to content of the entries of given archive, with names of directories ending in a
+    slash and content None, after checking the integrity of the archive.
+    """
+    entries = {}
+    if archiveFormat == 'zip':
+      with zipfile.ZipFile(location) as archive:
+        if archive.testzip() is not None:
+          raise AssertionError('Corrupt entry {} in {}'.format(archive.testzip(), location))
+        for info in archive.infolist():
+          entries[info.filename] = None if info.is_dir() else archive.read(info)
+      return entries
+    # Decompressing all members checks their CRC-32 and size, like gzip -t.
+    with gzip.open(location) as file:
+      file.read()
+    with tarfile.open(location, 'r:gz') as archive:
+      for member in archive:
+        if member.isdir():
+          entries[member.name + '/'] = None
+        else:
+          entries[member.name] = archive.extractfile(member).read()
+    return entries
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,110 @@
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+
+from metaborg.releng.benchmark import _environment, _install_stand_ins, create_synthetic_repo
+from metaborg.releng.build import RelengBuilder
+from metaborg.releng.deploy import MetaborgBintrayDeployer, MetaborgNexusDeployer
+
+
+class BuildTest(unittest.TestCase):
+  """
+  Builds a synthetic spoofax-releng repository, with Maven and Gradle replaced by the stand-ins of the benchmark.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.mkdtemp()
+    binDir = os.path.join(cls.directory, 'bin')
+    _install_stand_ins(binDir)
+    cls.environment = _environment({
+      'PATH'               : os.pathsep.join([binDir, os.environ.get('PATH', '')]),
+      'GIT_AUTHOR_NAME'    : 'Test', 'GIT_AUTHOR_EMAIL': 'test@localhost',
+      'GIT_COMMITTER_NAME' : 'Test', 'GIT_COMMITTER_EMAIL': 'test@localhost',
+      'GIT_CONFIG_COUNT'   : '1', 'GIT_CONFIG_KEY_0': 'protocol.file.allow', 'GIT_CONFIG_VALUE_0': 'always',
+      'HOME'               : cls.directory,
+    })
+    cls.environment.__enter__()
+    cls.repo = create_synthetic_repo(os.path.join(cls.directory, 'repos'), 0)
+    os.environ['BENCHMARK_REPO'] = cls.repo.working_tree_dir
+
+  @classmethod
+  def tearDownClass(cls):
+    del os.environ['BENCHMARK_REPO']
+    cls.environment.__exit__(None, None, None)
+    shutil.rmtree(cls.directory)
+
+  def test_build_with_deployers(self):
+    # Deployers hold connections and locks, which steps must not copy with their options.
+    builder = RelengBuilder(self.repo)
+    builder.nexusDeployer = MetaborgNexusDeployer('http://127.0.0.1:9', 'releases', '1.0.0', 'user', 'password')
+    builder.bintrayDeployer = MetaborgBintrayDeployer('metaborg', 'spoofax', '1.0.0', 'user', 'key')
+    builder.build('poms')
+
+  def test_fused_reactors_configuration(self):
+    # Like Maven, reactors without a .mvn directory use the one of the closest ancestor, which the fused reactor copies.
+    configDir = os.path.join(self.repo.working_tree_dir, '.mvn')
+    os.makedirs(configDir)
+    self.addCleanup(shutil.rmtree, configDir)
+    with open(os.path.join(configDir, 'extensions.xml'), 'w') as file:
+      file.write('<extensions/>\n')
+    builder = RelengBuilder(self.repo)
+    builder.mavenFuseReactors = True
+    output = io.TextIOWrapper(io.BytesIO(), write_through=True)
+    with redirect_stdout(output):
+      builder.build('languages')
+    self.assertIn('Fusing Maven reactors of steps language-prereqs, languages',
+      output.buffer.getvalue().decode('utf-8'))
+    fusedConfigDir = os.path.join(self.repo.working_tree_dir, '.fused-reactors', 'language-prereqs', '.mvn')
+    with open(os.path.join(fusedConfigDir, 'extensions.xml')) as file:
+      self.assertEqual(file.read(), '<extensions/>\n')
+
+  def test_incremental_build(self):
+    builder = RelengBuilder(self.repo)
+    builder.incremental = True
+    self.assertEqual(self.__skipped_steps(builder, 'all'), [])
+    self.assertEqual(self.__skipped_steps(builder, 'all'), self.__steps('all'))
+
+    # A commit to spoofax-eclipse changes the qualifier, which only steps that build Eclipse plugins stamp, and which
+    # only those steps are affected by, since no other step reads spoofax-eclipse.
+    submoduleDir = os.path.join(self.repo.working_tree_dir, 'spoofax-eclipse')
+    with open(os.path.join(submoduleDir, 'changed.txt'), 'w') as file:
+      file.write('Changed')
+    subprocess.check_call(['git', 'add', '--all'], cwd=submoduleDir)
+    # Commit a day later, since the qualifier has a resolution of seconds.
+    date = '@{} +0000'.format(int(time.time()) + 24 * 60 * 60)
+    subprocess.check_call(['git', 'commit', '-q', '-m', 'Change'], cwd=submoduleDir,
+      env=dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date))
+    self.assertEqual(self.__skipped_steps(builder, 'all'),
+      [stepId for stepId in self.__steps('all') if stepId not in ['eclipse-prereqs', 'eclipse']])
+
+  def test_incremental_smart_clean(self):
+    builder = RelengBuilder(self.repo)
+    builder.incremental = True
+    builder.smartClean = True
+    self.__skipped_steps(builder, 'java')
+    self.assertEqual(self.__skipped_steps(builder, 'java'), self.__steps('java'))
+
+  def __steps(self, target):
+    # The graph of a target includes the target, which is not a step.
+    return sorted(stepId for stepId in RelengBuilder(self.repo).dependency_graph(target) if stepId != 'all')
+
+  @staticmethod
+  def __skipped_steps(builder, target):
+    """
+    Builds given target with given builder, and returns the identifiers of the skipped steps.
+    """
+    output = io.TextIOWrapper(io.BytesIO(), write_through=True)
+    with redirect_stdout(output):
+      builder.build(target)
+    return sorted(re.findall(r'^Skipping build step (\S+):', output.buffer.getvalue().decode('utf-8'), re.MULTILINE))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,391 @@
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from metaborg.releng.deploy import (
+  BintrayMetadata, MetaborgBintrayDeployer, MetaborgFileArtifact, MetaborgMavenDeployer, MetaborgNexusDeployer,
+  MetaborgUpdateSiteDeployer, NexusMetadata
+)
+
+_versionMetadata = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata modelVersion="1.1.0">
+  <groupId>org.metaborg</groupId>
+  <artifactId>{artifactId}</artifactId>
+  <version>1.0.0-SNAPSHOT</version>
+  <versioning>
+    <snapshot>
+      <timestamp>20200101.000000</timestamp>
+      <buildNumber>1</buildNumber>
+    </snapshot>
+    <lastUpdated>20200101000000</lastUpdated>
+    <snapshotVersions>
+      <snapshotVersion>
+        <extension>jar</extension>
+        <value>1.0.0-20200101.000000-1</value>
+        <updated>20200101000000</updated>
+      </snapshotVersion>
+    </snapshotVersions>
+  </versioning>
+</metadata>
+'''
+_artifactMetadata = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata>
+  <groupId>org.metaborg</groupId>
+  <artifactId>{artifactId}</artifactId>
+  <versioning>
+    <latest>1.0.0-SNAPSHOT</latest>
+    <versions>
+      <version>1.0.0-SNAPSHOT</version>
+    </versions>
+    <lastUpdated>20200101000000</lastUpdated>
+  </versioning>
+</metadata>
+'''
+_settings = '''<settings>
+  <servers>
+    <server>
+      <id>metaborg-nexus</id>
+      <username>user</username>
+      <password>password</password>
+    </server>
+  </servers>
+</settings>
+'''
+
+_siteArtifacts = '''<?xml version='1.0' encoding='UTF-8'?>
+<repository name='Spoofax' type='org.eclipse.equinox.p2.artifact.repository.simpleRepository' version='1'>
+  <mappings size='2'>
+    <rule filter='(&amp; (classifier=osgi.bundle))' output='${{repoUrl}}/plugins/${{id}}_${{version}}.jar'/>
+    <rule filter='(&amp; (classifier=org.eclipse.update.feature))'
+      output='${{repoUrl}}/features/${{id}}_${{version}}.jar'/>
+  </mappings>
+  <artifacts size='{size}'>{artifacts}</artifacts>
+</repository>
+'''
+_siteArtifact = '''
+    <artifact classifier='{classifier}' id='{id}' version='1.0.0'>
+      <properties size='1'>
+        <property name='download.checksum.sha-256' value='{sha256}'/>
+      </properties>
+    </artifact>'''
+
+# Size of large artifacts, which must be streamed instead of being read into memory.
+_largeSize = 32 * 1024 * 1024
+_maxMemory = 8 * 1024 * 1024
+
+
+class StandInServer(object):
+  """
+  Stand-in HTTP server on a free local port, that stores the bodies of PUT and POST requests in a directory instead of
+  in memory, serves the last body PUT to a path on GET, and records all requests in order.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    # List of (method, path, query, headers, body location or None) tuples.
+    self.requests = []
+    # Dictionary from path to (status, content) response to GET requests, which takes precedence over PUT bodies.
+    self.responses = {}
+    # Dictionary from (method, path) to the number of times to fail that request with status 500 before accepting it.
+    self.failures = {}
+    self.__files = {}
+    self.__bodies = 0
+    self.__lock = threading.Lock()
+    standIn = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        standIn.handle(self)
+
+      def do_PUT(self):
+        standIn.handle(self)
+
+      def do_POST(self):
+        standIn.handle(self)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def uploads(self):
+    """
+    Returns the paths of accepted PUT and POST requests in order.
+    """
+    return [path for method, path, _, _, body in self.requests if method != 'GET' and body]
+
+  def body(self, path):
+    """
+    Returns the content of the last accepted PUT or POST request to given path.
+    """
+    location = [body for method, requestPath, _, _, body in self.requests if requestPath == path and body][-1]
+    with open(location, 'rb') as file:
+      return file.read()
+
+  def handle(self, handler):
+    url = urlsplit(handler.path)
+    path = url.path.lstrip('/')
+    length = int(handler.headers.get('Content-Length', 0))
+    with self.__lock:
+      location = os.path.join(self.directory, str(self.__bodies))
+      self.__bodies += 1
+      failures = self.failures.get((handler.command, path), 0)
+      if failures:
+        self.failures[(handler.command, path)] = failures - 1
+    if length:
+      with open(location, 'wb') as file:
+        while length:
+          chunk = handler.rfile.read(min(length, 64 * 1024))
+          file.write(chunk)
+          length -= len(chunk)
+    accepted = handler.command != 'GET' and not failures
+    with self.__lock:
+      self.requests.append((handler.command, path, dict(parse_qsl(url.query)), dict(handler.headers),
+        location if accepted else None))
+      if accepted and handler.command == 'PUT':
+        self.__files[path] = location
+
+    if failures:
+      self.__respond(handler, 500, b'Stand-in failure')
+    elif handler.command != 'GET':
+      self.__respond(handler, 201, b'')
+    elif path in self.responses:
+      self.__respond(handler, *self.responses[path])
+    elif path in self.__files:
+      with open(self.__files[path], 'rb') as file:
+        self.__respond(handler, 200, file.read())
+    else:
+      self.__respond(handler, 404, b'Not found')
+
+  @staticmethod
+  def __respond(handler, status, content):
+    handler.send_response(status)
+    handler.send_header('Content-Length', str(len(content)))
+    handler.end_headers()
+    handler.wfile.write(content)
+
+
+def peak_memory(function):
+  """
+  Calls given function, and returns the peak size of memory that Python allocated during the call.
+  """
+  tracemalloc.start()
+  try:
+    function()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def multipart_fields(content, contentType):
+  """
+  Returns a dictionary from name to value of the fields of given multipart form data, and the name and content of its
+  file.
+  """
+  boundary = contentType.split('boundary=')[1].encode('utf-8')
+  fields = {}
+  upload = None
+  for part in content.split(b'--' + boundary)[1:-1]:
+    headers, value = part[2:-2].split(b'\r\n\r\n', 1)
+    disposition = headers.split(b'\r\n')[0].decode('utf-8')
+    name = disposition.split('name="')[1].split('"')[0]
+    if 'filename="' in disposition:
+      upload = (disposition.split('filename="')[1].split('"')[0], value)
+    else:
+      fields[name] = value.decode('utf-8')
+  return fields, upload
+
+
+class DeployTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(self.directory, 'server'))
+    self.server = StandInServer(os.path.join(self.directory, 'server'))
+
+  def tearDown(self):
+    self.server.close()
+    shutil.rmtree(self.directory)
+
+  @staticmethod
+  def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+      file.write(content)
+
+  def large_file(self, name):
+    path = os.path.join(self.directory, name)
+    with open(path, 'wb') as file:
+      for _ in range(_largeSize // (1024 * 1024)):
+        file.write(os.urandom(1024 * 1024))
+    return path
+
+  def test_maven_deploy(self):
+    repositoryDir = os.path.join(self.directory, '.local-deploy-repository')
+    artifacts = []
+    for artifactId in ['org.metaborg.core', 'org.metaborg.util']:
+      artifactDir = os.path.join(repositoryDir, 'org', 'metaborg', artifactId)
+      versionDir = os.path.join(artifactDir, '1.0.0-SNAPSHOT')
+      for extension in ['jar', 'pom']:
+        fileName = '{}-1.0.0-20200101.000000-1.{}'.format(artifactId, extension)
+        content = os.urandom(1000)
+        self.write(os.path.join(versionDir, fileName), content)
+        self.write(os.path.join(versionDir, fileName + '.sha1'), hashlib.sha1(content).hexdigest().encode())
+        artifacts.extend(['repo/org/metaborg/{}/1.0.0-SNAPSHOT/{}{}'.format(artifactId, fileName, checksum) for checksum
+          in ['', '.sha1']])
+      for directory, metadata in [(versionDir, _versionMetadata), (artifactDir, _artifactMetadata)]:
+        self.write(os.path.join(directory, 'maven-metadata.xml'), metadata.format(artifactId=artifactId).encode())
+    settingsFile = os.path.join(self.directory, 'settings.xml')
+    self.write(settingsFile, _settings.encode())
+
+    deployer = MetaborgMavenDeployer(self.directory, 'metaborg-nexus', '{}/repo'.format(self.server.url))
+    deployer.settingsFiles = [settingsFile]
+    # The first upload of a JAR fails with a server error, which is retried.
+    failingPath = artifacts[0]
+    self.server.failures[('PUT', failingPath)] = 1
+    deployer.maven_remote_deploy()
+
+    uploads = self.server.uploads()
+    self.assertEqual(sorted(uploads[:len(artifacts)]), sorted(artifacts))
+    # Metadata is uploaded after all artifacts, metadata of versions before metadata of artifacts.
+    metadata = uploads[len(artifacts):]
+    self.assertEqual([path.count('/') for path in metadata], [5, 5, 4, 4])
+    self.assertTrue(all(path.endswith('maven-metadata.xml') for path in metadata))
+    self.assertEqual([body is not None for method, path, _, _, body in self.server.requests if method == 'PUT' and
+      path == failingPath], [False, True])
+    self.assertTrue(all(headers['Authorization'].startswith('Basic ') for method, _, _, headers, _ in
+      self.server.requests if method == 'PUT'))
+    with open(os.path.join(repositoryDir, *failingPath.split('/')[1:]), 'rb') as file:
+      self.assertEqual(self.server.body(failingPath), file.read())
+
+    # Files whose SHA-1 on the server matches, and metadata that the server has, are not uploaded again.
+    deployer.maven_remote_deploy()
+    self.assertEqual(self.server.uploads(), uploads)
+
+  def test_update_site_deploy(self):
+    siteDir = os.path.join(self.directory, 'site')
+    publishDir = os.path.join(self.directory, 'published')
+    bundles = {'plugins/org.metaborg.core_1.0.0.jar': b'core', 'plugins/org.metaborg.spoofax.eclipse_1.0.0.jar':
+      b'eclipse', 'features/org.metaborg.spoofax.eclipse.feature_1.0.0.jar': b'feature'}
+    metadata = ['artifacts.jar', 'artifacts.xml.xz', 'content.jar', 'content.xml.xz', 'p2.index']
+    self.write_site(siteDir, bundles)
+    uploads = self.publish(siteDir, publishDir)
+    self.assertEqual(sorted(uploads[:len(bundles)]), sorted(bundles))
+    self.assertEqual(uploads[len(bundles):], metadata)
+
+    # Publishing a site where one bundle changed only uploads that bundle, followed by the metadata.
+    bundles['plugins/org.metaborg.spoofax.eclipse_1.0.0.jar'] = b'changed'
+    self.write_site(siteDir, bundles)
+    self.assertEqual(self.publish(siteDir, publishDir), ['plugins/org.metaborg.spoofax.eclipse_1.0.0.jar'] + metadata)
+
+    for path, content in bundles.items():
+      with open(os.path.join(publishDir, *path.split('/')), 'rb') as file:
+        self.assertEqual(file.read(), content)
+    for name in ['artifacts', 'content']:
+      with zipfile.ZipFile(os.path.join(siteDir, '{}.jar'.format(name))) as jar:
+        expected = jar.read('{}.xml'.format(name))
+      with open(os.path.join(publishDir, '{}.xml.xz'.format(name)), 'rb') as file:
+        self.assertEqual(lzma.decompress(file.read()), expected)
+
+  @staticmethod
+  def publish(siteDir, publishDir):
+    """
+    Publishes the update site in given directory to a local directory, and returns the remote paths of the uploaded
+    files in order.
+    """
+    deployer = MetaborgUpdateSiteDeployer(publishDir)
+    uploads = []
+    uploader = deployer.uploader
+    upload_file, upload_bytes = uploader.upload_file, uploader.upload_bytes
+    uploader.upload_file = lambda localPath, remotePath: (uploads.append(remotePath), upload_file(localPath,
+      remotePath))
+    uploader.upload_bytes = lambda content, remotePath: (uploads.append(remotePath), upload_bytes(content, remotePath))
+    deployer.site_remote_deploy(siteDir)
+    return uploads
+
+  def write_site(self, siteDir, bundles):
+    artifacts = ''
+    for path, content in sorted(bundles.items()):
+      self.write(os.path.join(siteDir, *path.split('/')), content)
+      classifier = 'osgi.bundle' if path.startswith('plugins/') else 'org.eclipse.update.feature'
+      artifacts += _siteArtifact.format(classifier=classifier, id=os.path.basename(path).split('_')[0],
+        sha256=hashlib.sha256(content).hexdigest())
+    contentXml = "<?xml version='1.0' encoding='UTF-8'?>\n<repository name='Spoofax'><units size='0'/></repository>\n"
+    for name, xml in [('artifacts', _siteArtifacts.format(size=len(bundles), artifacts=artifacts)),
+        ('content', contentXml)]:
+      jar = io.BytesIO()
+      with zipfile.ZipFile(jar, 'w') as archive:
+        archive.writestr('{}.xml'.format(name), xml)
+      self.write(os.path.join(siteDir, '{}.jar'.format(name)), jar.getvalue())
+
+  def test_nexus_deploy(self):
+    path = self.large_file('spoofax-linux-x64.tar.gz')
+    artifact = MetaborgFileArtifact('Spoofax Eclipse instance', path, 'spoofax/eclipse/spoofax-linux-x64.tar.gz',
+      NexusMetadata('org.metaborg', 'org.metaborg.spoofax.eclipse.dist', 'tar.gz', 'linux-x64'))
+    deployer = MetaborgNexusDeployer(self.server.url, 'releases', '2.0.0', 'user', 'password')
+    self.assertLess(peak_memory(lambda: deployer.artifacts_remote_deploy([artifact])), _maxMemory)
+
+    uploadPath = 'service/local/artifact/maven/content'
+    self.assertEqual(self.server.uploads(), [uploadPath])
+    headers = [headers for method, requestPath, _, headers, _ in self.server.requests if requestPath == uploadPath][0]
+    self.assertTrue(headers['Authorization'].startswith('Basic '))
+    fields, upload = multipart_fields(self.server.body(uploadPath), headers['Content-Type'])
+    self.assertEqual(fields, {'r': 'releases', 'g': 'org.metaborg', 'a': 'org.metaborg.spoofax.eclipse.dist',
+      'v': '2.0.0', 'p': 'tar.gz', 'c': 'linux-x64', 'hasPom': 'false', 'e': 'tar.gz'})
+    with open(path, 'rb') as file:
+      self.assertEqual(upload, ('spoofax-linux-x64.tar.gz', file.read()))
+
+    # Nexus has the artifact with the same SHA-1 now, deploying again does not upload it again.
+    with open(path, 'rb') as file:
+      sha1 = hashlib.sha1(file.read()).hexdigest()
+    self.server.responses['service/local/artifact/maven/resolve'] = (200, '<artifact-resolution><data><sha1>{}</sha1>'
+      '</data></artifact-resolution>'.format(sha1).encode('utf-8'))
+    deployer.artifacts_remote_deploy([artifact])
+    self.assertEqual(self.server.uploads(), [uploadPath])
+    resolve = [query for method, requestPath, query, _, _ in self.server.requests if requestPath.endswith('resolve')]
+    self.assertEqual(resolve[-1], {'r': 'releases', 'g': 'org.metaborg', 'a': 'org.metaborg.spoofax.eclipse.dist',
+      'v': '2.0.0', 'p': 'tar.gz', 'c': 'linux-x64'})
+
+  def test_bintray_deploy(self):
+    path = self.large_file('plugin.zip')
+    artifact = MetaborgFileArtifact('Spoofax for IntelliJ IDEA plugin', path, 'spoofax/intellij/plugin.zip',
+      bintrayMetadata=BintrayMetadata('spoofax-intellij-updatesite'))
+    deployer = MetaborgBintrayDeployer('metaborg', 'spoofax', '2.0.0', 'user', 'key', url=self.server.url)
+    self.assertLess(peak_memory(lambda: deployer.artifacts_remote_deploy([artifact])), _maxMemory)
+
+    uploadPath = 'content/metaborg/spoofax/spoofax-intellij-updatesite/2.0.0/spoofax/intellij/plugin.zip'
+    self.assertEqual(self.server.uploads(), [uploadPath])
+    with open(path, 'rb') as file:
+      content = file.read()
+    _, _, query, headers, _ = [request for request in self.server.requests if request[1] == uploadPath][0]
+    self.assertEqual(query, {'publish': '1'})
+    self.assertEqual(headers['X-Checksum-Sha2'], hashlib.sha256(content).hexdigest())
+    self.assertEqual(self.server.body(uploadPath), content)
+
+    # Bintray lists the file with the same SHA-256 now, deploying again does not upload it again.
+    self.server.responses['packages/metaborg/spoofax/spoofax-intellij-updatesite/versions/2.0.0/files'] = (200,
+      json.dumps([{'path': 'spoofax/intellij/plugin.zip', 'sha256': hashlib.sha256(content).hexdigest()}]).encode())
+    deployer = MetaborgBintrayDeployer('metaborg', 'spoofax', '2.0.0', 'user', 'key', url=self.server.url)
+    deployer.artifacts_remote_deploy([artifact])
+    self.assertEqual(self.server.uploads(), [uploadPath])
+
+
+if __name__ == '__main__':
+  unittest.main()
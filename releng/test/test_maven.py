@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from metaborg.releng.benchmark import _environment
+from metaborg.releng.maven import MetaborgMaven
+
+_recordingStandIn = '''#!{python}
+import json
+import sys
+
+with open({argsFile!r}, 'w') as file:
+  json.dump(sys.argv[1:], file)
+print('[INFO] BUILD SUCCESS')
+'''
+
+
+class MavenTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    # The executable is in a directory with a space, since mavenpy does not quote it.
+    self.binDir = os.path.join(self.directory, 'maven bin')
+    self.argsFile = os.path.join(self.directory, 'args.json')
+    self.projectDir = os.path.join(self.directory, 'project')
+    os.makedirs(self.binDir)
+    os.makedirs(self.projectDir)
+
+  def test_daemon_without_mvn(self):
+    self.__install('mvnd')
+    maven = MetaborgMaven()
+    maven.daemon = True
+    maven.daemonStorage = os.path.join(self.directory, '.mvnd')
+    maven.targets = ['clean', 'install']
+    with _environment({'PATH': self.binDir}):
+      maven.run_in_dir(self.projectDir)
+    self.assertEqual(self.__args(),
+      ['-Dmvnd.daemonStorage={}'.format(maven.daemonStorage), '--threads', '1', 'clean', 'install'])
+
+  def test_run(self):
+    self.__install('mvn')
+    maven = MetaborgMaven()
+    maven.threads = '2'
+    maven.targets = ['install']
+    with _environment({'PATH': self.binDir}):
+      maven.run_in_dir(self.projectDir, skipTests='true')
+    self.assertEqual(self.__args(), ['--threads', '2', '-DskipTests=true', 'install'])
+
+  def __install(self, name):
+    location = os.path.join(self.binDir, name)
+    with open(location, 'w') as file:
+      file.write(_recordingStandIn.format(python=sys.executable, argsFile=self.argsFile))
+    os.chmod(location, os.stat(location).st_mode | stat.S_IXUSR)
+
+  def __args(self):
+    with open(self.argsFile) as file:
+      return json.load(file)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from metaborg.releng.p2mirror import _closure, _read_repositories
+from metaborg.util.p2 import InstallableUnit, Requirement, in_range, parse_version
+
+
+def _unit(unitId, version, provides=(), requires=''):
+  provided = ''.join("<provided namespace='{}' name='{}' version='{}'/>".format(*capability) for capability in
+    (('org.eclipse.equinox.p2.iu', unitId, version),) + tuple(provides))
+  return ("<unit id='{}' version='{}'><provides>{}</provides><requires>{}</requires></unit>"
+    .format(unitId, version, provided, requires))
+
+
+def _units(*xmls):
+  units = [InstallableUnit(ET.fromstring(xml)) for xml in xmls]
+  return {unit.key: unit for unit in units}
+
+
+def _requirement(xml):
+  return Requirement(ET.fromstring(xml))
+
+
+class VersionTest(unittest.TestCase):
+  def test_parse_version(self):
+    self.assertEqual(parse_version('1.2.3.v20170101'), (1, 2, 3, 'v20170101'))
+    self.assertEqual(parse_version('1.2'), (1, 2, 0, ''))
+    self.assertEqual(parse_version('1.2.0'), parse_version('1.2'))
+    self.assertLess(parse_version('1.2.3'), parse_version('1.2.3.qualifier'))
+    self.assertLess(parse_version('1.2.3.v20170101'), parse_version('1.2.3.v20170102'))
+    self.assertLess(parse_version('1.9.0'), parse_version('1.10.0'))
+    self.assertGreater(parse_version('raw:1.2'), parse_version('99.0.0'))
+
+  def test_in_range_bounds(self):
+    self.assertTrue(in_range('1.0.0', '[1.0.0,2.0.0)'))
+    self.assertTrue(in_range('1.9.9.v2017', '[1.0.0,2.0.0)'))
+    self.assertFalse(in_range('2.0.0', '[1.0.0,2.0.0)'))
+    self.assertTrue(in_range('2.0.0', '[1.0.0,2.0.0]'))
+    self.assertFalse(in_range('1.0.0', '(1.0.0,2.0.0]'))
+    self.assertTrue(in_range('1.0.0.v1', '(1.0.0,2.0.0]'))
+    self.assertFalse(in_range('0.9.0', '[1.0.0,2.0.0)'))
+    self.assertTrue(in_range('3.1.0.qualifier', '[3.1.0.qualifier,3.1.0.qualifier]'))
+    self.assertFalse(in_range('3.1.0.other', '[3.1.0.qualifier,3.1.0.qualifier]'))
+
+  def test_in_range_minimum(self):
+    self.assertTrue(in_range('1.0.0', '0.0.0'))
+    self.assertTrue(in_range('1.2.0', '1.2'))
+    self.assertFalse(in_range('1.1.9', '1.2'))
+
+  def test_in_range_raw(self):
+    self.assertTrue(in_range('1.0.0', 'raw:[1.0,2.0)'))
+
+
+class RequirementTest(unittest.TestCase):
+  def test_name_requirement(self):
+    requirement = _requirement("<required namespace='osgi.bundle' name='a' range='[1.0.0,2.0.0)' greedy='false'/>")
+    self.assertTrue(requirement.supported)
+    self.assertFalse(requirement.greedy)
+    self.assertFalse(requirement.optional)
+    self.assertEqual((requirement.namespace, requirement.name, requirement.range),
+      ('osgi.bundle', 'a', '[1.0.0,2.0.0)'))
+
+  def test_parameterized_match_requirement(self):
+    requirement = _requirement("<required match='providedCapabilities.exists(x | x.name == $0 &amp;&amp; "
+      "x.namespace == $1 &amp;&amp; x.version ~= $2)' matchParameters=\"['a', 'osgi.bundle', range('[1.0,2.0)')]\" "
+      "min='0' max='1'/>")
+    self.assertTrue(requirement.supported)
+    self.assertTrue(requirement.optional)
+    self.assertEqual((requirement.namespace, requirement.name, requirement.range), ('osgi.bundle', 'a', '[1.0,2.0)'))
+
+  def test_filter_match_requirement(self):
+    requirement = _requirement("<required match=\"providedCapabilities.exists(pc | pc.namespace == 'osgi.ee' "
+      "&amp;&amp; pc.attributes ~= filter('(&amp;(osgi.ee=JavaSE)(version&gt;=1.8))'))\"/>")
+    self.assertTrue(requirement.supported)
+    java8 = InstallableUnit(ET.fromstring(_unit('a.jre', '1.8.0', [('osgi.ee', 'JavaSE', '1.8.0')]))).provides[1]
+    java7 = InstallableUnit(ET.fromstring(_unit('a.jre', '1.7.0', [('osgi.ee', 'JavaSE', '1.7.0')]))).provides[1]
+    self.assertTrue(requirement.matches(java8))
+    self.assertFalse(requirement.matches(java7))
+
+  def test_unsupported_match_requirement(self):
+    requirement = _requirement("<required match='providedCapabilities.exists(x | x.properties[$0] == $1)' "
+      "matchParameters=\"['a', 'b']\"/>")
+    self.assertFalse(requirement.supported)
+
+
+class ClosureTest(unittest.TestCase):
+  def test_follows_all_requirements(self):
+    units = _units(
+      _unit('root', '1.0.0', requires=
+        "<required namespace='org.eclipse.equinox.p2.iu' name='a' range='[1.0.0,2.0.0)'/>"
+        "<required namespace='org.eclipse.equinox.p2.iu' name='b' range='0.0.0' greedy='false'/>"
+        "<required namespace='org.eclipse.equinox.p2.iu' name='c' range='0.0.0' optional='true' greedy='false'/>"
+        "<required match='providedCapabilities.exists(x | x.name == $0 &amp;&amp; x.namespace == $1)' "
+        "matchParameters=\"['d', 'org.eclipse.equinox.p2.iu']\"/>"),
+      _unit('a', '1.0.0'), _unit('a', '1.5.0'), _unit('a', '2.0.0'),
+      _unit('b', '1.0.0'), _unit('c', '1.0.0'), _unit('d', '1.0.0'))
+    self.assertEqual(_closure(units, ['root']), {'root 1.0.0', 'a 1.5.0', 'b 1.0.0', 'd 1.0.0'})
+
+  def test_includes_all_providers(self):
+    units = _units(
+      _unit('root', '1.0.0', requires="<required namespace='java.package' name='p' range='[1.0.0,2.0.0)'/>"),
+      _unit('x', '1.0.0', [('java.package', 'p', '1.0.0')]), _unit('x', '1.1.0', [('java.package', 'p', '1.1.0')]),
+      _unit('y', '1.0.0', [('java.package', 'p', '1.2.0')]), _unit('z', '1.0.0', [('java.package', 'p', '2.0.0')]))
+    self.assertEqual(_closure(units, ['root']), {'root 1.0.0', 'x 1.1.0', 'y 1.0.0'})
+
+  def test_fails_on_unsupported_requirement(self):
+    units = _units(_unit('root', '1.0.0', requires="<required match='providedCapabilities.exists(x | x.properties[$0] "
+      "== $1)' matchParameters=\"['a', 'b']\"/>"))
+    with self.assertRaises(RuntimeError):
+      _closure(units, ['root'])
+
+  def test_fails_on_missing_unit(self):
+    with self.assertRaises(RuntimeError):
+      _closure(_units(_unit('root', '1.0.0')), ['other'])
+
+
+class CompositeTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_resolves_children(self):
+    # Composite with a relative child, and an absolute child that is itself a composite with a relative child.
+    self.__write_composite(self.directory, ['relative', os.path.join(self.directory, 'nested')])
+    self.__write_repository(os.path.join(self.directory, 'relative'), 'a')
+    self.__write_composite(os.path.join(self.directory, 'nested'), ['child'])
+    self.__write_repository(os.path.join(self.directory, 'nested', 'child'), 'b')
+
+    repositories = {unit.id: url for unit, _, url in _read_repositories(self.directory + '/')}
+    self.assertEqual(repositories, {'a': os.path.join(self.directory, 'relative'),
+      'b': os.path.join(self.directory, 'nested', 'child')})
+
+  def test_fails_on_missing_child(self):
+    self.__write_composite(self.directory, ['missing'])
+    with self.assertRaises(RuntimeError):
+      list(_read_repositories(self.directory))
+
+  @staticmethod
+  def __write_composite(directory, children):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'compositeContent.xml'), 'w') as file:
+      file.write("<repository><children>{}</children></repository>".format(
+        ''.join("<child location='{}'/>".format(child) for child in children)))
+
+  @staticmethod
+  def __write_repository(directory, unitId):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'content.xml'), 'w') as file:
+      file.write('<repository><units>{}</units></repository>'.format(_unit(unitId, '1.0.0')))
+
+
+if __name__ == '__main__':
+  unittest.main()